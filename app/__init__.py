@@ -6,6 +6,8 @@ from psycopg_pool import ConnectionPool
 from authlib.integrations.flask_client import OAuth
 from flask_cors import CORS
 import uuid
+import atexit
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Load .env as early as possible so extensions init can read env vars
 ENV_FILE = find_dotenv()
@@ -21,6 +23,8 @@ from datetime import timedelta
 # from app.logger import init_app
 # from app.config import Config
 
+WARM_UP_TIMEOUT = 10 # Seconds
+
 def create_app():
     app = Flask(__name__)    
     is_prod = env.get('ENV') == 'production'
@@ -35,11 +39,13 @@ def create_app():
         app,
         resources={r"/*": {"origins": [env.get('FRONTEND_URL')]}},
         supports_credentials=True,  
+        expose_headers=["ETag"],
     )
 
     init_app(app)
     socketio.init_app(app)
-    from app.sockets import socket
+    from app.sockets import socket, presence
+    presence.start_refresher()
 
     # Connect blueprints 
     from app.routes.auth import auth_bp
@@ -98,11 +104,29 @@ def create_app():
         server_metadata_url=f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration'
     )
     jwt.init_app(app)
+    # connect=False defers the Mongo connection to the first query
     connect(
         host=env.get("MONGO_URI"),
-        uuidRepresentation="standard"
+        uuidRepresentation="standard",
+        connect=False,
     )
 
+    @app.cli.command("backfill-messages")
+    def backfill_messages():
+        from app.services import message_service
+        moved = message_service.backfill_messages()
+        app.logger.info("backfill-messages moved=%s", moved)
+
+    @app.cli.command("check-indexes")
+    def check_indexes():
+        from app.index_check import check_indexes
+        failures = check_indexes()
+        for name, stages in failures.items():
+            app.logger.error("check-indexes collection scan query=%s stages=%s", name, stages)
+        if failures:
+            raise SystemExit(1)
+        app.logger.info("check-indexes OK")
+
     def make_pg_dsn():
         host = env.get("PGHOST")
         port = env.get("PGPORT", "5432")
@@ -120,13 +144,37 @@ def create_app():
         timeout=10,          
     )
 
-    try:
-        with app.pg_pool.connection(timeout=5) as conn:
-            with conn.cursor() as cur:
-                cur.execute("select 1")
-                cur.fetchone()
-        app.logger.info("DB pool warm-up OK")
-    except Exception:
-        app.logger.exception("DB pool warm-up FAILED")
+    def warm_pg_pool():
+        try:
+            with app.pg_pool.connection(timeout=5) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("select 1")
+                    cur.fetchone()
+            app.logger.info("DB pool warm-up OK")
+        except Exception:
+            app.logger.exception("DB pool warm-up FAILED")
+
+    def warm_jwks():
+        try:
+            app.auth0_validator.jwks.keys()
+        except Exception:
+            app.logger.exception("JWKS warm-up FAILED")
+
+    # Warm-ups run side by side, startup waits for the slowest instead of their sum
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="warm-up")
+    _, pending = wait([executor.submit(warm_pg_pool), executor.submit(warm_jwks)], timeout=WARM_UP_TIMEOUT)
+    executor.shutdown(wait=False)
+    if pending:
+        app.logger.warning("warm-up still running after %ss, continuing", WARM_UP_TIMEOUT)
+
+    from app.services.audit_service import AuditWriter
+    app.audit_writer = AuditWriter(app.pg_pool)
+    app.audit_writer.start()
+    atexit.register(app.audit_writer.stop)
+
+    from app.services.message_service import MessageWriter
+    app.message_writer = MessageWriter(app)
+    app.message_writer.start()
+    atexit.register(app.message_writer.stop)
 
     return app
@@ -76,3 +76,25 @@ class Action(Enum):
     UPDATE = 'update'
     DELETE = 'DELETE'
 
+
+# Chat
+RECENT_MESSAGES_LIMIT = 50
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# Voting
+MAX_BULK_VOTES = 100
+
+# Plan listings
+PLAN_PAGE_SIZE = 20
+MAX_PLAN_PAGE_SIZE = 100
+MAX_PLAN_STREAM_SIZE = 1000 # ?stream=true responses are written incrementally, so they can be larger
+PLAN_STREAM_CHUNK_SIZE = 50
+PLAN_SUMMARY_FIELDS = (
+    'name', 'description', 'type', 'status', 'is_public', 'organizer', 'deadline', 'costs',
+    'created_at', 'start_day', 'end_day', 'country', 'state', 'city', 'image', 'stock_image'
+)
+
+# Plan change feed
+CHANGE_LOG_TTL = 7 * 24 * 3600 # Seconds a change record is kept, older clients get a snapshot
+MAX_PLAN_CHANGES = 200 # Clients further behind get a snapshot instead
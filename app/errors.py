@@ -21,6 +21,10 @@ class Forbidden(AppError):
     status_code = 403
     error_code = 'forbidden'
 
+class Conflict(AppError):
+    status_code = 409
+    error_code = 'conflict'
+
 class DatabaseError(AppError):
     status_code = 500
     error_code = 'database_error'
@@ -66,6 +70,13 @@ class PlanNotFound(NotFound):
             details={'plan_id': plan_id}
         )
 
+class PlanConflict(Conflict):
+    def __init__(self, plan_id):
+        super().__init__(
+            message=f'Plan with ID "{plan_id}" was modified by another request, please retry',
+            details={'plan_id': str(plan_id)}
+        )
+
 class NotPlanOrganizer(Forbidden):
     def __init__(self):
         super().__init__(
@@ -1,22 +1,54 @@
 from authlib.integrations.flask_client import OAuth
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
-import redis 
 import os
-import boto3
-from botocore.config import Config
+import threading
 
 
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+
 oauth = OAuth()
 jwt = JWTManager()
 socketio = SocketIO(
     cors_allowed_origins=[os.environ.get('FRONTEND_URL')],
-    async_mode='eventlet'
+    async_mode='eventlet',
+    # Emits fan out through Redis so rooms span every worker, set to "" for a single worker
+    message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE", f"redis://{REDIS_HOST}:6379") or None
+    )
+
+class LazyClient:
+    """
+    Stands in for a client that is only built on first use, so importing this
+    module (and forking a worker) doesn't pay for boto3 or open connections.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+def _redis_client():
+    import redis
+    return redis.Redis(
+        host=REDIS_HOST,
+        port=6379,
+        decode_responses=True,
     )
-cache = redis.Redis(
-    host=os.getenv("REDIS_HOST", "localhost"),
-    port=6379,
-    decode_responses=True,
-)
-aws_region = os.getenv("AWS_REGION_NAME")
-s3 = boto3.client("s3", region_name=aws_region, config=Config(signature_version="s3v4"))
+
+def _s3_client():
+    import boto3
+    from botocore.config import Config
+    aws_region = os.getenv("AWS_REGION_NAME")
+    return boto3.client("s3", region_name=aws_region, config=Config(signature_version="s3v4"))
+
+cache = LazyClient(_redis_client)
+s3 = LazyClient(_s3_client)
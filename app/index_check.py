@@ -0,0 +1,61 @@
+from bson import ObjectId
+from mongoengine.queryset.visitor import Q
+from app.models.plan import Plan
+from app.models.message import Message
+from app.models.invitation import Invitation
+from app.models.image import Image
+from app.models.user import User
+from app.models.plan_change import PlanChange
+from app.logger import get_logger
+
+# Explains the query shapes the service layer sends to Mongo and reports any that
+# would scan a whole collection. Run with `flask check-indexes` against a local
+# mongod after changing a model or a query; keep QUERY_SHAPES in step with the services.
+
+logger = get_logger(__name__)
+
+MODELS = (Plan, Message, Invitation, Image, User, PlanChange)
+
+def _query_shapes():
+    oid = ObjectId()
+    return {
+        'plan_service.get_plan': Plan.objects(id=oid).exclude('messages'),
+        'plan_service.get_plans': Plan.objects(Q(organizer=oid) | Q(participants=oid)).order_by('-created_at', '-id'),
+        'plan_service.get_public_plans': Plan.objects(is_public=True).order_by('-created_at', '-id'),
+        'plan_service.activity_update': Plan.objects(__raw__={'_id': oid, 'activities.activity_id': 'x'}),
+        'message_service.get_messages': Message.objects(plan_id=oid).order_by('-timestamp', '-id'),
+        'invitation_service.valid_invite': Invitation.objects(id=oid),
+        'invitation_service.by_link': Invitation.objects(link='x'),
+        'invitation_service.by_plan': Invitation.objects(plan_id=oid),
+        'image_service.get_image': Image.objects(id=oid),
+        'image_service.by_key': Image.objects(key='x'),
+        'user_service.get_user': User.objects(id=oid),
+        'user_service.get_users': User.objects(id__in=[oid, ObjectId()]),
+        'user_service.bump_mutuals': User.objects(mutuals=oid),
+        'auth.callback': User.objects(auth0_id='x'),
+        'change_log.get_changes': PlanChange.objects(plan_id=oid, seq__gt=1, seq__lte=5).order_by('seq'),
+    }
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+def check_indexes():
+    """Ensure declared indexes exist, then return {query name: stages} for every collection scan."""
+    for model in MODELS:
+        model.ensure_indexes()
+
+    failures = {}
+    for name, queryset in _query_shapes().items():
+        explain = queryset.explain()
+        stages = list(_stages(explain.get('queryPlanner', {}).get('winningPlan', {})))
+        logger.info("check_indexes query=%s stages=%s", name, stages)
+        if 'COLLSCAN' in stages:
+            failures[name] = stages
+    return failures
@@ -1,6 +1,7 @@
 from mongoengine import EmbeddedDocument, EmbeddedDocumentField, StringField, FloatField, DateTimeField, ListField, ReferenceField, BooleanField
 from app.services.user_service import get_users
 import uuid
+from app.schemas import plan_schema
 
 class ActivityCost(EmbeddedDocument):
     is_per_person = BooleanField(default=False)
@@ -24,33 +25,4 @@ class Activity(EmbeddedDocument):
     city = StringField()
 
     def to_dict(self):
-        return {
-            'id': self.activity_id,
-            'name': self.name,
-            'description': self.description,
-            'link': self.link,
-            'cost': {
-                'per_person': self.costs.per_person,
-                'is_per_person': self.costs.is_per_person,
-                'total_cost': self.costs.total_cost
-            },
-            'start_time': self.start_time.isoformat() if self.start_time else None,
-            'end_time': self.end_time.isoformat() if self.end_time else None,
-            'proposer': {
-                'id':  str(self.proposer.id),
-                'name': self.proposer.name
-            },
-            'status': self.status,
-            "votes": [
-                {
-                    "id": str(getattr(v, "id", None)),
-                    "name": getattr(v, "name", None),
-                    "picture": getattr(v, "picture", None)
-                } 
-                for v in self.votes
-            ],
-            "payments": [str(getattr(p, "id", None)) for p in self.payments],
-            'country': self.country,
-            'state': self.state,
-            'city': self.city
-        }
\ No newline at end of file
+        return plan_schema.serialize_activity(self)
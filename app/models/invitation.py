@@ -12,6 +12,14 @@ class Invitation(Document):
     )
     uses = IntField(default=0)
     max_uses = IntField(default=50)
+    version = IntField(default=0) # Bumped on every write, backs the invite ETag
+
+    meta = {
+        "indexes": [
+            {"fields": ["link"], "unique": True},
+            "plan_id",
+        ]
+    }
 
     def to_dict(self):
         return {
@@ -1,15 +1,28 @@
-from mongoengine import EmbeddedDocument, StringField, DateTimeField, ReferenceField
+from mongoengine import Document, EmbeddedDocument, StringField, DateTimeField, ReferenceField
 from datetime import datetime, timezone
 
-class Message(EmbeddedDocument):
+class Message(Document):
+    plan_id = ReferenceField('Plan', required=True)
     sender = ReferenceField('User', required=True) 
     text = StringField(required=True)
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
+    meta = {
+        "indexes": [("plan_id", "timestamp", "id")]
+    }
+
     def to_dict(self):
         return {
+            'id': str(self.id),
             'sender_id': str(getattr(self.sender, 'id', None)), 
             'sender_name': getattr(self.sender, 'name', None), 
             'text': self.text,
             'date': self.timestamp.isoformat()
-        }
\ No newline at end of file
+        }
+
+# Chat used to be embedded in the plan document, kept only so plans that have not
+# been backfilled yet still load (see message_service.backfill_messages)
+class LegacyMessage(EmbeddedDocument):
+    sender = ReferenceField('User', required=True) 
+    text = StringField(required=True)
+    timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
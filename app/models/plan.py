@@ -1,6 +1,7 @@
-from mongoengine import Document, StringField, DateTimeField, FloatField, EmbeddedDocumentField, ListField, EmbeddedDocument, ReferenceField, BooleanField
+from mongoengine import Document, StringField, DateTimeField, FloatField, EmbeddedDocumentField, ListField, EmbeddedDocument, ReferenceField, BooleanField, IntField
 from datetime import datetime
 from app.models import activity, message
+from app.schemas import plan_schema
 
 class PlanCosts(EmbeddedDocument):
     total = FloatField(default=0.0)
@@ -24,7 +25,7 @@ class Plan(Document):
     deadline = DateTimeField()
     costs = EmbeddedDocumentField(PlanCosts, default=PlanCosts)
     activities = ListField(EmbeddedDocumentField('Activity'))
-    messages = ListField(EmbeddedDocumentField('Message'))
+    messages = ListField(EmbeddedDocumentField('LegacyMessage')) # Legacy, chat lives in the message collection
     invitation = ReferenceField('Invitation') 
     created_at = DateTimeField(default=datetime.utcnow)
     start_day = DateTimeField()
@@ -36,61 +37,18 @@ class Plan(Document):
     uploaded_images = ListField(ReferenceField('Image'))
     image = ReferenceField('Image')
     stock_image = StringField()
+    version = IntField(default=0) # Bumped by every write, guards multi-field saves
+    change_seq = IntField(default=0) # Last PlanChange recorded, see change_log
     
     meta = {
-        "indexes": ["organizer"]
+        "indexes": [
+            # Keyset pagination of the dashboard and public listings on (created_at, _id)
+            ("organizer", "created_at", "id"),
+            ("participants", "created_at", "id"),
+            ("is_public", "created_at", "id"),
+            "activities.activity_id",
+        ]
     }
 
     def to_dict(self):
-        return {
-            'id': str(self.id),
-            'name': self.name,
-            'description': self.description,
-            'type': self.type,
-            'status': self.status,
-            'is_public': self.is_public,
-            "organizer": {
-                'id': str(self.organizer.id),
-                'venmo': self.organizer.venmo,
-                'name': self.organizer.name,
-                'picture': self.organizer.picture,
-            },
-            "participants": [
-                {
-                    'id': str(p.id),
-                    'name': p.name,
-                    'picture': p.picture,
-                } 
-                for p in self.participants
-            ],
-            "admins": [
-                {
-                    'id': str(a.id),
-                    'name': a.name,
-                    'picture': a.picture,
-                } 
-                for a in self.admins
-            ],
-            'deadline': self.deadline.isoformat() if self.deadline else None,
-            'costs': {
-                'total': self.costs.total if self.costs else 0.0,
-                'per_person': self.costs.per_person if self.costs else 0.0,
-                'collected': self.costs.collected
-            },
-            'activities': [activity.to_dict() for activity in self.activities],
-            'messages': [message.to_dict() for message in self.messages],
-            'invitation': str(self.invitation.id) if self.invitation else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'start_day': self.start_day.isoformat() if self.start_day else None,
-            'end_day': self.end_day.isoformat() if self.end_day else None,
-            'country': self.country,
-            'state': self.state,
-            'city': self.city,
-            'images': {
-                'primary': {
-                    'id': str(getattr(self.image, 'id', None)),
-                    'key': getattr(self.image, 'key', None)    
-                },
-                'stock': self.stock_image
-            }
-        }
\ No newline at end of file
+        return plan_schema.serialize_plan(self)
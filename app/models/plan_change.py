@@ -0,0 +1,27 @@
+from mongoengine import Document, StringField, DateTimeField, IntField, ObjectIdField, DictField
+from datetime import datetime, timezone
+from app.constants import CHANGE_LOG_TTL
+
+class PlanChange(Document):
+    plan_id = ObjectIdField(required=True)
+    seq = IntField(required=True) # Plan.change_seq after this change
+    op = StringField(required=True)
+    actor_id = StringField()
+    data = DictField() # Parts of the GET /plan/<plan_id> body as they stood at `seq`
+    created_at = DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        "indexes": [
+            {"fields": ["plan_id", "seq"], "unique": True},
+            {"fields": ["created_at"], "expireAfterSeconds": CHANGE_LOG_TTL},
+        ]
+    }
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'op': self.op,
+            'actor_id': self.actor_id,
+            'date': self.created_at.isoformat(),
+            'data': self.data
+        }
@@ -25,6 +25,12 @@ class User(Document):
     notifications = BooleanField() # TODO - Add notifications that are currently provided on frontend
     light_theme = BooleanField()
 
+    version = IntField(default=0) # Bumped on every write, backs the GET /user ETag
+
+    meta = {
+        "indexes": ["mutuals"]
+    }
+
     def to_dict(self):
         return {
             "id": str(self.id),
@@ -1,17 +1,19 @@
-from flask import Blueprint, request, jsonify, url_for, session, redirect, render_template, abort, current_app, g
+from flask import Blueprint, request, jsonify, url_for, session, redirect, render_template, abort, current_app, g, Response, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 import json
+import orjson
 from os import environ as env
 from urllib.parse import quote_plus, urlencode
 from app.models.user import User
 from app.models.plan import Plan
 from app.models.invitation import Invitation
 from app.extensions import oauth
-from app.services import user_service, plan_service, invitation_service, image_service
+from app.services import user_service, plan_service, invitation_service, image_service, message_service, plan_cache, settlement_service, change_log
 from datetime import timedelta
-from app.constants import PLAN_ALLOWED_FIELDS, ACTIVITY_ALLOWED_FIELDS, IMAGE_ALLOWED_FIELDS, S3_STOCK_IMAGE_URLS, AWS_S3_URL
-from app.utils import normalize_args
-from app.errors import Unauthorized, InviteNotFound, InviteExpired
+from app.constants import PLAN_ALLOWED_FIELDS, ACTIVITY_ALLOWED_FIELDS, IMAGE_ALLOWED_FIELDS, S3_STOCK_IMAGE_URLS, AWS_S3_URL, MESSAGE_PAGE_SIZE, PLAN_PAGE_SIZE, MAX_BULK_VOTES, PLAN_STREAM_CHUNK_SIZE
+from app.utils import normalize_args, encode_cursor, not_modified, with_etag
+from app.schemas import plan_schema, plan_doc_schema
+from app.errors import Unauthorized, InviteNotFound, InviteExpired, ValidationError
 
 plan_bp = Blueprint('plan', __name__, url_prefix='/plan')
 
@@ -40,24 +42,101 @@ def get_plan(plan_id):
     if not uid:
         raise Unauthorized
 
-    user = user_service.get_user(uid)
-    plan = plan_service.get_plan(plan_id, user)
-    if plan.image:
-        selected_url = image_service.get_download_url(str(plan.image.key))
-        uploaded_urls = image_service.get_download_urls(str(plan.image.key)) # TODO - Implement
+    user = user_service.get_identity(uid)
+    version, etag = plan_service.get_plan_etag(plan_id, user)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    response = jsonify({'success': True,
+                    'data': _plan_body(plan_id, version),
+                    'msg': 'Plan retreived succesfully'})
+    return with_etag(response, etag), 200
+
+def _plan_body(plan_id, version):
+    plan = plan_cache.get_plan_body(plan_id, version, lambda: plan_doc_schema.serialize_plan_doc(plan_service.get_plan_doc(plan_id)))
+    if plan['images']['primary']['key']:
+        selected_url = image_service.get_download_url(plan['images']['primary']['key'])
+        uploaded_urls = image_service.get_download_urls(plan['images']['primary']['key']) # TODO - Implement
     else:
-        selected_url = f'{AWS_S3_URL}/{plan.stock_image}'
+        selected_url = f"{AWS_S3_URL}/{plan['images']['stock']}"
         uploaded_urls = []
 
+    return {
+        'plan': plan,   
+        'image_urls': {
+            'selected': selected_url,
+            'uploaded': uploaded_urls
+        }
+    }
+
+@plan_bp.route('/<plan_id>/changes', methods=['GET'])
+@jwt_required()
+def get_changes(plan_id):
+    uid = get_jwt_identity()
+    if not uid:
+        raise Unauthorized
+
+    user = user_service.get_identity(uid)
+    since = request.args.get('since', type=int)
+    meta = plan_service.get_plan_meta(plan_id, user, fields=('change_seq',))
+    seq = meta.get('change_seq', 0)
+    changes = change_log.get_changes(meta['_id'], since, seq) if since is not None else None
+
+    # Too far behind (or no since at all): start over from the whole plan at `seq`
+    if changes is None:
+        return jsonify({'success': True,
+                        'data': {
+                            'seq': seq,
+                            'snapshot': _plan_body(plan_id, meta.get('version', 0))
+                        },
+                        'msg': 'Plan snapshot retreived succesfully'}), 200
+
     return jsonify({'success': True,
                     'data': {
-                        'plan': plan.to_dict(),   
-                        'image_urls': {
-                            'selected': selected_url,
-                            'uploaded': uploaded_urls
-                        }
+                        'seq': seq,
+                        'changes': [change.to_dict() for change in changes]
                     },
-                    'msg': 'Plan retreived succesfully'}), 200
+                    'msg': 'Plan changes retreived succesfully'}), 200
+
+def _attach_image_urls(plans):
+    download_urls = image_service.get_download_url_map(
+        plan['images']['primary']['key'] for plan in plans if not plan['images']['stock'])
+    for plan in plans:
+        if plan.get('images').get('stock'):
+            download_url = f"{AWS_S3_URL}/{plan['images']['stock']}"
+        else:
+            download_url = download_urls.get(plan['images']['primary']['key'])
+        plan['image_url'] = download_url
+    return plans
+
+def _wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+def _stream_plan_summaries(plans, limit):
+    """
+    Same body as the buffered listing, written plan by plan while the Mongo cursor
+    is consumed. next_cursor comes last since it is only known at the end.
+    """
+    def generate():
+        yield b'{"success":true,"msg":"Plans retreived succesfully","data":['
+        sent = 0
+        last = None
+        has_more = False
+        for chunk, summaries in plan_schema.iter_plan_summaries(plans, PLAN_STREAM_CHUNK_SIZE):
+            if sent + len(chunk) > limit:
+                has_more = True
+                chunk, summaries = chunk[:limit - sent], summaries[:limit - sent]
+            for summary in _attach_image_urls(summaries):
+                yield (b'' if sent == 0 else b',') + orjson.dumps(summary)
+                sent += 1
+            if chunk:
+                last = chunk[-1]
+            if has_more:
+                break
+        next_cursor = encode_cursor(last.created_at, last.id) if has_more and last else None
+        yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b'}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @plan_bp.route('', methods=['GET'])
 @jwt_required()
@@ -66,19 +145,19 @@ def get_plans():
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
-    plans = plan_service.get_plans(user)
-    plans = [plan.to_dict() for plan in plans]
-    
-    for plan in plans:
-        if plan.get('images').get('stock'):
-            download_url = f"{AWS_S3_URL}/{plan['images']['stock']}"
-        else:
-            download_url = image_service.get_download_url(plan['images']['primary']['key'])
-        plan['image_url'] = download_url
+    user = user_service.get_identity(uid)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', PLAN_PAGE_SIZE, type=int)
+    if _wants_stream():
+        plans, limit = plan_service.stream_plans(user, cursor, limit)
+        return _stream_plan_summaries(plans, limit)
+
+    plans, next_cursor = plan_service.get_plans(user, cursor, limit)
+    plans = _attach_image_urls(plan_schema.serialize_plan_summaries(plans))
 
     return jsonify({'success': True,
                 'data': plans,
+                'next_cursor': next_cursor,
                 'msg': 'Plans retreived succesfully'}), 200
 
 @plan_bp.route('/public', methods=['GET'])
@@ -88,19 +167,19 @@ def get_public_plans():
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
-    plans = plan_service.get_public_plans()
-    plans = [plan.to_dict() for plan in plans]
-    
-    for plan in plans:
-        if plan.get('images').get('stock'):
-            download_url = f"{AWS_S3_URL}/{plan['images']['stock']}"
-        else:
-            download_url = image_service.get_download_url(plan['images']['primary']['key'])
-        plan['image_url'] = download_url
+    user = user_service.get_identity(uid)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', PLAN_PAGE_SIZE, type=int)
+    if _wants_stream():
+        plans, limit = plan_service.stream_public_plans(cursor, limit)
+        return _stream_plan_summaries(plans, limit)
+
+    plans, next_cursor = plan_service.get_public_plans(cursor, limit)
+    plans = _attach_image_urls(plan_schema.serialize_plan_summaries(plans))
 
     return jsonify({'success': True,
                 'data': plans,
+                'next_cursor': next_cursor,
                 'msg': 'Plans retreived succesfully'}), 200
 
 @plan_bp.route('/<plan_id>/update', methods=['PUT'])
@@ -110,7 +189,7 @@ def update_plan(plan_id):
     if not uid:
         raise Unauthorized
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
 
     data = request.get_json()
@@ -135,7 +214,7 @@ def create_activity(plan_id):
         raise Unauthorized 
     current_app.logger.info("create_activity request user_id=%s plan_id=%s", uid, plan_id)
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
     
     data = request.get_json()
@@ -154,7 +233,7 @@ def update_activity(plan_id, activity_id):
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
     data = request.get_json()
     normalize_args(ACTIVITY_ALLOWED_FIELDS, data)
@@ -178,14 +257,43 @@ def vote_activity(plan_id, activity_id):
         activity_id,
     )
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
 
-    plan_service.vote_activity(plan, activity_id, user)
+    plan_service.vote_activity(plan, user, activity_id)
     return jsonify({'success': True,
             'data': plan.to_dict(),
             'msg': 'Activity has been voted for succesfully'}), 200
 
+@plan_bp.route('/<plan_id>/activity/vote', methods=['POST', 'PUT'])
+@jwt_required()
+def bulk_vote(plan_id):
+    uid = get_jwt_identity()
+    if not uid:
+        raise Unauthorized
+
+    # Body: {"votes": [{"activity_id": "...", "action": "add" | "remove"}, ...]}
+    data = request.get_json(silent=True) or {}
+    votes = data.get('votes')
+    if not isinstance(votes, list) or not votes:
+        raise ValidationError("votes must be a non-empty list")
+    if len(votes) > MAX_BULK_VOTES:
+        raise ValidationError(f"At most {MAX_BULK_VOTES} votes per request")
+    intents = []
+    for vote in votes:
+        if not isinstance(vote, dict) or not vote.get('activity_id') or vote.get('action') not in ('add', 'remove'):
+            raise ValidationError("Each vote needs an activity_id and an action of 'add' or 'remove'", details={'vote': vote})
+        intents.append((vote['activity_id'], vote['action'] == 'add'))
+    current_app.logger.info("bulk_vote request user_id=%s plan_id=%s votes=%s", uid, plan_id, len(intents))
+
+    user = user_service.get_identity(uid)
+    plan = plan_service.get_plan(plan_id, user)
+
+    plan_service.bulk_vote(plan, user, intents)
+    return jsonify({'success': True,
+            'data': plan.to_dict(),
+            'msg': 'Votes have been updated succesfully'}), 200
+
 @plan_bp.route('/<plan_id>/activity/<activity_id>/finalize', methods=['PUT'])
 @jwt_required()
 def lock_activity(plan_id, activity_id):
@@ -193,7 +301,7 @@ def lock_activity(plan_id, activity_id):
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
     
     activity = plan_service.lock_activity(plan, activity_id, user)
@@ -202,6 +310,27 @@ def lock_activity(plan_id, activity_id):
             'data': activity.to_dict(),
             'msg': 'Activity has been voted for succesfully'}), 200
 
+@plan_bp.route('/<plan_id>/messages', methods=['GET'])
+@jwt_required()
+def get_messages(plan_id):
+    uid = get_jwt_identity()
+    if not uid:
+        raise Unauthorized 
+
+    user = user_service.get_identity(uid)
+    plan = plan_service.get_plan(plan_id, user)
+
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', MESSAGE_PAGE_SIZE, type=int)
+    messages, next_cursor = message_service.get_messages(plan.id, cursor, limit)
+
+    return jsonify({'success': True,
+        'data': {
+            'messages': [message.to_dict() for message in messages],
+            'next_cursor': next_cursor
+        },
+        'msg': 'Messages retreived succesfully'}), 200
+
 # TODO - Update invitations to use the generated link, must verify uniqueness when generating
 @plan_bp.route('/<plan_id>/invite', methods=['GET'])
 @jwt_required()
@@ -210,16 +339,23 @@ def get_invite(plan_id):
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
+    etag = invitation_service.get_invite_etag(plan_id, user)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+
     plan = plan_service.get_plan(plan_id, user)
     if plan.is_public:
         raise Unauthorized
     invite = invitation_service.get_invite(plan, user)
+    etag = invitation_service.invite_etag(invite.id, invite.version)
     
     invite = invite.to_dict()
-    return jsonify({'success': True,
+    response = jsonify({'success': True,
         'data': invite,
-        'msg': 'Invite has been retreived succesfully'}), 200
+        'msg': 'Invite has been retreived succesfully'})
+    return with_etag(response, etag), 200
 
 @plan_bp.route('/<plan_id>/invite/<invite_id>', methods=['GET'])
 def verify_invite(plan_id, invite_id):
@@ -276,14 +412,15 @@ def remove_participant(plan_id, participant_id):
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
-    plan = plan_service.get_plan(plan_id, user.id)
+    user = user_service.get_identity(uid)
+    plan = plan_service.get_plan(plan_id, user)
+    participant = user_service.get_user(participant_id)
 
     plan_service.remove_participant(plan, user, participant_id)
-    user_service.remove_plan(plan, user)
+    user_service.remove_plan(plan, participant)
     
     return jsonify({'success': True,
-        'data': plan,
+        'data': plan.to_dict(),
         'msg': 'Participant removed succesfully'}), 204
 
 @plan_bp.route('/<plan_id>/lock-toggle', methods=['PUT'])
@@ -293,7 +430,7 @@ def lock_plan(plan_id):
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
     plan_service.lock_plan(plan, user)
 
@@ -309,7 +446,7 @@ def pay(plan_id):
         raise Unauthorized 
     current_app.logger.info("pay request user_id=%s plan_id=%s", uid, plan_id)
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     plan = plan_service.get_plan(plan_id, user)
     plan = plan_service.pay(plan, user)
 
@@ -318,6 +455,20 @@ def pay(plan_id):
         'msg': 'Plan locked succesfully'}), 204
 
 
+@plan_bp.route('/<plan_id>/settlement', methods=['GET'])
+@jwt_required()
+def get_settlement(plan_id):
+    uid = get_jwt_identity()
+    if not uid:
+        raise Unauthorized 
+
+    user = user_service.get_identity(uid)
+    plan = plan_service.get_plan(plan_id, user)
+
+    return jsonify({'success': True,
+        'data': settlement_service.get_settlement(plan),
+        'msg': 'Settlement retrieved succesfully'}), 200
+
 @plan_bp.route('/upload/image', methods=['POST', 'PUT'])
 @jwt_required()
 def upload_image():
@@ -325,7 +476,7 @@ def upload_image():
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
 
     data = request.get_json()
     normalize_args(IMAGE_ALLOWED_FIELDS, data)
@@ -350,7 +501,7 @@ def image_uploaded(image_id):
     if plan_id:
         plan = plan_service.get_plan(plan_id)
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
     image = image_service.get_image(image_id)
     image_service.image_uploaded(image)
     if plan:
@@ -367,7 +518,7 @@ def get_stock_images():
     if not uid:
         raise Unauthorized 
 
-    user = user_service.get_user(uid)
+    user = user_service.get_identity(uid)
    
     return jsonify({'success': True,
         'data': S3_STOCK_IMAGE_URLS,
@@ -410,8 +561,8 @@ def make_participant(plan_id, admin_id):
     if not uid:
         raise Unauthorized 
 
-    organizer = user_service.get_user(uid)
-    admin = user_service.get_user(admin_id)
+    organizer = user_service.get_identity(uid)
+    admin = user_service.get_identity(admin_id)
     plan = plan_service.get_plan(plan_id, organizer)
 
     plan = plan_service.make_participant(plan, organizer, admin)
@@ -440,8 +591,8 @@ def add_admin(plan_id, participant_id):
     if not uid:
         raise Unauthorized 
 
-    organizer = user_service.get_user(uid)
-    participant = user_service.get_user(participant_id)
+    organizer = user_service.get_identity(uid)
+    participant = user_service.get_identity(participant_id)
     plan = plan_service.get_plan(plan_id, organizer)
 
     plan = plan_service.add_admin(plan, organizer, participant)
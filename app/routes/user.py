@@ -8,7 +8,7 @@ from app.extensions import oauth
 from app.services import user_service
 from datetime import timedelta
 from app.errors import Unauthorized
-from app.utils import normalize_args
+from app.utils import normalize_args, not_modified, with_etag
 from app.constants import USER_ALLOWED_FIELDS
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
@@ -37,11 +37,17 @@ def get_user():
     if not uid:
         raise Unauthorized
 
+    etag = user_service.get_user_etag(uid)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+
     user = user_service.get_user(uid)
 
-    return jsonify({'success': True,
+    response = jsonify({'success': True,
                 'data': user.to_dict(),
-                'msg': 'User retreived succesfully'}), 200
+                'msg': 'User retreived succesfully'})
+    return with_etag(response, user_service.user_etag(user.id, user.version)), 200
 
 @user_bp.route('', methods=['PUT'])
 @jwt_required()
@@ -0,0 +1,152 @@
+from app.models.user import User
+from app.models.image import Image
+from app.services import message_service
+from app.schemas.plan_schema import _ref_id, _ref_ids, _fetch, _member, USER_FIELDS, IMAGE_FIELDS
+
+# Renders the same shapes as plan_schema straight from raw BSON documents
+# (as_pymongo / pymongo), for read paths that never need Document objects.
+# Defaults and coercions mirror the model fields, so the output matches
+# Plan.to_dict() exactly; tests/test_plan_doc_schema.py checks that parity.
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _float(value):
+    return float(value) if value is not None else 0.0
+
+def _activity_dict(doc, users):
+    costs = doc.get('costs') or {}
+    return {
+        'id': doc.get('activity_id'),
+        'name': doc.get('name'),
+        'description': doc.get('description'),
+        'link': doc.get('link'),
+        'cost': {
+            'per_person': _float(costs.get('per_person')),
+            'is_per_person': bool(costs.get('is_per_person', False)),
+            'total_cost': _float(costs.get('total_cost'))
+        },
+        'start_time': _iso(doc.get('start_time')),
+        'end_time': _iso(doc.get('end_time')),
+        'proposer': _member(users, _ref_id(doc.get('proposer')), 'name'),
+        'status': doc.get('status', 'proposed'),
+        'votes': [_member(users, v, 'name', 'picture') for v in _ref_ids(doc.get('votes'))],
+        'payments': [str(p) for p in _ref_ids(doc.get('payments'))],
+        'country': doc.get('country'),
+        'state': doc.get('state'),
+        'city': doc.get('city')
+    }
+
+def _message_dict(doc, users):
+    sender_id = _ref_id(doc.get('sender'))
+    return {
+        'id': str(doc['_id']),
+        'sender_id': str(sender_id),
+        'sender_name': users.get(sender_id, {}).get('name'),
+        'text': doc.get('text'),
+        'date': doc['timestamp'].isoformat()
+    }
+
+def _plan_dict(doc, messages, users, images):
+    image_id = _ref_id(doc.get('image'))
+    invitation_id = _ref_id(doc.get('invitation'))
+    costs = doc.get('costs') or {}
+    return {
+        'id': str(doc['_id']),
+        'name': doc.get('name'),
+        'description': doc.get('description'),
+        'type': doc.get('type'),
+        'status': doc.get('status', 'active'),
+        'is_public': bool(doc.get('is_public', False)),
+        'organizer': _member(users, _ref_id(doc.get('organizer')), 'venmo', 'name', 'picture'),
+        'participants': [_member(users, p, 'name', 'picture') for p in _ref_ids(doc.get('participants'))],
+        'admins': [_member(users, a, 'name', 'picture') for a in _ref_ids(doc.get('admins'))],
+        'deadline': _iso(doc.get('deadline')),
+        'costs': {
+            'total': _float(costs.get('total')),
+            'per_person': _float(costs.get('per_person')),
+            'collected': _float(costs.get('collected'))
+        },
+        'activities': [_activity_dict(activity, users) for activity in doc.get('activities') or []],
+        'messages': [_message_dict(message, users) for message in messages],
+        'invitation': str(invitation_id) if invitation_id else None,
+        'created_at': _iso(doc.get('created_at')),
+        'start_day': _iso(doc.get('start_day')),
+        'end_day': _iso(doc.get('end_day')),
+        'country': doc.get('country'),
+        'state': doc.get('state'),
+        'city': doc.get('city'),
+        'images': {
+            'primary': {
+                'id': str(image_id),
+                'key': images.get(image_id, {}).get('key')
+            },
+            'stock': doc.get('stock_image')
+        }
+    }
+
+def serialize_plan_docs(docs):
+    docs = list(docs)
+    messages = {doc['_id']: message_service.get_recent_message_docs(doc['_id']) for doc in docs}
+
+    user_ids, image_ids = set(), set()
+    for doc in docs:
+        user_ids.add(_ref_id(doc.get('organizer')))
+        user_ids.update(_ref_ids(doc.get('participants')))
+        user_ids.update(_ref_ids(doc.get('admins')))
+        for activity in doc.get('activities') or []:
+            user_ids.add(_ref_id(activity.get('proposer')))
+            user_ids.update(_ref_ids(activity.get('votes')))
+        for message in messages[doc['_id']]:
+            user_ids.add(_ref_id(message.get('sender')))
+        image_ids.add(_ref_id(doc.get('image')))
+    users = _fetch(User, user_ids, USER_FIELDS)
+    images = _fetch(Image, image_ids, IMAGE_FIELDS)
+
+    return [_plan_dict(doc, messages[doc['_id']], users, images) for doc in docs]
+
+def serialize_plan_doc(doc):
+    return serialize_plan_docs([doc])[0]
+
+# Sections of the plan body a change can touch, with the stored fields each is rendered from
+PLAN_SECTIONS = {
+    'plan': {
+        'keys': ('name', 'description', 'type', 'status', 'is_public', 'deadline', 'costs', 'invitation',
+                 'start_day', 'end_day', 'country', 'state', 'city', 'images'),
+        'fields': ('name', 'description', 'type', 'status', 'is_public', 'deadline', 'costs', 'invitation',
+                   'start_day', 'end_day', 'country', 'state', 'city', 'image', 'stock_image'),
+    },
+    'members': {
+        'keys': ('organizer', 'participants', 'admins'),
+        'fields': ('organizer', 'participants', 'admins'),
+    },
+    'activities': {
+        'keys': ('activities',),
+        'fields': ('activities',),
+    },
+}
+
+def section_projection(sections):
+    return {field: 1 for section in sections for field in PLAN_SECTIONS[section]['fields']}
+
+def serialize_plan_sections(doc, sections, activity_ids=()):
+    """
+    The `sections` of the plan body rendered from a projection of the stored plan
+    (see section_projection), with only the activities in `activity_ids`.
+    """
+    activities = [a for a in doc.get('activities') or [] if a.get('activity_id') in activity_ids]
+    user_ids, image_ids = set(), set()
+    if 'members' in sections:
+        user_ids.add(_ref_id(doc.get('organizer')))
+        user_ids.update(_ref_ids(doc.get('participants')))
+        user_ids.update(_ref_ids(doc.get('admins')))
+    for activity in activities:
+        user_ids.add(_ref_id(activity.get('proposer')))
+        user_ids.update(_ref_ids(activity.get('votes')))
+    if 'plan' in sections:
+        image_ids.add(_ref_id(doc.get('image')))
+    users = _fetch(User, user_ids, USER_FIELDS)
+    images = _fetch(Image, image_ids, IMAGE_FIELDS)
+
+    body = _plan_dict({**doc, 'activities': activities}, [], users, images)
+    return {key: body[key] for section in sections for key in PLAN_SECTIONS[section]['keys']}
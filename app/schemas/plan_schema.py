@@ -0,0 +1,199 @@
+from bson import DBRef
+from mongoengine import Document
+from app.models.user import User
+from app.models.image import Image
+from app.services import message_service
+
+# Serializes plans without dereferencing references one at a time. Every referenced
+# user/image id is collected up front (across all plans for list views), fetched with
+# a single projected $in query per collection and rendered from that map.
+
+USER_FIELDS = ('name', 'picture', 'venmo')
+IMAGE_FIELDS = ('key',)
+
+def _ref_id(value):
+    if value is None:
+        return None
+    if isinstance(value, DBRef):
+        return value.id
+    if isinstance(value, Document):
+        return value.pk
+    return value
+
+def _ref_ids(values):
+    return [_ref_id(v) for v in values or []]
+
+def _fetch(model, ids, fields):
+    ids = [i for i in set(ids) if i is not None]
+    if not ids:
+        return {}
+    return {doc['_id']: doc for doc in model.objects(id__in=ids).only(*fields).as_pymongo()}
+
+def _collect_activity_refs(activity, user_ids):
+    user_ids.add(_ref_id(activity._data.get('proposer')))
+    user_ids.update(_ref_ids(activity._data.get('votes')))
+
+def _collect_plan_refs(plan, messages, user_ids, image_ids):
+    data = plan._data
+    user_ids.add(_ref_id(data.get('organizer')))
+    user_ids.update(_ref_ids(data.get('participants')))
+    user_ids.update(_ref_ids(data.get('admins')))
+    for activity in data.get('activities') or []:
+        _collect_activity_refs(activity, user_ids)
+    for message in messages:
+        user_ids.add(_ref_id(message._data.get('sender')))
+    image_ids.add(_ref_id(data.get('image')))
+
+def _member(users, uid, *fields):
+    user = users.get(uid, {})
+    member = {'id': str(uid)}
+    for field in fields:
+        member[field] = user.get(field)
+    return member
+
+def _activity_dict(activity, users):
+    data = activity._data
+    return {
+        'id': activity.activity_id,
+        'name': activity.name,
+        'description': activity.description,
+        'link': activity.link,
+        'cost': {
+            'per_person': activity.costs.per_person,
+            'is_per_person': activity.costs.is_per_person,
+            'total_cost': activity.costs.total_cost
+        },
+        'start_time': activity.start_time.isoformat() if activity.start_time else None,
+        'end_time': activity.end_time.isoformat() if activity.end_time else None,
+        'proposer': _member(users, _ref_id(data.get('proposer')), 'name'),
+        'status': activity.status,
+        'votes': [_member(users, v, 'name', 'picture') for v in _ref_ids(data.get('votes'))],
+        'payments': [str(p) for p in _ref_ids(data.get('payments'))],
+        'country': activity.country,
+        'state': activity.state,
+        'city': activity.city
+    }
+
+def _message_dict(message, users):
+    sender_id = _ref_id(message._data.get('sender'))
+    return {
+        'id': str(message.id),
+        'sender_id': str(sender_id),
+        'sender_name': users.get(sender_id, {}).get('name'),
+        'text': message.text,
+        'date': message.timestamp.isoformat()
+    }
+
+def _plan_dict(plan, messages, users, images):
+    data = plan._data
+    image_id = _ref_id(data.get('image'))
+    invitation_id = _ref_id(data.get('invitation'))
+    return {
+        'id': str(plan.id),
+        'name': plan.name,
+        'description': plan.description,
+        'type': plan.type,
+        'status': plan.status,
+        'is_public': plan.is_public,
+        'organizer': _member(users, _ref_id(data.get('organizer')), 'venmo', 'name', 'picture'),
+        'participants': [_member(users, p, 'name', 'picture') for p in _ref_ids(data.get('participants'))],
+        'admins': [_member(users, a, 'name', 'picture') for a in _ref_ids(data.get('admins'))],
+        'deadline': plan.deadline.isoformat() if plan.deadline else None,
+        'costs': {
+            'total': plan.costs.total if plan.costs else 0.0,
+            'per_person': plan.costs.per_person if plan.costs else 0.0,
+            'collected': plan.costs.collected
+        },
+        'activities': [_activity_dict(activity, users) for activity in data.get('activities') or []],
+        'messages': [_message_dict(message, users) for message in messages],
+        'invitation': str(invitation_id) if invitation_id else None,
+        'created_at': plan.created_at.isoformat() if plan.created_at else None,
+        'start_day': plan.start_day.isoformat() if plan.start_day else None,
+        'end_day': plan.end_day.isoformat() if plan.end_day else None,
+        'country': plan.country,
+        'state': plan.state,
+        'city': plan.city,
+        'images': {
+            'primary': {
+                'id': str(image_id),
+                'key': images.get(image_id, {}).get('key')
+            },
+            'stock': plan.stock_image
+        }
+    }
+
+def serialize_plans(plans):
+    plans = list(plans)
+    messages = {plan.id: message_service.get_recent_messages(plan.id) for plan in plans}
+
+    user_ids, image_ids = set(), set()
+    for plan in plans:
+        _collect_plan_refs(plan, messages[plan.id], user_ids, image_ids)
+    users = _fetch(User, user_ids, USER_FIELDS)
+    images = _fetch(Image, image_ids, IMAGE_FIELDS)
+
+    return [_plan_dict(plan, messages[plan.id], users, images) for plan in plans]
+
+def serialize_plan(plan):
+    return serialize_plans([plan])[0]
+
+def serialize_activity(activity):
+    user_ids = set()
+    _collect_activity_refs(activity, user_ids)
+    users = _fetch(User, user_ids, USER_FIELDS)
+
+    return _activity_dict(activity, users)
+
+def _summary_dict(plan, users, images):
+    data = plan._data
+    image_id = _ref_id(data.get('image'))
+    return {
+        'id': str(plan.id),
+        'name': plan.name,
+        'description': plan.description,
+        'type': plan.type,
+        'status': plan.status,
+        'is_public': plan.is_public,
+        'organizer': _member(users, _ref_id(data.get('organizer')), 'name', 'picture'),
+        'deadline': plan.deadline.isoformat() if plan.deadline else None,
+        'costs': {
+            'total': plan.costs.total if plan.costs else 0.0,
+            'per_person': plan.costs.per_person if plan.costs else 0.0,
+            'collected': plan.costs.collected if plan.costs else 0.0
+        },
+        'created_at': plan.created_at.isoformat() if plan.created_at else None,
+        'start_day': plan.start_day.isoformat() if plan.start_day else None,
+        'end_day': plan.end_day.isoformat() if plan.end_day else None,
+        'country': plan.country,
+        'state': plan.state,
+        'city': plan.city,
+        'images': {
+            'primary': {
+                'id': str(image_id),
+                'key': images.get(image_id, {}).get('key')
+            },
+            'stock': plan.stock_image
+        }
+    }
+
+def serialize_plan_summaries(plans):
+    """Lightweight list-view shape for plans loaded with PLAN_SUMMARY_FIELDS."""
+    plans = list(plans)
+    users = _fetch(User, (_ref_id(plan._data.get('organizer')) for plan in plans), USER_FIELDS)
+    images = _fetch(Image, (_ref_id(plan._data.get('image')) for plan in plans), IMAGE_FIELDS)
+
+    return [_summary_dict(plan, users, images) for plan in plans]
+
+def iter_plan_summaries(plans, chunk_size):
+    """
+    Consume `plans` lazily, yielding (plans, summaries) chunks of up to `chunk_size`;
+    references are fetched per chunk so memory stays flat however many plans there are.
+    """
+    chunk = []
+    for plan in plans:
+        chunk.append(plan)
+        if len(chunk) == chunk_size:
+            yield chunk, serialize_plan_summaries(chunk)
+            chunk = []
+    if chunk:
+        yield chunk, serialize_plan_summaries(chunk)
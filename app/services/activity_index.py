@@ -0,0 +1,83 @@
+def activity_span(activity):
+    """
+    (start, end) of an activity. Activities without an end time (or with an end
+    before their start) are treated as occupying only their start time.
+    """
+    start = activity.start_time
+    end = activity.end_time
+    if end is None or end < start:
+        end = start
+    return start, end
+
+def spans_overlap(a_start, a_end, b_start, b_end):
+    # Same start always conflicts, otherwise half-open [start, end) intersection
+    if a_start == b_start:
+        return True
+    return a_start < b_end and b_start < a_end
+
+class ActivityIntervalIndex:
+    """
+    Static interval tree over a plan's activities. Activities are sorted by start
+    time and every implicit subtree (the midpoint of a sorted range) records the
+    largest end time below it, so overlap queries run in O(log n + k).
+    """
+    def __init__(self, activities):
+        spans = sorted(
+            ((*activity_span(a), i, a) for i, a in enumerate(activities) if a.start_time is not None),
+            key=lambda span: (span[0], span[2]),
+        )
+        self._starts = [span[0] for span in spans]
+        self._ends = [span[1] for span in spans]
+        self._activities = [span[3] for span in spans]
+        self._max_end = [None] * len(spans)
+        self._build(0, len(spans))
+
+    def __len__(self):
+        return len(self._activities)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > max_end:
+                max_end = child
+        self._max_end[mid] = max_end
+        return max_end
+
+    def _query(self, lo, hi, start, end, results):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] < start:
+            return
+        self._query(lo, mid, start, end, results)
+        if spans_overlap(self._starts[mid], self._ends[mid], start, end):
+            results.append(self._activities[mid])
+        # Everything to the right starts at or after this node
+        if self._starts[mid] <= end:
+            self._query(mid + 1, hi, start, end, results)
+
+    def overlapping(self, start, end=None):
+        """Activities overlapping [start, end), in start time order."""
+        if end is None or end < start:
+            end = start
+        results = []
+        self._query(0, len(self._activities), start, end, results)
+        return results
+
+    def conflicts(self, activity):
+        """Other activities overlapping `activity`."""
+        return [a for a in self.overlapping(*activity_span(activity))
+                if a.activity_id != activity.activity_id]
+
+def for_plan(plan):
+    # Reused until the plan's activities are replaced or any write bumps its version
+    key = (plan.version, id(plan.activities))
+    cached = getattr(plan, '_activity_index', None)
+    if cached and cached[0] == key:
+        return cached[1]
+    index = ActivityIntervalIndex(plan.activities)
+    plan._activity_index = (key, index)
+    return index
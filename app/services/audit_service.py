@@ -1,19 +1,273 @@
+import copy
 import json
+import queue
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId, DBRef
 from flask import g, current_app
 from app.logger import get_logger
 
 logger = get_logger(__name__)
 
-AUDIT_INSERT_SQL = """
-INSERT INTO audit.events (
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL = 0.5 # Seconds a partial batch waits before it is written
+AUDIT_FLUSH_ATTEMPTS = 3
+
+AUDIT_COLUMNS = """
     actor_id, resource_type, resource_id,
     event_type, status, error_message, before, after,
     request_id, idempotency_key
-)
-VALUES (%s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s, %s)
-ON CONFLICT (idempotency_key) DO NOTHING
-RETURNING id;
 """
+AUDIT_ROW_SQL = "(%s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s, %s)"
+
+AUDIT_INSERT_SQL = f"""
+INSERT INTO audit.events ({AUDIT_COLUMNS})
+VALUES {{values}}
+ON CONFLICT (idempotency_key) DO NOTHING;
+"""
+
+class AuditWriter:
+    """
+    Buffers audit rows in a bounded in-process queue and writes them from a background
+    thread as multi-row INSERTs, so requests never wait on Postgres.
+    A batch is flushed when it reaches `batch_size` rows or `flush_interval` seconds.
+    When the queue is full the event is dropped and counted: requests run on eventlet
+    greenlets and the queue isn't green, so a blocking put would stall the whole worker.
+    """
+    def __init__(self, pool, max_queue=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL):
+        self.pool = pool
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        # Drains whatever is still queued before the thread exits
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error("audit writer did not drain in time pending=%s", self.queue.qsize())
+        logger.info("audit writer stopped written=%s dropped=%s", self.written, self.dropped)
+
+    def submit(self, row):
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("audit queue full, event dropped idempotency_key=%s dropped=%s", row[-1], self.dropped)
+            return False
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows):
+        sql = AUDIT_INSERT_SQL.format(values=", ".join([AUDIT_ROW_SQL] * len(rows)))
+        params = [value for row in rows for value in row]
+        with self.pool.connection() as conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+
+    def _flush(self, batch):
+        for attempt in range(1, AUDIT_FLUSH_ATTEMPTS + 1):
+            try:
+                self._insert(batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                logger.warning("audit flush failed rows=%s attempt=%s error=%s", len(batch), attempt, str(e))
+                self._stopping.wait(0.1 * attempt)
+
+        # One bad row fails the whole INSERT, write them one by one so only that row is lost
+        logger.error("audit flush gave up on the batch, writing rows singly rows=%s stats=%s", len(batch), self.pool.get_stats())
+        for row in batch:
+            try:
+                self._insert([row])
+                self.written += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.error("audit row dropped idempotency_key=%s error=%s", row[-1], str(e))
+
+# ===== Compact snapshots and diffs =====
+# Events store a structural diff of the raw document instead of full serialized
+# before/after copies. A full snapshot is only stored when the document is created;
+# reconstruct() replays the diffs over it to recover any intermediate state.
+# Writers diff their own (possibly stale) copy of the plan while other atomic updates
+# interleave, so list changes are recorded by identity rather than position: lists of
+# ids as the members added and removed, embedded activities by their activity_id.
+# Each diff then applies to the stored state no matter what changed around it.
+
+_MISSING = object()
+_ID_KEY = 'activity_id'
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, DBRef):
+        return str(value.id)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def snapshot(document):
+    """JSON-safe copy of a document's raw stored state (or a raw dict), references stay ids."""
+    return _jsonable(document.to_mongo() if hasattr(document, 'to_mongo') else document)
+
+def _is_keyed(items):
+    return all(isinstance(item, dict) and _ID_KEY in item for item in items)
+
+def _is_flat(items):
+    return not any(isinstance(item, (dict, list)) for item in items)
+
+def _segment(item_id):
+    return f"{_ID_KEY}={item_id}"
+
+def _diff(old, new, path, changes):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in list(old) + [k for k in new if k not in old]:
+            _diff(old.get(key, _MISSING), new.get(key, _MISSING), path + (key,), changes)
+        return
+    if isinstance(old, list) and isinstance(new, list):
+        if _is_keyed(old) and _is_keyed(new):
+            old_items = {item[_ID_KEY]: item for item in old}
+            new_items = {item[_ID_KEY]: item for item in new}
+            for item_id in list(old_items) + [i for i in new_items if i not in old_items]:
+                _diff(old_items.get(item_id, _MISSING), new_items.get(item_id, _MISSING), path + (_segment(item_id),), changes)
+            return
+        if _is_flat(old) and _is_flat(new):
+            added = [item for item in new if item not in old]
+            removed = [item for item in old if item not in new]
+            if added or removed:
+                changes['.'.join(path)] = {'added': added, 'removed': removed}
+            return
+    if old != new:
+        entry = {}
+        if old is not _MISSING:
+            entry['old'] = old
+        if new is not _MISSING:
+            entry['new'] = new
+        changes['.'.join(path)] = entry
+
+def diff(before, after):
+    """
+    Map of dotted path -> change for every leaf that changed: {'old': ..., 'new': ...}
+    for values (a missing 'old' means the path was added, a missing 'new' that it was
+    removed) and {'added': [...], 'removed': [...]} for lists of ids. Embedded
+    activities are addressed as "activity_id=<id>" path segments.
+    """
+    changes = {}
+    _diff(before, after, (), changes)
+    return changes
+
+def _find(items, part):
+    item_id = part[len(_ID_KEY) + 1:]
+    return next((i for i, item in enumerate(items) if item.get(_ID_KEY) == item_id), None)
+
+def _walk(document, path):
+    """(container, last segment) of `path`, container None if an activity on the way is gone."""
+    parts = path.split('.')
+    parent = document
+    for part in parts[:-1]:
+        if isinstance(parent, list):
+            index = _find(parent, part)
+            parent = parent[index] if index is not None else None
+        else:
+            parent = parent.get(part)
+        if parent is None:
+            return None, parts[-1]
+    return parent, parts[-1]
+
+def _set(document, path, value):
+    parent, key = _walk(document, path)
+    if parent is None:
+        return
+    if isinstance(parent, list):
+        index = _find(parent, key)
+        if index is None:
+            parent.append(value)
+        else:
+            parent[index] = value
+    else:
+        parent[key] = value
+
+def _remove(document, path):
+    parent, key = _walk(document, path)
+    if parent is None:
+        return
+    if isinstance(parent, list):
+        index = _find(parent, key)
+        if index is not None:
+            parent.pop(index)
+    else:
+        parent.pop(key, None)
+
+def apply_diff(document, changes, reverse=False):
+    """Apply `changes` to a copy of `document`; reverse=True undoes them instead."""
+    document = copy.deepcopy(document)
+    side = 'old' if reverse else 'new'
+    depth = lambda path: path.count('.')
+
+    for path in sorted(changes, key=depth):
+        entry = changes[path]
+        if 'added' in entry:
+            added, removed = (entry['removed'], entry['added']) if reverse else (entry['added'], entry['removed'])
+            parent, key = _walk(document, path)
+            if parent is None:
+                continue
+            items = [item for item in parent.get(key, []) if item not in removed]
+            parent[key] = items + [item for item in added if item not in items]
+        elif side in entry:
+            _set(document, path, entry[side])
+    for path in sorted(changes, key=depth, reverse=True):
+        entry = changes[path]
+        if 'added' not in entry and side not in entry:
+            _remove(document, path)
+    return document
+
+def reconstruct(base, diffs):
+    """
+    Replay diffs (oldest first, in version order) over a base snapshot.
+    Returns every state, so event i changed states[i] into states[i + 1].
+    """
+    states = [base]
+    for changes in diffs:
+        states.append(apply_diff(states[-1], changes))
+    return states
 
 def log_event(
     actor_id: str,
@@ -25,36 +279,25 @@ def log_event(
     before: dict | None = None,
     after: dict | None = None,
     idempotency_key: str | None = None,
-) -> str | None:
+) -> bool:
     try:
         # Convert dicts -> JSON strings for jsonb casts
         before_json = json.dumps(before) if before is not None else None
         after_json = json.dumps(after) if after is not None else None
 
         request_id = getattr(g, "request_id", None)
-        pool = current_app.pg_pool
-        with pool.connection(timeout=.2) as conn:
-            conn.autocommit = True
-            with conn.cursor() as cur:
-                cur.execute(
-                    AUDIT_INSERT_SQL,
-                    (
-                        actor_id,
-                        resource_type,
-                        resource_id,
-                        event_type,
-                        status,
-                        error_message,
-                        before_json,
-                        after_json,
-                        request_id,
-                        idempotency_key,
-                    ),
-                )
-                row = cur.fetchone()
-
-        # If idempotency_key conflicted, RETURNING returns no rows
-        return row[0] if row else None
+        return current_app.audit_writer.submit((
+            actor_id,
+            resource_type,
+            resource_id,
+            event_type,
+            status,
+            error_message,
+            before_json,
+            after_json,
+            request_id,
+            idempotency_key,
+        ))
     except Exception as e:
         logger.exception(
             "audit log_event failed actor_id=%s resource_type=%s resource_id=%s event_type=%s status=%s error=%s",
@@ -65,5 +308,4 @@ def log_event(
             status,
             str(e),
         )
-        logger.error("PoolTimeout stats=%s", pool.get_stats())
-        return None
+        return False
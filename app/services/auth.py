@@ -1,20 +1,14 @@
 # app/auth.py
-import json
-from urllib.request import urlopen
 from jose import jwt, JWTError
+from app.services import jwks
 
 class Auth0JWTBearerTokenValidator:
     def __init__(self, domain, audience):
         self.domain = domain
         self.audience = audience
         self.issuer = f"https://{domain}/"
-        
-        jwks_url = f"{self.issuer}.well-known/jwks.json"
-        try:
-            jwks = json.loads(urlopen(jwks_url).read())
-            self.jwks = {key["kid"]: key for key in jwks["keys"]}
-        except Exception as e:
-            raise RuntimeError(f"Failed to fetch JWKS: {e}")
+        # Keys are loaded on first validation, not while the app is being created
+        self.jwks = jwks.get_provider(domain)
 
     def validate_token(self, id_token):
         """
@@ -28,11 +22,13 @@ class Auth0JWTBearerTokenValidator:
             raise Exception("Invalid token header")
 
         kid = unverified_header.get("kid")
-        if kid not in self.jwks:
+        try:
+            rsa_key = self.jwks.get_key(kid)
+        except Exception as e:
+            raise Exception(f"Failed to fetch JWKS: {e}")
+        if rsa_key is None:
             raise Exception("Public key not found in JWKS")
 
-        rsa_key = self.jwks[kid]
-
         try:
             claims = jwt.decode(
                 id_token,
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from app.models.plan import Plan
+from app.models.plan_change import PlanChange
+from app.schemas import plan_doc_schema
+from app.constants import MAX_PLAN_CHANGES
+from app.logger import get_logger
+
+# Per-plan feed of committed changes, served by GET /plan/<plan_id>/changes.
+# Each record takes the next Plan.change_seq and carries the touched sections of
+# the plan body as they stood when that number was taken, so replaying records in
+# order always converges on the stored plan even when writers interleave.
+# A sequence with a hole (a record that failed to insert, or one the TTL index
+# already removed) can't be replayed, clients are sent a snapshot instead.
+
+logger = get_logger(__name__)
+
+def record(plan, op, actor_id, sections, activity_ids=()):
+    """
+    Append a change touching `sections` (and `activity_ids`) of the plan.
+    Returns it as pushed to sockets, or None on failure.
+    """
+    try:
+        doc = Plan._get_collection().find_one_and_update(
+            {'_id': plan.id},
+            {'$inc': {'change_seq': 1}},
+            projection={'change_seq': 1, **plan_doc_schema.section_projection(sections)},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+        change = {
+            'plan_id': plan.id,
+            'seq': doc['change_seq'],
+            'op': op,
+            'actor_id': str(actor_id) if actor_id is not None else None,
+            'data': plan_doc_schema.serialize_plan_sections(doc, sections, set(activity_ids)),
+            'created_at': datetime.now(timezone.utc),
+        }
+        PlanChange._get_collection().insert_one(change)
+    except Exception as e:
+        logger.warning("change_log record failed plan_id=%s op=%s error=%s", plan.id, op, str(e))
+        return None
+    return {
+        'plan_id': str(plan.id),
+        'seq': change['seq'],
+        'op': op,
+        'actor_id': change['actor_id'],
+        'date': change['created_at'].isoformat(),
+        'data': change['data']
+    }
+
+def get_changes(plan_id, since, current):
+    """
+    Records after `since` up to `current` in order, or None when the client
+    has to start over from a snapshot.
+    """
+    if since > current or current - since > MAX_PLAN_CHANGES:
+        return None
+    if since == current:
+        return []
+
+    changes = list(PlanChange.objects(plan_id=plan_id, seq__gt=since, seq__lte=current).order_by('seq'))
+    if len(changes) != current - since:
+        logger.info("get_changes gap plan_id=%s since=%s current=%s found=%s", plan_id, since, current, len(changes))
+        return None
+    return changes
@@ -1,19 +1,34 @@
 import os 
+import time
+from collections import OrderedDict
+import redis
 from app.errors import ValidationError, DatabaseError, ImageNotFound
 from datetime import datetime, timezone 
 import uuid
-from app.extensions import s3
+from app.extensions import s3, cache
 from app.models.image import Image
 from app.services import audit_service
 from app.constants import Resource, Status, Action
 from app.logger import get_logger
 
-BUCKET = os.environ["AWS_S3_BUCKET_NAME"]
 MAX_IMAGE_SIZE = 10 * 1024 * 1024 # 10 MB
 ALLOWED_FILE_TYPES = {"image/jpeg", "image/png", "image/webp"}
 
+# Presigned download URLs are reused until they get close to expiring, so list
+# endpoints don't re-sign every image on every request and clients can cache them
+DOWNLOAD_URL_TTL = int(os.getenv("S3_DOWNLOAD_URL_TTL", 3600))
+DOWNLOAD_URL_REFRESH_MARGIN = int(os.getenv("S3_DOWNLOAD_URL_REFRESH_MARGIN", 300))
+DOWNLOAD_URL_CACHE_SIZE = 10000
+DOWNLOAD_URL_CACHE_REDIS = os.getenv("S3_DOWNLOAD_URL_CACHE_REDIS", "false").lower() == "true"
+
+_download_urls = OrderedDict() # key -> (url, reuse_until)
+
 logger = get_logger(__name__)
 
+def _bucket():
+    # Read on use so importing the module doesn't require AWS settings
+    return os.environ["AWS_S3_BUCKET_NAME"]
+
 def get_upload_url(user, data):
     filename = data.get('filename')
     filetype = data.get('filetype')
@@ -40,7 +55,7 @@ def get_upload_url(user, data):
     pre_signed_url = s3.generate_presigned_url(
         ClientMethod='put_object',
         Params={
-            "Bucket": BUCKET,
+            "Bucket": _bucket(),
             "Key": s3_key,
             "ContentType": filetype
         },
@@ -127,23 +142,87 @@ def image_uploaded(image):
     )
 
 
-def get_download_url(key):    
-    pre_signed_url = s3.generate_presigned_url(
+def _sign_download_url(key):
+    return s3.generate_presigned_url(
         ClientMethod='get_object',
         Params={
-            "Bucket": BUCKET,
+            "Bucket": _bucket(),
             "Key": key,
         },
-        ExpiresIn=60
+        ExpiresIn=DOWNLOAD_URL_TTL
     )
-    return pre_signed_url
+
+def _remember_download_url(key, url, reuse_until):
+    _download_urls[key] = (url, reuse_until)
+    _download_urls.move_to_end(key)
+    while len(_download_urls) > DOWNLOAD_URL_CACHE_SIZE:
+        _download_urls.popitem(last=False)
+
+def _redis_key(key):
+    return f"s3:download_url:{key}"
+
+def download_url_epoch():
+    """
+    Changes every DOWNLOAD_URL_REFRESH_MARGIN seconds. A URL handed out during one
+    epoch stays valid for at least that long, so ETags that include it never let a
+    client revalidate its way past an expired URL.
+    """
+    return int(time.time() // max(DOWNLOAD_URL_REFRESH_MARGIN, 1))
+
+def get_download_url_map(keys):
+    """Presigned download URLs for many S3 keys, signing only the ones not cached."""
+    now = time.time()
+    urls = {}
+    missing = []
+    for key in dict.fromkeys(k for k in keys if k):
+        entry = _download_urls.get(key)
+        if entry and entry[1] > now:
+            urls[key] = entry[0]
+        else:
+            missing.append(key)
+
+    reuse_for = max(DOWNLOAD_URL_TTL - DOWNLOAD_URL_REFRESH_MARGIN, 0)
+    if missing and DOWNLOAD_URL_CACHE_REDIS:
+        try:
+            pipe = cache.pipeline()
+            for key in missing:
+                pipe.get(_redis_key(key))
+                pipe.ttl(_redis_key(key))
+            results = pipe.execute()
+            for key, url, ttl in zip(list(missing), results[::2], results[1::2]):
+                if url and ttl > 0:
+                    urls[key] = url
+                    _remember_download_url(key, url, now + ttl)
+                    missing.remove(key)
+        except redis.RedisError as e:
+            logger.warning("download url cache read failed keys=%s error=%s", len(missing), str(e))
+
+    signed = {}
+    for key in missing:
+        signed[key] = _sign_download_url(key)
+        _remember_download_url(key, signed[key], now + reuse_for)
+    urls.update(signed)
+
+    if signed and DOWNLOAD_URL_CACHE_REDIS and reuse_for:
+        try:
+            pipe = cache.pipeline()
+            for key, url in signed.items():
+                pipe.set(_redis_key(key), url, ex=reuse_for)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("download url cache write failed keys=%s error=%s", len(signed), str(e))
+
+    return urls
+
+def get_download_url(key):    
+    return get_download_url_map([key]).get(key)
 
 def get_download_urls(image):
     return []
     pre_signed_url = s3.generate_presigned_url(
         ClientMethod='get_object',
         Params={
-            "Bucket": BUCKET,
+            "Bucket": _bucket(),
             "Key": image.key,
         },
         ExpiresIn=60
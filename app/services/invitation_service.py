@@ -1,9 +1,9 @@
 import secrets
 from app.models.invitation import Invitation
-from app.services import plan_service, user_service, audit_service
+from app.services import plan_service, user_service, audit_service, plan_cache
 from datetime import timezone, datetime, timedelta
-from app.errors import DatabaseError, InviteNotFound, NotPlanOrganizer, UserNotAuthorized
-from app.utils import _naive_utc
+from app.errors import DatabaseError, InviteNotFound, NotPlanOrganizer, UserNotAuthorized, Unauthorized
+from app.utils import _naive_utc, make_etag
 from app.logger import get_logger
 from app.constants import Resource, Status, Action
 
@@ -70,9 +70,36 @@ def get_invite(plan, user):
         except Exception as e:
             logger.exception("get_invite save failed plan_id=%s error=%s", plan.id, str(e))
             raise DatabaseError("Unexpected database error", details={"exception": str(e)})
+        plan_cache.invalidate(plan)
+        plan_service.publish_change(plan, 'invite:rotated', user.id, ('plan',))
 
     return invite
 
+def invite_etag(invite_id, version):
+    return make_etag('invite', invite_id, version)
+
+def get_invite_etag(plan_id, user):
+    """
+    ETag of the invite get_invite would return, from projections only. None when
+    it would be replaced (missing, expired or used up), so the caller takes the full path.
+    """
+    plan = plan_service.get_plan_meta(plan_id, user, fields=('invitation',))
+    if plan.get('is_public'):
+        raise Unauthorized
+    if not plan.get('invitation'):
+        return None
+
+    invite = Invitation._get_collection().find_one(
+        {'_id': plan['invitation']}, {'version': 1, 'expires_at': 1, 'uses': 1, 'max_uses': 1})
+    if not invite:
+        return None
+    curr_time = _naive_utc(datetime.now(timezone.utc))
+    expires_at = _naive_utc(invite.get('expires_at'))
+    if expires_at and curr_time > expires_at or invite.get('uses', 0) >= invite.get('max_uses', 50):
+        return None
+
+    return invite_etag(invite['_id'], invite.get('version', 0))
+
 # TODO - Throw exceptions instead of False, must be caught where used
 def valid_invite(plan, invite_id):
     if str(plan.invitation.id) != invite_id:
@@ -98,14 +125,13 @@ def accept_invite(plan, user):
     if not invite:
         logger.warning("accept_invite invite not found plan_id=%s", plan.id)
         raise InviteNotFound
-    invite.uses += 1
 
     user_service.add_mutuals(plan, user)
     plan_service.add_participant(plan, user)
     user_service.add_plan(plan, user)
 
     try:
-        invite.save()
+        invite.modify(inc__uses=1, inc__version=1)
     except Exception as e:
         logger.exception("accept_invite save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
         audit_service.log_event(
@@ -137,9 +163,8 @@ def accept_invite(plan, user):
 
 def expire_invite(invite):
     before = invite.to_dict()
-    invite.status = 'expired'
     try:
-        invite.save()
+        invite.modify(set__status='expired', inc__version=1)
     except Exception as e:
         logger.exception("expire_invite save failed invite_id=%s error=%s", invite.id, str(e))
         audit_service.log_event(
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+from app.extensions import socketio
+from app.logger import get_logger
+
+# Auth0 signing keys, shared by every token validator in the process.
+# Nothing is fetched at import time: keys load on first use from a local file
+# written by the last successful fetch (or from Auth0 when there is none), and an
+# unknown kid triggers a rate-limited background refresh to pick up key rotation.
+# Workers run eventlet without a patched `threading`, so nothing here blocks on a
+# threading primitive across I/O: refreshes are socketio background tasks and a
+# request waiting for one yields with socketio.sleep.
+
+JWKS_FETCH_TIMEOUT = 5 # Seconds
+JWKS_MIN_REFRESH_INTERVAL = 60 # Seconds between fetches, unknown kids can't hammer Auth0
+JWKS_REFRESH_WAIT = 2.0 # Seconds a request with an unknown kid waits for the refresh
+JWKS_REFRESH_POLL = 0.05
+JWKS_CACHE_DIR = os.getenv("JWKS_CACHE_DIR", tempfile.gettempdir())
+
+logger = get_logger(__name__)
+
+class JWKSProvider:
+    def __init__(self, url, cache_path=None):
+        self.url = url
+        digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+        self.cache_path = cache_path or os.path.join(JWKS_CACHE_DIR, f"jwks-{digest}.json")
+        self._keys = None
+        self._lock = threading.Lock() # Only guards the refresh flag, never held across I/O
+        self._refreshing = False
+        self._last_fetch = 0.0
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return {key["kid"]: key for key in json.load(f)["keys"]}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("jwks cache unreadable path=%s error=%s", self.cache_path, str(e))
+            return None
+
+    def _store_cache(self, jwks):
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.cache_path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(jwks, f)
+            os.replace(tmp, self.cache_path)
+        except Exception as e:
+            logger.warning("jwks cache write failed path=%s error=%s", self.cache_path, str(e))
+
+    def _fetch(self):
+        self._last_fetch = time.monotonic()
+        response = requests.get(self.url, timeout=JWKS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        jwks = response.json()
+        keys = {key["kid"]: key for key in jwks["keys"]}
+        self._keys = keys
+        self._store_cache(jwks)
+        logger.info("jwks fetched url=%s kids=%s", self.url, list(keys))
+        return keys
+
+    def _refresh(self):
+        try:
+            self._fetch()
+        except Exception as e:
+            logger.warning("jwks refresh failed url=%s error=%s", self.url, str(e))
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh_async(self):
+        """Start a background fetch unless one is running or the last was too recent."""
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._last_fetch < JWKS_MIN_REFRESH_INTERVAL:
+                return False
+            self._refreshing = True
+        socketio.start_background_task(self._refresh)
+        return True
+
+    def keys(self):
+        keys = self._keys
+        if keys is None:
+            # Requests racing a cold start may each fetch once, none waits on another's I/O
+            keys = self._load_cache() or self._fetch()
+            self._keys = self._keys or keys
+        return keys
+
+    def get_key(self, kid):
+        """Signing key for `kid`, or None if Auth0 doesn't know it either."""
+        key = self.keys().get(kid)
+        if key is None and (self.refresh_async() or self._refreshing):
+            deadline = time.monotonic() + JWKS_REFRESH_WAIT
+            while self._refreshing and time.monotonic() < deadline:
+                socketio.sleep(JWKS_REFRESH_POLL)
+            key = self._keys.get(kid)
+        return key
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_provider(domain):
+    url = f"https://{domain}/.well-known/jwks.json"
+    with _providers_lock:
+        if url not in _providers:
+            _providers[url] = JWKSProvider(url)
+        return _providers[url]
@@ -0,0 +1,68 @@
+import uuid
+import redis
+from app.extensions import cache
+from app.logger import get_logger
+
+# Member ids of each plan (organizer, admins and participants) as a Redis set, so
+# socket joins and chat sends authorize with one SISMEMBER instead of a Mongo read.
+# plan_service invalidates the set whenever membership changes. Each invalidation
+# also moves the plan's generation token, and a rebuild only stores its set if the
+# token is unchanged since before it loaded, so a removed member can't be re-added
+# by a load that read the plan before the removal.
+
+MEMBERSHIP_TTL = 300 # Seconds
+_SENTINEL = "-" # Keeps the set present for plans with no members to cache
+
+logger = get_logger(__name__)
+
+def _key(plan_id):
+    return f"plan:{plan_id}:members"
+
+def _generation_key(plan_id):
+    return f"plan:{plan_id}:members:gen"
+
+def is_member(plan_id, user_id, load):
+    """
+    Whether `user_id` belongs to the plan, calling `load()` for the plan's member ids
+    (a set of str, or None if the plan doesn't exist) on a miss.
+    """
+    key = _key(plan_id)
+    generation_key = _generation_key(plan_id)
+    uid = str(user_id)
+    try:
+        pipe = cache.pipeline()
+        pipe.exists(key)
+        pipe.sismember(key, uid)
+        pipe.get(generation_key)
+        exists, member, generation = pipe.execute()
+        if exists:
+            return bool(member)
+    except redis.RedisError as e:
+        logger.warning("membership cache unavailable plan_id=%s error=%s", plan_id, str(e))
+        return uid in (load() or ())
+
+    members = load() or set()
+    try:
+        with cache.pipeline() as pipe:
+            pipe.watch(generation_key)
+            if pipe.get(generation_key) != generation:
+                logger.info("membership cache store skipped, invalidated during load plan_id=%s", plan_id)
+                return uid in members
+            pipe.multi()
+            pipe.sadd(key, _SENTINEL, *members)
+            pipe.expire(key, MEMBERSHIP_TTL)
+            pipe.execute()
+    except redis.WatchError:
+        logger.info("membership cache store skipped, invalidated during store plan_id=%s", plan_id)
+    except redis.RedisError as e:
+        logger.warning("membership cache store failed plan_id=%s error=%s", plan_id, str(e))
+    return uid in members
+
+def invalidate(plan_id):
+    try:
+        pipe = cache.pipeline()
+        pipe.set(_generation_key(plan_id), uuid.uuid4().hex, ex=MEMBERSHIP_TTL)
+        pipe.delete(_key(plan_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("membership cache invalidate failed plan_id=%s error=%s", plan_id, str(e))
@@ -0,0 +1,244 @@
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from bson import ObjectId
+from app.models.message import Message
+from app.constants import RECENT_MESSAGES_LIMIT, MESSAGE_PAGE_SIZE, MAX_MESSAGE_PAGE_SIZE, Resource, Status, Action
+from app.extensions import socketio
+from app.services import audit_service, plan_cache
+from app.logger import get_logger
+from app.utils import encode_cursor, decode_cursor
+from mongoengine.queryset.visitor import Q
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = get_logger(__name__)
+
+CHAT_QUEUE_SIZE = 5000 # Pending messages before senders are told to back off
+CHAT_BATCH_SIZE = 1000 # Messages written per flush across all plans
+CHAT_FLUSH_INTERVAL = 0.02 # Seconds between group commits
+CHAT_FLUSH_ATTEMPTS = 3
+DUPLICATE_KEY = 11000
+
+def get_messages(plan_id, cursor=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Page backwards through a plan's chat, newest page first.
+    Returns the page in chronological order and the cursor for the next (older) page.
+    """
+    limit = max(1, min(int(limit), MAX_MESSAGE_PAGE_SIZE))
+    query = Message.objects(plan_id=plan_id)
+    if cursor:
+        timestamp, message_id = decode_cursor(cursor)
+        query = query.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+
+    messages = list(query.order_by('-timestamp', '-id').limit(limit + 1))
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_cursor = encode_cursor(messages[-1].timestamp, messages[-1].id) if has_more and messages else None
+    messages.reverse()
+
+    return messages, next_cursor
+
+def get_recent_messages(plan_id, limit=RECENT_MESSAGES_LIMIT):
+    messages, _ = get_messages(plan_id, limit=limit)
+    return messages
+
+def get_recent_message_docs(plan_id, limit=RECENT_MESSAGES_LIMIT):
+    """Raw documents of the latest messages in chronological order."""
+    docs = list(Message.objects(plan_id=plan_id).order_by('-timestamp', '-id').limit(limit).as_pymongo())
+    docs.reverse()
+    return docs
+
+def get_latest_message_id(plan_id):
+    """Id of the plan's newest message (or None), answered from the (plan_id, timestamp, _id) index."""
+    doc = Message._get_collection().find_one(
+        {'plan_id': ObjectId(plan_id)}, {'_id': 1}, sort=[('timestamp', -1), ('_id', -1)])
+    return doc['_id'] if doc else None
+
+def backfill_messages(batch_size=100):
+    """
+    Move chat embedded in plan documents into the message collection.
+    Safe to re-run: messages are upserted and each plan's embedded list is only
+    unset once its messages are written, so an interrupted run resumes where it stopped.
+    """
+    from app.models.plan import Plan
+
+    plans = Plan._get_collection()
+    messages = Message._get_collection()
+    moved = 0
+    while True:
+        batch = list(plans.find({'messages.0': {'$exists': True}}, {'messages': 1}).limit(batch_size))
+        if not batch:
+            break
+
+        for doc in batch:
+            ops = []
+            for m in doc.get('messages', []):
+                key = {
+                    'plan_id': doc['_id'],
+                    'sender': m.get('sender'),
+                    'timestamp': m.get('timestamp'),
+                    'text': m.get('text'),
+                }
+                ops.append(UpdateOne(key, {'$setOnInsert': key}, upsert=True))
+            try:
+                if ops:
+                    messages.bulk_write(ops, ordered=False)
+                plans.update_one({'_id': doc['_id']}, {'$unset': {'messages': ''}})
+            except Exception as e:
+                logger.exception("backfill_messages failed plan_id=%s error=%s", doc['_id'], str(e))
+                raise
+            moved += len(ops)
+            logger.info("backfill_messages plan_id=%s moved=%s", doc['_id'], len(ops))
+
+    logger.info("backfill_messages complete moved=%s", moved)
+    return moved
+
+# ===== Write-behind chat =====
+
+def new_message(plan_id, user, text):
+    """Raw message document with its id and timestamp assigned up front."""
+    return {
+        '_id': ObjectId(),
+        'plan_id': ObjectId(plan_id),
+        'sender': user.id,
+        'text': text,
+        'timestamp': datetime.now(timezone.utc),
+    }
+
+def message_payload(doc, user):
+    # Same shape as Message.to_dict()
+    return {
+        'id': str(doc['_id']),
+        'sender_id': str(user.id),
+        'sender_name': user.name,
+        'text': doc['text'],
+        'date': doc['timestamp'].isoformat(),
+    }
+
+class MessageWriter:
+    """
+    Persists chat after it has been broadcast. Messages wait in an in-memory buffer
+    and every `flush_interval` each plan's pending messages are group-committed with
+    one insert_many. Ids are assigned before the broadcast, so retries are idempotent.
+    Messages that still can't be stored are reported as plan:message:failed to the
+    sender's socket only.
+    Runs as a Socket.IO background task so it cooperates with the eventlet hub.
+    """
+    def __init__(self, app, max_pending=CHAT_QUEUE_SIZE, batch_size=CHAT_BATCH_SIZE, flush_interval=CHAT_FLUSH_INTERVAL):
+        self.app = app
+        self.pending = deque()
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._running = False
+        self._task = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._task = socketio.start_background_task(self._run)
+
+    def stop(self):
+        # Let the loop finish its current flush before draining, so no batch is written twice
+        self._running = False
+        if self._task:
+            self._task.join()
+            self._task = None
+        while self.pending:
+            self.flush()
+        logger.info("message writer stopped written=%s failed=%s", self.written, self.failed)
+
+    def submit(self, doc, client_id=None, sid=None):
+        """Queue `doc`; `sid` is the sender's socket, told if the write fails."""
+        if len(self.pending) >= self.max_pending:
+            logger.warning("message queue full plan_id=%s pending=%s", doc['plan_id'], len(self.pending))
+            return False
+        self.pending.append((doc, client_id, sid))
+        return True
+
+    def _run(self):
+        while self._running:
+            socketio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("message writer flush error error=%s", str(e))
+
+    def flush(self):
+        by_plan = defaultdict(list)
+        for _ in range(min(len(self.pending), self.batch_size)):
+            doc, client_id, sid = self.pending.popleft()
+            by_plan[doc['plan_id']].append((doc, client_id, sid))
+        if not by_plan:
+            return
+
+        stored = {}
+        for plan_id, entries in by_plan.items():
+            failed = self._insert(plan_id, [doc for doc, _, _ in entries])
+            stored[plan_id] = [doc for doc, _, _ in entries if doc['_id'] not in failed]
+            for doc, client_id, sid in entries:
+                if doc['_id'] in failed:
+                    self._report_failure(doc, client_id, sid)
+
+        with self.app.app_context():
+            self._after_commit(stored)
+
+    def _insert(self, plan_id, docs):
+        """Insert one plan's batch, returns the ids that could not be stored."""
+        collection = Message._get_collection()
+        remaining = docs
+        for attempt in range(1, CHAT_FLUSH_ATTEMPTS + 1):
+            try:
+                collection.insert_many(remaining, ordered=False)
+                return set()
+            except BulkWriteError as e:
+                # Duplicates are messages an earlier attempt already stored
+                failed = {err['index'] for err in e.details.get('writeErrors', []) if err.get('code') != DUPLICATE_KEY}
+                if not failed and not e.details.get('writeConcernErrors'):
+                    return set()
+                remaining = [remaining[i] for i in sorted(failed)] or remaining
+                logger.warning("message flush partial failure plan_id=%s failed=%s attempt=%s", plan_id, len(failed), attempt)
+            except Exception as e:
+                logger.warning("message flush failed plan_id=%s rows=%s attempt=%s error=%s", plan_id, len(remaining), attempt, str(e))
+            socketio.sleep(0.05 * attempt)
+        return {doc['_id'] for doc in remaining}
+
+    def _report_failure(self, doc, client_id, sid):
+        self.failed += 1
+        logger.error("message not stored plan_id=%s message_id=%s sender_id=%s", doc['plan_id'], doc['_id'], doc['sender'])
+        if not sid:
+            return
+        socketio.emit("plan:message:failed", {
+            'id': str(doc['_id']),
+            'client_id': client_id,
+            'sender_id': str(doc['sender']),
+            'error': 'server_error',
+            'message': 'Message could not be saved',
+        }, to=sid)
+
+    def _after_commit(self, stored):
+        from app.models.plan import Plan
+
+        plan_ids = [plan_id for plan_id, docs in stored.items() if docs]
+        if not plan_ids:
+            return
+        # The cached plan body embeds recent chat
+        versions = Plan._get_collection().find({'_id': {'$in': plan_ids}}, {'version': 1})
+        plan_cache.invalidate_versions([(doc['_id'], doc.get('version', 0)) for doc in versions])
+
+        for plan_id in plan_ids:
+            for doc in stored[plan_id]:
+                self.written += 1
+                audit_service.log_event(
+                    actor_id=str(doc['sender']),
+                    resource_type=Resource.MESSAGE,
+                    resource_id=str(doc['_id']),
+                    event_type=Action.CREATE,
+                    status=Status.SUCCESS,
+                    error_message=None,
+                    after=audit_service.snapshot(doc),
+                    idempotency_key=f"{plan_id}:message:{doc['_id']}",
+                )
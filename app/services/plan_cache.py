@@ -0,0 +1,114 @@
+import json
+import time
+import uuid
+import redis
+from app.extensions import cache
+from app.logger import get_logger
+
+# Read-through cache in Redis of the serialized plan body, as built by
+# plan_doc_schema.serialize_plan_doc.
+# Entries are keyed by plan id and version, so every write that bumps the version
+# naturally misses; invalidate() covers writes that don't (chat, invites). Those
+# also move the plan's generation token, and a rebuild only stores its body if the
+# token is unchanged since before it built, so a body that predates the chat or
+# invite write never lands under the key its fresh ETag points at.
+# Authorization is never cached, callers check membership before reading.
+
+PLAN_CACHE_TTL = 300 # Seconds, bounds staleness of embedded user names/pictures
+PLAN_CACHE_LOCK_TTL_MS = 5000
+PLAN_CACHE_WAIT = 2.0 # Seconds a request waits for another worker's rebuild
+PLAN_CACHE_POLL = 0.05
+
+logger = get_logger(__name__)
+
+def _key(plan_id, version):
+    return f"plan:{plan_id}:v{version or 0}"
+
+def _generation_key(plan_id):
+    return f"plan:{plan_id}:gen"
+
+def get_plan_body(plan_id, version, build):
+    """
+    Return the cached body for this plan version, calling `build()` on a miss.
+    Only one caller per key rebuilds; concurrent misses wait for its result instead
+    of all hitting Mongo at once.
+    """
+    key = _key(plan_id, version)
+    lock_key = f"{key}:lock"
+    generation_key = _generation_key(plan_id)
+    try:
+        pipe = cache.pipeline()
+        pipe.get(key)
+        pipe.get(generation_key)
+        cached, generation = pipe.execute()
+        if cached:
+            return json.loads(cached)
+        is_builder = cache.set(lock_key, "1", nx=True, px=PLAN_CACHE_LOCK_TTL_MS)
+    except redis.RedisError as e:
+        logger.warning("plan cache unavailable plan_id=%s error=%s", plan_id, str(e))
+        return build()
+
+    if is_builder:
+        try:
+            body = build()
+            _store(key, generation_key, generation, body)
+            return body
+        finally:
+            try:
+                cache.delete(lock_key)
+            except redis.RedisError:
+                pass
+
+    deadline = time.monotonic() + PLAN_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(PLAN_CACHE_POLL)
+        try:
+            pipe = cache.pipeline()
+            pipe.get(key)
+            pipe.exists(lock_key)
+            cached, building = pipe.execute()
+        except redis.RedisError:
+            break
+        if cached:
+            return json.loads(cached)
+        if not building: # The builder skipped its store
+            break
+
+    logger.info("plan cache wait gave up plan_id=%s version=%s", plan_id, version)
+    return build()
+
+def _store(key, generation_key, generation, body):
+    try:
+        with cache.pipeline() as pipe:
+            pipe.watch(generation_key)
+            if pipe.get(generation_key) != generation:
+                logger.info("plan cache store skipped, invalidated during build key=%s", key)
+                return
+            pipe.multi()
+            pipe.set(key, json.dumps(body), ex=PLAN_CACHE_TTL)
+            pipe.execute()
+    except redis.WatchError:
+        logger.info("plan cache store skipped, invalidated during store key=%s", key)
+    except redis.RedisError as e:
+        logger.warning("plan cache store failed key=%s error=%s", key, str(e))
+
+def cache_epoch():
+    """Changes every PLAN_CACHE_TTL seconds, as often as a cached body may go stale."""
+    return int(time.time() // PLAN_CACHE_TTL)
+
+def invalidate(plan):
+    invalidate_versions([(plan.id, plan.version)])
+
+def invalidate_versions(plan_versions):
+    """Drop the cached bodies for (plan_id, version) pairs and stop rebuilds in flight from storing theirs."""
+    keys = [_key(plan_id, version) for plan_id, version in plan_versions]
+    if not keys:
+        return
+    try:
+        pipe = cache.pipeline()
+        for plan_id, _ in plan_versions:
+            pipe.set(_generation_key(plan_id), uuid.uuid4().hex, ex=PLAN_CACHE_TTL)
+        pipe.delete(*keys)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("plan cache invalidate failed keys=%s error=%s", keys, str(e))
@@ -1,12 +1,16 @@
-from app.services import invitation_service, user_service, image_service, audit_service
+from app.services import invitation_service, user_service, image_service, message_service, audit_service, plan_cache, activity_index, membership_cache, change_log
 from app.models.plan import Plan
 from app.models.user import User
 from app.models.message import Message
 from app.models.activity import Activity, ActivityCost
-from app.errors import DatabaseError, PlanNotFound, UserNotAuthorized, ActivityNotFound, NotPlanOrganizer, ValidationError, UserNotFound
+from app.errors import DatabaseError, PlanNotFound, UserNotAuthorized, ActivityNotFound, NotPlanOrganizer, ValidationError, UserNotFound, PlanConflict
 from mongoengine.queryset.visitor import Q
+from mongoengine.errors import SaveConditionError
+from pymongo import ReturnDocument
+from bson import ObjectId
 import uuid
-from app.constants import PLAN_ALLOWED_FIELDS, ACTIVITY_ALLOWED_FIELDS
+from app.constants import PLAN_ALLOWED_FIELDS, ACTIVITY_ALLOWED_FIELDS, PLAN_SUMMARY_FIELDS, PLAN_PAGE_SIZE, MAX_PLAN_PAGE_SIZE, MAX_PLAN_STREAM_SIZE, PLAN_STREAM_CHUNK_SIZE
+from app.utils import encode_cursor, decode_cursor, make_etag
 from app.extensions import s3
 import os
 from datetime import datetime, timezone
@@ -16,6 +20,8 @@ from app.constants import Resource, Status, Action
 
 logger = get_logger(__name__)
 
+MAX_WRITE_ATTEMPTS = 3
+
 def _audit_plan_event(actor_id, resource_type, resource_id, event_type, status, error_message=None, before=None, after=None, idempotency_key=None):
     audit_service.log_event(
         actor_id=str(actor_id) if actor_id is not None else "system",
@@ -29,6 +35,65 @@ def _audit_plan_event(actor_id, resource_type, resource_id, event_type, status,
         idempotency_key=idempotency_key,
     )
 
+def _atomic_update(plan, update, query=None, projection=None, **kwargs):
+    """
+    Apply a targeted update to the stored plan instead of rewriting the document.
+    Callers mirror the change on the in-memory plan; its change tracking is cleared
+    so a later save() can't write the mirrored (possibly stale) lists back.
+    Returns the updated projection, or None when `query` no longer matches.
+    """
+    update.setdefault('$inc', {})['version'] = 1
+    doc = Plan._get_collection().find_one_and_update(
+        {'_id': plan.id, **(query or {})},
+        update,
+        projection={'version': 1, **(projection or {})},
+        return_document=ReturnDocument.AFTER,
+        **kwargs,
+    )
+    if doc is not None:
+        plan._data['version'] = doc['version']
+        plan._clear_changed_fields()
+    return doc
+
+def _save_plan(plan):
+    # Optimistic concurrency for changes spanning several fields
+    version = plan.version or 0
+    plan.version = version + 1
+    condition = {'version': version} if version else {'version__in': [0, None]}
+    try:
+        plan.save(save_condition=condition)
+    except SaveConditionError:
+        plan.version = version
+        raise PlanConflict(plan.id)
+
+def _plan_change(plan, before):
+    return {
+        'plan_id': str(plan.id),
+        'version': plan.version,
+        'diff': audit_service.diff(before, audit_service.snapshot(plan)),
+    }
+
+def publish_change(plan, op, actor_id, sections, activity_ids=()):
+    """
+    After a committed mutation: append it to the change feed and push it to the
+    plan room as plan:<op>. Without a record (the append failed) the room gets a
+    bare plan:changed, telling clients to refetch.
+    """
+    from app.sockets.socket import broadcast_event
+
+    change = change_log.record(plan, op, actor_id, sections, activity_ids)
+    if change:
+        broadcast_event(plan.id, f"plan:{op}", change)
+    else:
+        broadcast_event(plan.id, "plan:changed", {'plan_id': str(plan.id), 'op': op})
+
+def _evict_if_removed(plan, user_id):
+    """Drop the user's sockets from the plan room unless they're still a member."""
+    from app.sockets.socket import evict_user
+
+    if str(user_id) not in (_member_ids(plan.id) or ()):
+        evict_user(plan.id, user_id)
+
 def create_plan(data, user):
     image_id = data.get('image_id')
     logger.info("create_plan user_id=%s image_id=%s", user.id, image_id)
@@ -49,19 +114,20 @@ def create_plan(data, user):
         stock_image=data.get('image_key'),
         uploaded_images=[image_id] if image_id else []
     )
-    user.hosting_count += 1
 
     try:
         plan.save()
-        user.save()
     except Exception as e:
         logger.exception("create_plan initial save failed user_id=%s error=%s", user.id, str(e))
         _audit_plan_event(actor_id=str(user.id), resource_type=Resource.TRIP, resource_id=None, event_type=Action.CREATE,
                                  status=Status.FAILURE, error_message=str(e), before=None, after=None, idempotency_key=str(plan.id))
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
+    # hosting_count goes through user_service so the user's version (GET /user ETag) moves too
+    user_service.add_plan(plan, user)
     plan.invitation = invitation_service.create_invite(plan.id)
     _audit_plan_event(actor_id=str(user.id), resource_type=Resource.TRIP, resource_id=str(plan.id), event_type=Action.CREATE,
-                            status=Status.SUCCESS, error_message=None, before=None, after=plan.to_dict(), idempotency_key=str(plan.id))
+                            status=Status.SUCCESS, error_message=None, before=None,
+                            after={'plan_id': str(plan.id), 'version': plan.version, 'snapshot': audit_service.snapshot(plan)}, idempotency_key=str(plan.id))
 
     try:
         plan.save()
@@ -71,27 +137,107 @@ def create_plan(data, user):
     logger.info("create_plan created plan_id=%s organizer_id=%s", plan.id, user.id)
     return plan
 
-def get_plans(user):
-    plans = Plan.objects(Q(organizer=user) | Q(participants=user))
+def _page_query(query, cursor, limit, max_limit=MAX_PLAN_PAGE_SIZE):
+    limit = max(1, min(int(limit), max_limit))
+    if cursor:
+        created_at, plan_id = decode_cursor(cursor)
+        query = query.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=plan_id))
+
+    # One extra row tells whether there is a next page
+    return query.only(*PLAN_SUMMARY_FIELDS).order_by('-created_at', '-id').limit(limit + 1), limit
+
+def _page_plans(query, cursor, limit):
+    plans, limit = _page_query(query, cursor, limit)
+    plans = list(plans)
+    next_cursor = None
+    if len(plans) > limit:
+        plans = plans[:limit]
+        next_cursor = encode_cursor(plans[-1].created_at, plans[-1].id)
+
+    return plans, next_cursor
+
+def _user_plans(user):
+    return Plan.objects(Q(organizer=user) | Q(participants=user))
 
-    return plans
+def get_plans(user, cursor=None, limit=PLAN_PAGE_SIZE):
+    return _page_plans(_user_plans(user), cursor, limit)
 
-def get_public_plans():
-    plans = Plan.objects(is_public=True)
+def get_public_plans(cursor=None, limit=PLAN_PAGE_SIZE):
+    return _page_plans(Plan.objects(is_public=True), cursor, limit)
 
-    return plans
+def stream_plans(user, cursor=None, limit=PLAN_PAGE_SIZE):
+    """
+    Unevaluated query for a page of the user's plans (limit + 1 rows, fetched from
+    Mongo in chunks) and the clamped limit, for responses that stream as they go.
+    """
+    plans, limit = _page_query(_user_plans(user), cursor, limit, MAX_PLAN_STREAM_SIZE)
+    return plans.batch_size(PLAN_STREAM_CHUNK_SIZE), limit
+
+def stream_public_plans(cursor=None, limit=PLAN_PAGE_SIZE):
+    plans, limit = _page_query(Plan.objects(is_public=True), cursor, limit, MAX_PLAN_STREAM_SIZE)
+    return plans.batch_size(PLAN_STREAM_CHUNK_SIZE), limit
 
 def get_plan(plan_id, user=None):
-    plan = Plan.objects(id=plan_id).first() 
+    plan = Plan.objects(id=plan_id).exclude('messages').first() 
     if not plan:
         logger.warning("get_plan not found plan_id=%s", plan_id)
         raise PlanNotFound(plan_id)
     if user and not plan.is_public:
-        if plan.organizer != user and user not in plan.participants:
+        if plan.organizer != user and user not in plan.admins and user not in plan.participants:
             raise UserNotAuthorized(user.id)
     
     return plan
 
+def get_plan_doc(plan_id):
+    """Raw stored plan for read-only rendering, callers authorize first (get_plan_version)."""
+    doc = Plan.objects(id=plan_id).exclude('messages').as_pymongo().first()
+    if not doc:
+        logger.warning("get_plan_doc not found plan_id=%s", plan_id)
+        raise PlanNotFound(plan_id)
+
+    return doc
+
+def get_plan_meta(plan_id, user=None, fields=()):
+    """
+    Authorize `user` against a projection of the plan and return the raw `fields`
+    (plus version), without loading or dereferencing the document.
+    """
+    try:
+        oid = ObjectId(plan_id)
+    except Exception:
+        raise PlanNotFound(plan_id)
+    projection = {'version': 1, 'is_public': 1, 'organizer': 1, **{field: 1 for field in fields}}
+    if user:
+        # Same members as _member_ids, so sockets and reads authorize alike
+        projection['admins'] = {'$elemMatch': {'$eq': user.id}}
+        projection['participants'] = {'$elemMatch': {'$eq': user.id}}
+    doc = Plan._get_collection().find_one({'_id': oid}, projection)
+    if not doc:
+        logger.warning("get_plan_meta not found plan_id=%s", plan_id)
+        raise PlanNotFound(plan_id)
+    if user and not doc.get('is_public'):
+        if doc.get('organizer') != user.id and not doc.get('admins') and not doc.get('participants'):
+            raise UserNotAuthorized(user.id)
+
+    return doc
+
+def get_plan_version(plan_id, user=None):
+    return get_plan_meta(plan_id, user).get('version', 0)
+
+def get_plan_etag(plan_id, user=None):
+    """
+    (version, ETag) of the GET /plan/<plan_id> body. Chat and invite rotation don't
+    bump the version, so the latest message and invitation ids are part of the tag.
+    The cache epoch keeps embedded names no staler than the plan cache does, and the
+    download URL epoch keeps clients from revalidating past a presigned URL's expiry.
+    """
+    doc = get_plan_meta(plan_id, user, fields=('image', 'invitation'))
+    version = doc.get('version', 0)
+    url_epoch = image_service.download_url_epoch() if doc.get('image') else None
+    etag = make_etag('plan', doc['_id'], version, doc.get('invitation'),
+                     message_service.get_latest_message_id(doc['_id']), plan_cache.cache_epoch(), url_epoch)
+    return version, etag
+
 def serialize_plan(plan_dict):
     plan_dict['organizer'] = user_service.get_user(plan_dict['participants'])
     plan_dict['participants'] = user_service.get_users(plan_dict['participants'])
@@ -100,23 +246,27 @@ def serialize_plan(plan_dict):
 def lock_plan(plan, user):
     if user != plan.organizer:
         raise NotPlanOrganizer
-    before = plan.to_dict()
+    before = audit_service.snapshot(plan)
 
     plan.status = 'active' if plan.status == 'locked' else 'locked'
     
     try:    
-        plan.save()
+        _save_plan(plan)
+    except PlanConflict:
+        raise
     except Exception as e:
         logger.exception("lock_plan save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
-        _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:lock")
+        _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:lock")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:lock")
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'locked' if plan.status == 'locked' else 'unlocked', user.id, ('plan',))
+    _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:lock")
     return plan
 
 def update_plan(plan, user, data):
     if user != plan.organizer:
         raise NotPlanOrganizer
-    before = plan.to_dict()
+    before = audit_service.snapshot(plan)
     
     for field in PLAN_ALLOWED_FIELDS.keys():
         if field in data:
@@ -130,12 +280,16 @@ def update_plan(plan, user, data):
                 setattr(plan, field, data[field])
 
     try:    
-        plan.save()
+        _save_plan(plan)
+    except PlanConflict:
+        raise
     except Exception as e:
         logger.exception("update_plan save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
-        _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:update")
+        _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:update")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:update")
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'updated', user.id, ('plan',))
+    _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:update")
     return plan
 
 def delete_plan():
@@ -147,6 +301,7 @@ def create_activity(plan, proposer, data):
     if plan.is_public and (proposer != plan.organizer and proposer not in plan.admins):
         raise UserNotAuthorized(str(proposer.id))
     
+    before = audit_service.snapshot(plan)
     cost = data.get('cost', 0.0)
     activity = Activity(
         name=data.get('name', None),
@@ -157,27 +312,38 @@ def create_activity(plan, proposer, data):
         start_time=data.get('start_time', None),
         end_time=data.get('end_time', None)
     )
-    plan.activities.append(activity)
     try:
-        plan.save()
+        activity.validate()
+        plan.activities.append(activity)
+        doc = _atomic_update(plan, {'$push': {'activities': activity.to_mongo()}}, query={'status': 'active'})
     except Exception as e:
         logger.exception("create_activity save failed plan_id=%s error=%s", plan.id, str(e))
         _audit_plan_event(proposer.id, Resource.ACTIVITY, activity.activity_id, Action.CREATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:activity:{activity.activity_id}:create")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(proposer.id, Resource.ACTIVITY, activity.activity_id, Action.CREATE, Status.SUCCESS, after=activity.to_dict(), idempotency_key=f"{plan.id}:activity:{activity.activity_id}:create")
+    if doc is None: # Plan was locked in the meantime
+        raise UserNotAuthorized(str(proposer.id))
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'activity:created', proposer.id, ('activities',), [activity.activity_id])
+    _audit_plan_event(proposer.id, Resource.ACTIVITY, activity.activity_id, Action.CREATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:activity:{activity.activity_id}:create")
     return activity
 
 def update_activity(plan, user, activity, data):
     if user != plan.organizer:
         raise UserNotAuthorized
-    before = activity.to_dict()
+    before = audit_service.snapshot(plan)
     
+    updates = {}
     for field in ACTIVITY_ALLOWED_FIELDS:
-        if field in data:
+        if field in data and field in Activity._fields:
             setattr(activity, field, data[field])
+            updates[f'activities.$.{field}'] = Activity._fields[field].to_mongo(getattr(activity, field))
 
     try:
-        plan.save()
+        activity.validate()
+        if updates and _atomic_update(plan, {'$set': updates}, query={'activities.activity_id': activity.activity_id}) is None:
+            raise ActivityNotFound(activity.activity_id)
+    except ActivityNotFound:
+        raise
     except Exception as e:
         logger.exception(
             "update_activity save failed plan_id=%s activity_id=%s error=%s",
@@ -185,15 +351,17 @@ def update_activity(plan, user, activity, data):
             activity.activity_id,
             str(e),
         )
-        _audit_plan_event(user.id, Resource.ACTIVITY, activity.activity_id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:activity:{activity.activity_id}:update")
+        _audit_plan_event(user.id, Resource.ACTIVITY, activity.activity_id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:activity:{activity.activity_id}:update")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.ACTIVITY, activity.activity_id, Action.UPDATE, Status.SUCCESS, before=before, after=activity.to_dict(), idempotency_key=f"{plan.id}:activity:{activity.activity_id}:update")
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'activity:updated', user.id, ('activities',), [activity.activity_id])
+    _audit_plan_event(user.id, Resource.ACTIVITY, activity.activity_id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:activity:{activity.activity_id}:update")
     return activity
 
 def get_activity(plan, activity_id):
     activity = next((a for a in plan.activities if a.activity_id == activity_id), None)
     if not activity:
-        raise ActivityNotFound
+        raise ActivityNotFound(activity_id)
     
     return activity
     
@@ -201,16 +369,7 @@ def get_activity(plan, activity_id):
 def delete_activity():
     pass
 
-# TODO - Update lock activity to be agnostic to activity id since this may also be used by organizer
-def lock_activity(plan, activity_id, user=None):
-    if user and user != plan.organizer:
-        raise NotPlanOrganizer
-    
-    activity = next((a for a in plan.activities if a.activity_id == activity_id), None)
-    if not activity:
-        raise ActivityNotFound
-    before = activity.to_dict()
-    
+def _confirm_activity(plan, activity):
     # Update activity status and plan costs
     total_participants = len(plan.participants) + 1
     activity.status = 'confirmed'
@@ -223,32 +382,66 @@ def lock_activity(plan, activity_id, user=None):
         plan.costs.collected += activity.costs.per_person
 
     # Update status of remaining activities to rejected
-    rejected_activities = [a for a in plan.activities 
-                        if a.activity_id != activity_id
-                        if a.status == 'proposed'
-                        and is_overlapped(a, activity)]
+    rejected_activities = [a for a in activity_index.for_plan(plan).conflicts(activity)
+                        if a.status == 'proposed']
     for act in rejected_activities:
         act.status = 'rejected'
+    return rejected_activities
 
-    try:
-        plan.save()
-    except Exception as e:
-        logger.exception("lock_activity save failed plan_id=%s activity_id=%s error=%s", plan.id, activity_id, str(e))
-        _audit_plan_event(user.id if user else plan.organizer.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:activity:{activity_id}:lock")
-        raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id if user else plan.organizer.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.SUCCESS, before=before, after=activity.to_dict(), idempotency_key=f"{plan.id}:activity:{activity_id}:lock")
+# TODO - Update lock activity to be agnostic to activity id since this may also be used by organizer
+def lock_activity(plan, activity_id, user=None):
+    if user and user != plan.organizer:
+        raise NotPlanOrganizer
+    
+    actor_id = user.id if user else plan.organizer.id
+    for attempt in range(MAX_WRITE_ATTEMPTS):
+        activity = get_activity(plan, activity_id)
+        if activity.status == 'confirmed':
+            # Confirmed by a concurrent request, its costs are already counted
+            logger.info("lock_activity already confirmed plan_id=%s activity_id=%s", plan.id, activity_id)
+            return activity
+        if not user and len(activity.votes) != len(plan.participants) + 1:
+            # Automatic finalization only while every member still votes for it
+            logger.info("lock_activity votes changed plan_id=%s activity_id=%s", plan.id, activity_id)
+            return activity
+        before = audit_service.snapshot(plan)
+        rejected = _confirm_activity(plan, activity)
+
+        try:
+            _save_plan(plan)
+            break
+        except PlanConflict:
+            # Votes or payments landed since the plan was loaded, recompute from the stored state
+            logger.info("lock_activity conflict plan_id=%s activity_id=%s attempt=%s", plan.id, activity_id, attempt)
+            if attempt == MAX_WRITE_ATTEMPTS - 1:
+                _audit_plan_event(actor_id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, "version conflict", idempotency_key=f"{plan.id}:activity:{activity_id}:lock")
+                raise
+            plan.reload()
+        except Exception as e:
+            logger.exception("lock_activity save failed plan_id=%s activity_id=%s error=%s", plan.id, activity_id, str(e))
+            _audit_plan_event(actor_id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:activity:{activity_id}:lock")
+            raise DatabaseError("Unexpected database error", details={"exception": str(e)})
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'activity:confirmed', actor_id, ('plan', 'activities'), [activity_id] + [a.activity_id for a in rejected])
+    _audit_plan_event(actor_id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:activity:{activity_id}:lock")
     return activity
 
 def add_participant(plan, user):
-    before = plan.to_dict()
-    plan.participants.append(user)
+    before = audit_service.snapshot(plan)
+    if user not in plan.participants:
+        plan.participants.append(user)
     try:
-        plan.save()
+        doc = _atomic_update(plan, {'$addToSet': {'participants': user.id}})
     except Exception as e:
         logger.exception("add_participant save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
-        _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:participant:{user.id}:add")
+        _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:participant:{user.id}:add")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:participant:{user.id}:add")
+    if doc is None:
+        raise PlanNotFound(plan.id)
+    plan_cache.invalidate(plan)
+    membership_cache.invalidate(plan.id)
+    publish_change(plan, 'member:joined', user.id, ('members',))
+    _audit_plan_event(user.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:participant:{user.id}:add")
     return plan
 
 def add_admin(plan, organizer, user):
@@ -257,17 +450,22 @@ def add_admin(plan, organizer, user):
     if user not in plan.participants:
         raise UserNotFound(user.id)
     
-    before = plan.to_dict()
-    if user not in plan.admins:
-        plan.participants.remove(user)
-        plan.admins.append(user)
+    before = audit_service.snapshot(plan)
+    plan.participants.remove(user)
+    plan.admins.append(user)
     try:
-        plan.save()
+        doc = _atomic_update(plan, {'$pull': {'participants': user.id}, '$addToSet': {'admins': user.id}}, query={'participants': user.id})
     except Exception as e:
         logger.exception("add_admin save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
-        _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:admin:{user.id}:add")
+        _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:admin:{user.id}:add")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:admin:{user.id}:add")
+    if doc is None: # Removed from the plan in the meantime
+        raise UserNotFound(user.id)
+    plan_cache.invalidate(plan)
+    membership_cache.invalidate(plan.id)
+    publish_change(plan, 'member:promoted', organizer.id, ('members',))
+    _evict_if_removed(plan, user.id) # A removal may have raced the role change
+    _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:admin:{user.id}:add")
     return plan
 
 def make_participant(plan, organizer, user):
@@ -275,27 +473,38 @@ def make_participant(plan, organizer, user):
         raise NotPlanOrganizer
     if user in plan.participants:
         return plan
-    before = plan.to_dict()
-    if user in plan.admins:
-        plan.admins.remove(user)
-        plan.participants.append(user)
+    if user not in plan.admins:
+        raise UserNotFound(user.id)
+    before = audit_service.snapshot(plan)
+    plan.admins.remove(user)
+    plan.participants.append(user)
     try:
-        plan.save()
+        doc = _atomic_update(plan, {'$pull': {'admins': user.id}, '$addToSet': {'participants': user.id}}, query={'admins': user.id})
     except Exception as e:
         logger.exception("make_participant save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
-        _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:admin:{user.id}:remove")
+        _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:admin:{user.id}:remove")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:admin:{user.id}:remove")
+    if doc is None: # Demoted or removed in the meantime
+        raise UserNotFound(user.id)
+    plan_cache.invalidate(plan)
+    membership_cache.invalidate(plan.id)
+    publish_change(plan, 'member:demoted', organizer.id, ('members',))
+    _evict_if_removed(plan, user.id) # A removal may have raced the role change
+    _audit_plan_event(organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:admin:{user.id}:remove")
     return plan
 
-def remove_participant(plan, organizer_id, participant_id):
-    if plan.organizer_id != organizer_id:
+def remove_participant(plan, organizer, participant_id):
+    if organizer != plan.organizer:
         raise NotPlanOrganizer
-    before = plan.to_dict()
-    if participant_id in plan.participant_ids:
-        plan.participant_ids.remove(participant_id)
+    organizer_id = organizer.id
+    before = audit_service.snapshot(plan)
     try:
-        plan.save()
+        participant_oid = ObjectId(participant_id)
+    except Exception:
+        raise UserNotFound(participant_id)
+    plan.participants = [p for p in plan.participants if p.id != participant_oid]
+    try:
+        doc = _atomic_update(plan, {'$pull': {'participants': participant_oid}}, query={'participants': participant_oid})
     except Exception as e:
         logger.exception(
             "remove_participant save failed plan_id=%s participant_id=%s error=%s",
@@ -303,55 +512,144 @@ def remove_participant(plan, organizer_id, participant_id):
             participant_id,
             str(e),
         )
-        _audit_plan_event(organizer_id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:participant:{participant_id}:remove")
+        _audit_plan_event(organizer_id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:participant:{participant_id}:remove")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(organizer_id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:participant:{participant_id}:remove")
+    if doc is None: # Not a participant, or removed in the meantime
+        raise UserNotFound(participant_id)
+    plan_cache.invalidate(plan)
+    membership_cache.invalidate(plan.id)
+    publish_change(plan, 'member:removed', organizer_id, ('members',))
+    _evict_if_removed(plan, participant_oid)
+    _audit_plan_event(organizer_id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:participant:{participant_id}:remove")
     return plan
 
+def _set_vote(plan, activity, user, add):
+    # Toggle the vote in place, then store the costs derived from the resulting vote count
+    op = '$addToSet' if add else '$pull'
+    doc = _atomic_update(
+        plan,
+        {op: {'activities.$.votes': user.id}},
+        query={'activities.activity_id': activity.activity_id},
+        projection={'activities': {'$elemMatch': {'activity_id': activity.activity_id}}},
+    )
+    if doc is None:
+        raise ActivityNotFound(activity.activity_id)
+
+    votes = doc['activities'][0].get('votes', [])
+    activity._data['votes'] = Activity._fields['votes'].to_python(votes)
+    update_activity_costs(activity)
+    # Skipped when another vote changed the count first, that writer stores the costs instead
+    _atomic_update(
+        plan,
+        {'$set': {'activities.$.costs': activity.costs.to_mongo()}},
+        query={'activities': {'$elemMatch': {'activity_id': activity.activity_id, 'votes': {'$size': len(votes)}}}},
+    )
+
 def vote_activity(plan, user, activity_id):
-    activity = next(
-        (a for a in plan.activities if a.activity_id == activity_id),
-        None)
-    if not activity:
-        raise ActivityNotFound
+    activity = get_activity(plan, activity_id)
     if user != plan.organizer and user not in plan.admins and user not in plan.participants:
-        raise UserNotAuthorized
+        raise UserNotAuthorized(user.id)
+    before = audit_service.snapshot(plan)
     
     # Update votes and costs
-    conflicting_activity = next((a for a in plan.activities 
-                           if a.activity_id != activity_id
+    conflicting_activity = next((a for a in activity_index.for_plan(plan).conflicts(activity)
                            if a.status == 'proposed'
-                           and user in a.votes
-                           and is_overlapped(a, activity)), None)
-    if conflicting_activity:
-        conflicting_activity.votes.remove(user)
-        update_activity_costs(conflicting_activity)
-    if user in activity.votes:
-        activity.votes.remove(user)
-    else:
-        activity.votes.append(user)
-    update_activity_costs(activity)
-    before = activity.to_dict()
+                           and user in a.votes), None)
     try:
-        plan.save()
+        if conflicting_activity:
+            _set_vote(plan, conflicting_activity, user, False)
+        _set_vote(plan, activity, user, user not in activity.votes)
+    except ActivityNotFound:
+        raise
     except Exception as e:
         logger.exception("vote_activity pre-save failed plan_id=%s activity_id=%s error=%s", plan.id, activity_id, str(e))
-        _audit_plan_event(user.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:activity:{activity_id}:vote:{user.id}")
+        _audit_plan_event(user.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:activity:{activity_id}:vote:{user.id}")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
 
     try:
         # Finalize activity if max votes are reached
         if len(activity.votes) == (len(plan.participants) + 1):
-            lock_activity(plan, activity_id)
-        else:
-            plan.save()
+            activity = lock_activity(plan, activity_id)
+    except PlanConflict:
+        # The vote is committed either way, a later vote or the organizer finalizes it
+        logger.warning("vote_activity lock gave up plan_id=%s activity_id=%s", plan.id, activity_id)
+        plan.reload()
+        activity = get_activity(plan, activity_id)
     except Exception as e:
         logger.exception("vote_activity save failed plan_id=%s activity_id=%s error=%s", plan.id, activity_id, str(e))
-        _audit_plan_event(user.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:activity:{activity_id}:vote:{user.id}")
+        _audit_plan_event(user.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:activity:{activity_id}:vote:{user.id}")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.SUCCESS, before=before, after=activity.to_dict(), idempotency_key=f"{plan.id}:activity:{activity_id}:vote:{user.id}")
+    plan_cache.invalidate(plan)
+    voted = [activity_id] + ([conflicting_activity.activity_id] if conflicting_activity else [])
+    publish_change(plan, 'activity:voted', user.id, ('activities',), voted)
+    _audit_plan_event(user.id, Resource.ACTIVITY, activity_id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:activity:{activity_id}:vote:{user.id}")
     return activity
 
+def _apply_votes(plan, user, votes):
+    """
+    Apply (activity_id, add) intents in order on the in-memory plan, the same way
+    consecutive vote_activity calls would: adding a vote drops the user's vote on any
+    overlapping proposed activity, so the last intent in the batch wins.
+    Returns the touched activities in the order they were first touched.
+    """
+    index = activity_index.for_plan(plan)
+    touched = {}
+    for activity_id, add in votes:
+        activity = get_activity(plan, activity_id)
+        if add:
+            for other in index.conflicts(activity):
+                if other.status == 'proposed' and user in other.votes:
+                    other.votes.remove(user)
+                    touched.setdefault(other.activity_id, other)
+            if user not in activity.votes:
+                activity.votes.append(user)
+        elif user in activity.votes:
+            activity.votes.remove(user)
+        touched.setdefault(activity.activity_id, activity)
+
+    for activity in touched.values():
+        update_activity_costs(activity)
+
+    # Finalize activities that now have every member's vote
+    members = len(plan.participants) + 1
+    for activity in list(touched.values()):
+        if activity.status == 'proposed' and len(activity.votes) == members:
+            for rejected in _confirm_activity(plan, activity):
+                touched.setdefault(rejected.activity_id, rejected)
+    return list(touched.values())
+
+def bulk_vote(plan, user, votes):
+    """
+    Cast and retract several votes in one write. `votes` is a list of
+    (activity_id, add) pairs; intents are idempotent, so a conflicting write is
+    retried by reapplying them over the reloaded plan.
+    """
+    if user != plan.organizer and user not in plan.admins and user not in plan.participants:
+        raise UserNotAuthorized(user.id)
+
+    for attempt in range(MAX_WRITE_ATTEMPTS):
+        before = audit_service.snapshot(plan)
+        touched = _apply_votes(plan, user, votes)
+        try:
+            _save_plan(plan)
+            break
+        except PlanConflict:
+            logger.info("bulk_vote conflict plan_id=%s user_id=%s attempt=%s", plan.id, user.id, attempt)
+            if attempt == MAX_WRITE_ATTEMPTS - 1:
+                _audit_plan_event(user.id, Resource.ACTIVITY, plan.id, Action.UPDATE, Status.FAILURE, "version conflict", idempotency_key=f"{plan.id}:votes:{user.id}:v{plan.version}")
+                raise
+            plan.reload()
+        except Exception as e:
+            logger.exception("bulk_vote save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
+            _audit_plan_event(user.id, Resource.ACTIVITY, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:votes:{user.id}:v{plan.version}")
+            raise DatabaseError("Unexpected database error", details={"exception": str(e)})
+
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'activity:voted', user.id, ('plan', 'activities'), [a.activity_id for a in touched])
+    _audit_plan_event(user.id, Resource.ACTIVITY, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:votes:{user.id}:v{plan.version}")
+    logger.info("bulk_vote plan_id=%s user_id=%s votes=%s touched=%s", plan.id, user.id, len(votes), len(touched))
+    return touched
+
 def update_activity_costs(activity):
     is_per_person = activity.costs.is_per_person
     votes = len(activity.votes)
@@ -365,70 +663,102 @@ def update_activity_costs(activity):
     
 
 def is_overlapped(act_a, act_b):
-    if act_a.start_time == act_b.start_time:
-        return True
-    # Actvity b start conflict
-    if act_b.start_time < act_a.end_time and act_b.start_time > act_a.start_time:
-        return True
-    # Actvity a start conflict
-    if act_a.start_time < act_b.end_time and act_a.start_time > act_b.start_time:
-        return True
-    
-    return False
+    # Open-ended activities (no end time) only occupy their start time
+    return activity_index.spans_overlap(*activity_index.activity_span(act_a), *activity_index.activity_span(act_b))
 
 def send_message(plan, user, message):
     message = Message(
+        plan_id=plan.id,
         sender=user,
         text=message
     )
-    plan.messages.append(message)
     try:
-        plan.save()
+        message.save()
     except Exception as e:
         logger.exception("send_message save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
         _audit_plan_event(user.id, Resource.MESSAGE, None, Action.CREATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:message:{user.id}:{message.timestamp.isoformat()}")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.MESSAGE, None, Action.CREATE, Status.SUCCESS, after=message.to_dict(), idempotency_key=f"{plan.id}:message:{user.id}:{message.timestamp.isoformat()}")
+    plan_cache.invalidate(plan)
+    _audit_plan_event(user.id, Resource.MESSAGE, message.id, Action.CREATE, Status.SUCCESS, after=audit_service.snapshot(message), idempotency_key=f"{plan.id}:message:{message.id}")
     return message
 
 def pay(plan, user):
-    if plan.status != 'locked':
-        raise UserNotAuthorized
-    before = plan.to_dict()
-    
-    for act in plan.activities:
-        if user in act.votes and user not in act.payments:
-            plan.costs.collected += act.costs.per_person
-            act.payments.append(user)
-
-    try:
-        plan.save()
-    except Exception as e:
-        logger.exception("pay save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
-        _audit_plan_event(user.id, Resource.GROUP_PURCHASE, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:payment:{user.id}")
-        raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(user.id, Resource.GROUP_PURCHASE, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:payment:{user.id}")
+    for attempt in range(MAX_WRITE_ATTEMPTS):
+        if plan.status != 'locked':
+            raise UserNotAuthorized(user.id)
+        before = audit_service.snapshot(plan)
+
+        paid = []
+        for act in plan.activities:
+            if user in act.votes and user not in act.payments:
+                plan.costs.collected += act.costs.per_person
+                act.payments.append(user)
+                paid.append(act)
+        if not paid:
+            break
+
+        try:
+            # Only charge for activities that are still unpaid, so a retried request can't double count
+            doc = _atomic_update(
+                plan,
+                {
+                    '$addToSet': {'activities.$[paid].payments': user.id},
+                    '$inc': {'costs.collected': sum(act.costs.per_person for act in paid)},
+                },
+                query={
+                    'status': 'locked',
+                    '$and': [
+                        {'activities': {'$elemMatch': {'activity_id': act.activity_id, 'votes': user.id, 'payments': {'$ne': user.id}}}}
+                        for act in paid
+                    ],
+                },
+                array_filters=[{'paid.activity_id': {'$in': [act.activity_id for act in paid]}}],
+            )
+        except Exception as e:
+            logger.exception("pay save failed plan_id=%s user_id=%s error=%s", plan.id, user.id, str(e))
+            _audit_plan_event(user.id, Resource.GROUP_PURCHASE, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:payment:{user.id}")
+            raise DatabaseError("Unexpected database error", details={"exception": str(e)})
+        if doc is not None:
+            break
+        # Status, votes or payments changed since the plan was loaded, charge from the stored state
+        logger.info("pay conflict plan_id=%s user_id=%s attempt=%s", plan.id, user.id, attempt)
+        if attempt == MAX_WRITE_ATTEMPTS - 1:
+            _audit_plan_event(user.id, Resource.GROUP_PURCHASE, plan.id, Action.UPDATE, Status.FAILURE, "version conflict", idempotency_key=f"{plan.id}:payment:{user.id}")
+            raise PlanConflict(plan.id)
+        plan.reload()
+
+    plan_cache.invalidate(plan)
+    if paid:
+        publish_change(plan, 'payment:made', user.id, ('plan', 'activities'), [act.activity_id for act in paid])
+    _audit_plan_event(user.id, Resource.GROUP_PURCHASE, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:payment:{user.id}")
     return plan
 
 
+def _member_ids(plan_id):
+    doc = Plan._get_collection().find_one({'_id': plan_id}, {'organizer': 1, 'admins': 1, 'participants': 1})
+    if not doc:
+        return None
+    return {str(uid) for uid in [doc.get('organizer')] + doc.get('admins', []) + doc.get('participants', [])}
+
 def is_member(plan_id, user):
-    plan = Plan.objects(id=plan_id).first()
-    if not plan:
-        return False
-    if user not in plan.participants and user != plan.organizer:
+    try:
+        oid = ObjectId(plan_id)
+    except Exception:
         return False
-    return True
+    return membership_cache.is_member(oid, user.id, lambda: _member_ids(oid))
 
 def update_image(plan, image):
-    before = plan.to_dict()
+    before = audit_service.snapshot(plan)
     plan.image = image
     plan.stock_image = None
 
     try:
-        plan.save()
+        _atomic_update(plan, {'$set': {'image': image.id}, '$unset': {'stock_image': ''}})
     except Exception as e:
         logger.exception("update_image save failed plan_id=%s image_id=%s error=%s", plan.id, image.id, str(e))
-        _audit_plan_event(plan.organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), before=before, idempotency_key=f"{plan.id}:image:update")
+        _audit_plan_event(plan.organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.FAILURE, str(e), idempotency_key=f"{plan.id}:image:update")
         raise DatabaseError("Unexpected database error", details={"exception": str(e)})
-    _audit_plan_event(plan.organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, before=before, after=plan.to_dict(), idempotency_key=f"{plan.id}:image:update")
+    plan_cache.invalidate(plan)
+    publish_change(plan, 'image:updated', plan.organizer.id, ('plan',))
+    _audit_plan_event(plan.organizer.id, Resource.TRIP, plan.id, Action.UPDATE, Status.SUCCESS, after=_plan_change(plan, before), idempotency_key=f"{plan.id}:image:update")
     return plan
@@ -0,0 +1,90 @@
+import heapq
+from app.schemas.plan_schema import _ref_id, _ref_ids
+from app.logger import get_logger
+
+# Who owes whom on a plan. The organizer fronts every confirmed activity and members
+# pay their share back through plan_service.pay(), so a member's balance is what they
+# have paid minus their share, and the organizer is owed whatever is still unpaid.
+# All amounts are integer cents so balances always sum to exactly zero.
+
+logger = get_logger(__name__)
+
+def to_cents(amount):
+    return int(round((amount or 0) * 100))
+
+def _shares(activity, voter_ids):
+    """Cents owed by each voter, matching update_activity_costs()."""
+    costs = activity.costs
+    if costs.is_per_person:
+        share = to_cents(costs.per_person)
+        return {uid: share for uid in voter_ids}
+    # Split the total, the leftover cents go to the first voters by id
+    base, remainder = divmod(to_cents(costs.total_cost), len(voter_ids))
+    ordered = sorted(voter_ids, key=str)
+    return {uid: base + (1 if i < remainder else 0) for i, uid in enumerate(ordered)}
+
+def compute_balances(plan):
+    """
+    Map of user id -> {'owed', 'paid', 'balance'} in cents over the confirmed
+    activities. One pass over each activity's voters using raw reference ids,
+    so no user documents are loaded however large the plan is.
+    """
+    organizer_id = _ref_id(plan._data.get('organizer'))
+    members = {uid: {'owed': 0, 'paid': 0, 'balance': 0}
+               for uid in [organizer_id] + _ref_ids(plan._data.get('admins')) + _ref_ids(plan._data.get('participants'))}
+
+    outstanding = 0
+    for activity in plan.activities:
+        if activity.status != 'confirmed':
+            continue
+        voter_ids = list(dict.fromkeys(_ref_ids(activity._data.get('votes'))))
+        if not voter_ids:
+            continue
+        payer_ids = set(_ref_ids(activity._data.get('payments')))
+        for uid, share in _shares(activity, voter_ids).items():
+            member = members.setdefault(uid, {'owed': 0, 'paid': 0, 'balance': 0})
+            member['owed'] += share
+            if uid in payer_ids or uid == organizer_id:
+                member['paid'] += share
+            else:
+                member['balance'] -= share
+                outstanding += share
+
+    members[organizer_id]['balance'] += outstanding
+    return members
+
+def settle(balances):
+    """
+    Transfers (from_id, to_id, cents) that zero out `balances` (id -> cents).
+    Greedily matches the largest debtor with the largest creditor, which needs at
+    most n - 1 transfers.
+    """
+    debtors = [(balance, str(uid), uid) for uid, balance in balances.items() if balance < 0]
+    creditors = [(-balance, str(uid), uid) for uid, balance in balances.items() if balance > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors and creditors:
+        debt, debtor_key, debtor = heapq.heappop(debtors)
+        credit, creditor_key, creditor = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append((debtor, creditor, amount))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_key, debtor))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_key, creditor))
+    return transfers
+
+def get_settlement(plan):
+    members = compute_balances(plan)
+    transfers = settle({uid: m['balance'] for uid, m in members.items()})
+    logger.info("get_settlement plan_id=%s members=%s transfers=%s", plan.id, len(members), len(transfers))
+    return {
+        'plan_id': str(plan.id),
+        'unit': 'cents',
+        'members': [{'user_id': str(uid), **m} for uid, m in members.items()],
+        'transfers': [{'from': str(debtor), 'to': str(creditor), 'amount': amount}
+                      for debtor, creditor, amount in transfers],
+        'outstanding': sum(amount for _, _, amount in transfers),
+    }
@@ -1,12 +1,82 @@
+import json
+import os
+import time
+import redis
+from bson import ObjectId
+from flask import g, has_app_context
 from app.models.user import User
 from app.errors import UserNotFound, DatabaseError
 from app.constants import USER_ALLOWED_FIELDS
 from app.constants import Resource, Status, Action
 from app.services import audit_service
+from app.extensions import cache
+from app.utils import make_etag
 from app.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Identity lookups only load what authorization and display need, and are cached
+# per request on flask.g, in process for a few seconds and optionally in Redis.
+IDENTITY_FIELDS = ('name', 'picture')
+IDENTITY_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "false").lower() == "true"
+
+_identities = {} # uid -> (expires_at, fields)
+
+def _request_cache():
+    if not has_app_context():
+        return {}
+    if 'user_cache' not in g:
+        g.user_cache = {}
+    return g.user_cache
+
+def _identity_key(uid):
+    return f"user:identity:{uid}"
+
+def _identity_from_fields(uid, fields):
+    return User._from_son({'_id': ObjectId(uid), **fields}, created=False)
+
+def invalidate_user(*uids):
+    uids = [str(uid) for uid in uids]
+    requests = _request_cache()
+    for uid in uids:
+        _identities.pop(uid, None)
+        requests.pop(('full', uid), None)
+        requests.pop(('identity', uid), None)
+    if IDENTITY_CACHE_REDIS and uids:
+        try:
+            cache.delete(*[_identity_key(uid) for uid in uids])
+        except redis.RedisError as e:
+            logger.warning("invalidate_user redis delete failed count=%s error=%s", len(uids), str(e))
+
+def _bump_version(user, profile_changed=False):
+    # GET /user bodies embed each mutual's name and picture, so those users change too
+    try:
+        User.objects(id=user.id).update_one(inc__version=1)
+        if profile_changed:
+            User.objects(mutuals=user.id).update(inc__version=1)
+    except Exception as e:
+        logger.warning("user version bump failed user_id=%s error=%s", user.id, str(e))
+
+def _profile_changed(before, user):
+    return before.get('name') != user.name or before.get('picture') != user.picture
+
+def user_etag(uid, version):
+    return make_etag('user', uid, version)
+
+def get_user_etag(uid):
+    """ETag of the GET /user body, from a projection of the version alone."""
+    try:
+        oid = ObjectId(uid)
+    except Exception:
+        raise UserNotFound(uid)
+    doc = User._get_collection().find_one({'_id': oid}, {'version': 1})
+    if not doc:
+        logger.warning("get_user_etag not found user_id=%s", uid)
+        raise UserNotFound(uid)
+    return user_etag(oid, doc.get('version', 0))
+
 def create_user(claims):
     user = User(
         auth0_id = str(claims['sub']),
@@ -78,6 +148,8 @@ def sync_user(user, claims):
         after=user.to_dict(),
         idempotency_key=str(user.id),
     )
+    _bump_version(user, _profile_changed(before, user))
+    invalidate_user(user.id)
     return {'success': user}
 
 def update_user(user, data):
@@ -115,13 +187,62 @@ def update_user(user, data):
         after=user.to_dict(),
         idempotency_key=str(user.id),
     )
+    _bump_version(user, _profile_changed(before, user))
+    invalidate_user(user.id)
     return user
 
 def get_user(uid):
+    """Full user document, cached for the rest of the request. Use for paths that save the user."""
+    uid = str(uid)
+    requests = _request_cache()
+    user = requests.get(('full', uid))
+    if user:
+        return user
+
     user = User.objects(id=uid).first()
     if not user:
         logger.warning("get_user not found user_id=%s", uid)
         raise UserNotFound(uid)
+    requests[('full', uid)] = user
+    return user
+
+def get_identity(uid):
+    """
+    Slim user (id, name, picture) for authorization and display only, never save() it.
+    Served from the request, process or Redis cache before falling back to Mongo.
+    """
+    uid = str(uid)
+    requests = _request_cache()
+    user = requests.get(('full', uid)) or requests.get(('identity', uid))
+    if user:
+        return user
+
+    now = time.time()
+    entry = _identities.get(uid)
+    fields = entry[1] if entry and entry[0] > now else None
+    if fields is None and IDENTITY_CACHE_REDIS:
+        try:
+            cached = cache.get(_identity_key(uid))
+            fields = json.loads(cached) if cached else None
+        except redis.RedisError as e:
+            logger.warning("get_identity redis read failed user_id=%s error=%s", uid, str(e))
+    if fields is None:
+        doc = User.objects(id=uid).only(*IDENTITY_FIELDS).as_pymongo().first()
+        if not doc:
+            logger.warning("get_identity not found user_id=%s", uid)
+            raise UserNotFound(uid)
+        fields = {field: doc.get(field) for field in IDENTITY_FIELDS}
+        if IDENTITY_CACHE_REDIS:
+            try:
+                cache.set(_identity_key(uid), json.dumps(fields), ex=IDENTITY_CACHE_TTL)
+            except redis.RedisError as e:
+                logger.warning("get_identity redis write failed user_id=%s error=%s", uid, str(e))
+
+    if len(_identities) >= IDENTITY_CACHE_SIZE:
+        _identities.clear()
+    _identities[uid] = (now + IDENTITY_CACHE_TTL, fields)
+    user = _identity_from_fields(uid, fields)
+    requests[('identity', uid)] = user
     return user
 
 def get_users(ids):
@@ -168,6 +289,7 @@ def add_plan(plan, user):
         after=user.to_dict(),
         idempotency_key=f"{user.id}:plan:{plan.id}:add",
     )
+    _bump_version(user)
     return user
 
 def add_mutuals(plan, user):
@@ -177,8 +299,8 @@ def add_mutuals(plan, user):
         if user in everyone:
             everyone.remove(user)
 
-        User.objects(id__in=[str(p.id) for p in everyone]).update(add_to_set__mutuals=user)
-        User.objects(id=user.id).update(add_to_set__mutuals=everyone)
+        User.objects(id__in=[str(p.id) for p in everyone]).update(add_to_set__mutuals=user, inc__version=1)
+        User.objects(id=user.id).update(add_to_set__mutuals=everyone, inc__version=1)
 
     except Exception as e:
         logger.exception("add_mutuals failed user_id=%s plan_id=%s error=%s", user.id, plan.id, str(e))
@@ -205,15 +327,15 @@ def add_mutuals(plan, user):
         after={"plan_id": str(plan.id)},
         idempotency_key=f"{user.id}:plan:{plan.id}:mutuals",
     )
+    invalidate_user(user.id, *[p.id for p in everyone])
     return user
 
 def remove_plan(plan, user):
     before = user.to_dict()
-    if plan.organizer_id != user.id:
-        user.participant_count -= 1
-    else:
+    if plan.organizer == user:
         user.hosting_count -= 1
-    user.plans.remove(plan.id)
+    else:
+        user.participating_count -= 1
 
     try:
         user.save()
@@ -242,4 +364,5 @@ def remove_plan(plan, user):
         after=user.to_dict(),
         idempotency_key=f"{user.id}:plan:{plan.id}:remove",
     )
+    _bump_version(user)
     return user
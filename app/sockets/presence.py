@@ -0,0 +1,100 @@
+import time
+import redis
+from app.extensions import cache, socketio
+from app.logger import get_logger
+
+# Room presence shared by every Socket.IO worker. Each plan room is a Redis sorted set
+# of "<user_id>:<sid>" connections scored by the time they expire. Every worker
+# refreshes the connections it holds in the background (Engine.IO already drops
+# sockets that stop answering pings), so only sockets of a crashed worker age out.
+
+PRESENCE_TTL = 60 # Seconds without a refresh before a connection is dropped
+PRESENCE_REFRESH_INTERVAL = PRESENCE_TTL / 3
+
+logger = get_logger(__name__)
+
+_local = {} # sid -> (plan_id, user_id) of the connections this worker holds
+
+def _key(plan_id):
+    return f"presence:plan:{plan_id}"
+
+def _member(user_id, sid):
+    return f"{user_id}:{sid}"
+
+def _count(pipe, plan_id, now):
+    pipe.zremrangebyscore(_key(plan_id), '-inf', now)
+    pipe.zrange(_key(plan_id), 0, -1)
+
+def _unique_users(members):
+    return len({m.rsplit(':', 1)[0] for m in members})
+
+def join(plan_id, user_id, sid):
+    """Register (or refresh) a connection and return the number of users in the room."""
+    _local[sid] = (plan_id, user_id)
+    now = time.time()
+    pipe = cache.pipeline()
+    pipe.zadd(_key(plan_id), {_member(user_id, sid): now + PRESENCE_TTL})
+    pipe.expire(_key(plan_id), PRESENCE_TTL * 2)
+    _count(pipe, plan_id, now)
+    return _unique_users(pipe.execute()[-1])
+
+def heartbeat(plan_id, user_id, sid):
+    """Refresh a connection still in the room, False if it left, expired or was evicted."""
+    pipe = cache.pipeline()
+    pipe.zscore(_key(plan_id), _member(user_id, sid))
+    pipe.zadd(_key(plan_id), {_member(user_id, sid): time.time() + PRESENCE_TTL}, xx=True)
+    return pipe.execute()[0] is not None
+
+def leave(plan_id, user_id, sid):
+    _local.pop(sid, None)
+    now = time.time()
+    pipe = cache.pipeline()
+    pipe.zrem(_key(plan_id), _member(user_id, sid))
+    _count(pipe, plan_id, now)
+    return _unique_users(pipe.execute()[-1])
+
+def sids(plan_id, user_id):
+    """Socket ids of the user's connections to the room, on any worker."""
+    prefix = f"{user_id}:"
+    return [m[len(prefix):] for m in cache.zrange(_key(plan_id), 0, -1) if m.startswith(prefix)]
+
+def evict(plan_id, user_id, sids):
+    """Drop the user's connections `sids` from the room and return the number of users left."""
+    for sid in sids:
+        _local.pop(sid, None)
+    pipe = cache.pipeline()
+    pipe.zrem(_key(plan_id), *[_member(user_id, sid) for sid in sids])
+    _count(pipe, plan_id, time.time())
+    return _unique_users(pipe.execute()[-1])
+
+def count(plan_id):
+    pipe = cache.pipeline()
+    _count(pipe, plan_id, time.time())
+    return _unique_users(pipe.execute()[-1])
+
+def refresh_local():
+    """
+    Push back the expiry of every connection held by this worker. Only existing
+    entries are updated, a connection evicted by another worker stays out.
+    """
+    entries = list(_local.items())
+    if not entries:
+        return 0
+    expires = time.time() + PRESENCE_TTL
+    pipe = cache.pipeline(transaction=False)
+    for sid, (plan_id, user_id) in entries:
+        pipe.zadd(_key(plan_id), {_member(user_id, sid): expires}, xx=True)
+        pipe.expire(_key(plan_id), PRESENCE_TTL * 2)
+    pipe.execute()
+    return len(entries)
+
+def _refresh_loop():
+    while True:
+        socketio.sleep(PRESENCE_REFRESH_INTERVAL)
+        try:
+            refresh_local()
+        except redis.RedisError as e:
+            logger.warning("presence refresh failed connections=%s error=%s", len(_local), str(e))
+
+def start_refresher():
+    return socketio.start_background_task(_refresh_loop)
@@ -1,14 +1,14 @@
 from flask import current_app, request, session
 from flask_socketio import emit, join_room, leave_room, disconnect
 from flask_jwt_extended import decode_token, jwt_required, get_jwt_identity, verify_jwt_in_request
-from app.services import plan_service, user_service
+from app.services import plan_service, user_service, message_service
 from app.errors import AppError, Unauthorized, Forbidden
 from app.extensions import socketio
-from collections import defaultdict
+from app.sockets import presence
 from app.logger import get_logger
+from app.constants import MESSAGE_PAGE_SIZE
 
 MAX_MESSAGE_LENGTH = 2000
-active_users = defaultdict(set)
 logger = get_logger(__name__)
 
 @socketio.on("connect")
@@ -33,7 +33,7 @@ def join_plan(data):
             logger.warning("socket join missing auth or plan_id")
             emit("auth:error", {"code": "unauthorized"})
             return
-        user = user_service.get_user(uid)
+        user = user_service.get_identity(uid)
         if not plan_service.is_member(plan_id, user):
             logger.warning("socket join forbidden user_id=%s plan_id=%s", uid, plan_id)
             emit("error", {"code": "forbidden"})
@@ -42,9 +42,8 @@ def join_plan(data):
         room = f"plan:{plan_id}"
         join_room(room) 
 
-        active_users[plan_id].add(uid)
         session['plan_id'] = plan_id
-        emit('plan:users', {'msg': len(active_users[plan_id])}, room=room)
+        emit('plan:users', {'msg': presence.join(plan_id, uid, request.sid)}, room=room)
         emit('plan:announcement', {'msg': f'{user.name} has joined the chat! 🤙'}, room=room)
         logger.info("socket join user_id=%s plan_id=%s", uid, plan_id)
 
@@ -66,16 +65,11 @@ def leave_plan(data):
             emit("auth:error", {"code": "unauthorized"})
             return
         
-        user = user_service.get_user(uid)
+        user = user_service.get_identity(uid)
         room = f"plan:{plan_id}"
         leave_room(room)
 
-        active_users[plan_id].remove(uid)
-        if len(active_users[plan_id]) == 0:
-            emit('plan:users', {'msg': 0}, room=room)
-            del active_users[plan_id]
-        else:
-            emit('plan:users', {'msg': len(active_users[plan_id]) }, room=room)
+        emit('plan:users', {'msg': presence.leave(plan_id, uid, request.sid)}, room=room)
         if session.get('plan_id'): 
             del session['plan_id']
 
@@ -98,26 +92,79 @@ def on_disconnect():
     if user_id and plan_id:
         del session['plan_id']
         del session['user_id']
-        active_users[plan_id].remove(user_id)
-        if len(active_users[plan_id]) == 0:
-            del active_users[plan_id]
+        try:
+            emit('plan:users', {'msg': presence.leave(plan_id, user_id, request.sid)}, room=f"plan:{plan_id}")
+        except Exception as e:
+            # The presence TTL cleans the connection up if Redis is unreachable here
+            logger.warning("socket presence cleanup failed user_id=%s plan_id=%s error=%s", user_id, plan_id, str(e))
         logger.info("socket disconnected user_id=%s plan_id=%s", user_id, plan_id)
 
-def broadcast_event(event_name, payload):
-    emit(event_name, )
+@socketio.on("plan:heartbeat")
+def heartbeat(data=None):
+    uid = session.get('user_id')
+    plan_id = session.get('plan_id')
+    if not uid or not plan_id:
+        return
+    if presence.heartbeat(plan_id, uid, request.sid):
+        return
+    user = user_service.get_identity(uid)
+    if plan_service.is_member(plan_id, user):
+        presence.join(plan_id, uid, request.sid) # Expired while Redis was unreachable
+        return
+    # Removed from the plan, possibly racing the eviction in evict_user
+    leave_room(f"plan:{plan_id}")
+    presence.leave(plan_id, uid, request.sid)
+    del session['plan_id']
+    emit('plan:removed', {'plan_id': plan_id})
+
+def broadcast_event(plan_id, event_name, payload):
+    """
+    Emit to the plan room from any context, REST requests included. With the
+    Redis message queue the event reaches sockets held by every worker.
+    """
+    try:
+        socketio.emit(event_name, payload, room=f"plan:{plan_id}")
+    except Exception as e:
+        logger.warning("socket broadcast failed plan_id=%s event=%s error=%s", plan_id, event_name, str(e))
+
+def evict_user(plan_id, user_id):
+    """
+    Take the user's sockets out of the plan room on whichever worker holds them,
+    once they're no longer a member, and tell those sockets with plan:removed.
+    """
+    room = f"plan:{plan_id}"
+    try:
+        sids = presence.sids(plan_id, user_id)
+        for sid in sids:
+            socketio.server.leave_room(sid, room, namespace='/')
+            socketio.emit('plan:removed', {'plan_id': str(plan_id)}, to=sid)
+        if sids:
+            socketio.emit('plan:users', {'msg': presence.evict(plan_id, user_id, sids)}, room=room)
+        logger.info("socket evict plan_id=%s user_id=%s sockets=%s", plan_id, user_id, len(sids))
+    except Exception as e:
+        logger.warning("socket evict failed plan_id=%s user_id=%s error=%s", plan_id, user_id, str(e))
 
 @socketio.on("plan:message:send")
 def send_message(data):
+    """
+    Broadcast first, persist after: the message gets its id here and is stored by
+    the app's MessageWriter. The return value acks the sender with that id; if the
+    write later fails this socket alone receives plan:message:failed for it.
+    """
+    plan_id = None
     try:
         uid = session.get('user_id')
         if not uid:
             logger.warning("socket message missing auth")
             emit("error", {"code": "unauthorized"})
             return
-        user = user_service.get_user(uid)
+        user = user_service.get_identity(uid)
 
         plan_id = data.get('plan_id')
-        plan = plan_service.get_plan(plan_id, user)
+        if not plan_service.is_member(plan_id, user):
+            logger.warning("socket message forbidden user_id=%s plan_id=%s", uid, plan_id)
+            emit("error", {"code": "forbidden"})
+            return
         
         room = f"plan:{plan_id}"
         msg = data.get('message')
@@ -130,9 +177,19 @@ def send_message(data):
             emit("error", {"code": "Message length too long"})
             return
 
-        message = plan_service.send_message(plan, user, msg)
-        emit("plan:message:new", message.to_dict(), room=room)
-        logger.info("socket message sent user_id=%s plan_id=%s", uid, plan_id)
+        client_id = data.get('client_id')
+        doc = message_service.new_message(plan_id, user, msg)
+        if not current_app.message_writer.submit(doc, client_id, request.sid):
+            emit("error", {
+                "event": "send_message",
+                "error": "busy",
+                "message": "Chat is busy, try again",
+                "client_id": client_id
+            })
+            return
+        emit("plan:message:new", {**message_service.message_payload(doc, user), 'client_id': client_id}, room=room)
+        logger.info("socket message sent user_id=%s plan_id=%s message_id=%s", uid, plan_id, doc['_id'])
+        return {'id': str(doc['_id']), 'client_id': client_id}
     except AppError as e:
         logger.warning(
             "socket message app_error code=%s user_id=%s plan_id=%s",
@@ -153,6 +210,32 @@ def send_message(data):
             "message": "Unexpected server error"
         })
 
+@socketio.on("plan:messages:fetch")
+def fetch_messages(data):
+    try:
+        uid = session.get('user_id')
+        if not uid:
+            logger.warning("socket fetch messages missing auth")
+            emit("error", {"code": "unauthorized"})
+            return
+        user = user_service.get_identity(uid)
+
+        plan_id = data.get('plan_id')
+        plan_service.get_plan_version(plan_id, user) # Authorizes without loading the plan
+
+        messages, next_cursor = message_service.get_messages(plan_id, data.get('cursor'), data.get('limit', MESSAGE_PAGE_SIZE))
+        emit("plan:messages:page", {
+            "messages": [message.to_dict() for message in messages],
+            "next_cursor": next_cursor
+        })
+    except AppError as e:
+        logger.warning("socket fetch messages app_error code=%s user_id=%s", e.error_code, uid)
+        emit("error", {
+            "event": "fetch_messages",
+            "error": e.error_code,
+            "message": e.message
+        })
+
 @socketio.on_error_default
 def socket_error_handler(e):
     if isinstance(e, AppError):
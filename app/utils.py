@@ -1,17 +1,16 @@
-import requests
+import hashlib
 from jose import jwt
-from flask import request, abort
+from flask import request, abort, Response
 from dateutil import parser
 from app.errors import ValidationError
 from datetime import timezone, datetime
+from bson import ObjectId
+from app.services import jwks
 
 AUTH0_DOMAIN = "dev-2a6jhuwy5dxkqin0.us.auth0.com"
 AUTH0_AUDIENCE = "https://api.yourapp.com" # TODO - Update audience
 AUTH0_ALGORITHMS = ["RS256"]
 
-JWKS_URL = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
-jwks = requests.get(JWKS_URL).json()
-
 
 def get_auth0_token():
     auth = request.headers.get("Authorization", None)
@@ -33,16 +32,20 @@ def verify_auth0_jwt():
     except Exception:
         abort(401, "Invalid token header")
 
+    try:
+        key = jwks.get_provider(AUTH0_DOMAIN).get_key(unverified_header.get("kid"))
+    except Exception:
+        abort(503, "Signing keys unavailable")
+
     rsa_key = None
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"],
-            }
+    if key:
+        rsa_key = {
+            "kty": key["kty"],
+            "kid": key["kid"],
+            "use": key["use"],
+            "n": key["n"],
+            "e": key["e"],
+        }
 
     if not rsa_key:
         abort(401, "Unable to find signing key")
@@ -82,3 +85,31 @@ def _naive_utc(dt):
     if dt.tzinfo is None:
         return dt
     return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def encode_cursor(timestamp, oid):
+    return f"{timestamp.isoformat()}_{oid}"
+
+def decode_cursor(cursor):
+    """Split a keyset cursor back into its (timestamp, ObjectId) sort key."""
+    try:
+        timestamp, oid = cursor.rsplit('_', 1)
+        return parser.isoparse(timestamp), ObjectId(oid)
+    except Exception as e:
+        raise ValidationError("Invalid cursor", details={"cursor": cursor, "exception": str(e)})
+
+def make_etag(*parts):
+    """Strong ETag (unquoted) from everything a response body depends on."""
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+
+def not_modified(etag):
+    """A 304 if the client's If-None-Match already holds `etag`, else None."""
+    if etag and request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+def with_etag(response, etag):
+    # no-cache: clients may store the body but must revalidate before reusing it
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
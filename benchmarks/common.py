@@ -0,0 +1,128 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies, elapsed, errors=0):
+    """Latency percentiles (ms) and throughput for one scenario, latencies in seconds."""
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'count': len(values),
+        'errors': errors,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'max_ms': ms(values[-1]) if values else None,
+        'throughput_per_s': round(len(values) / elapsed, 2) if elapsed else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def write_report(path, suite, config, results):
+    report = {
+        'suite': suite,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'config': config,
+        'results': results,
+    }
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def print_results(results, columns):
+    print(f"{'scenario':<32}" + ''.join(f"{c:>16}" for c in columns))
+    for name, stats in results.items():
+        print(f"{name:<32}" + ''.join(f"{'' if stats.get(c) is None else stats[c]:>16}" for c in columns))
+
+def compare(baseline_path, results, columns):
+    """Print each metric next to the baseline run with its relative change."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\ncompared to {baseline_path}")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        changes = []
+        for column in columns:
+            before, after = old.get(column), stats.get(column)
+            if before and after is not None:
+                changes.append(f"{column} {before} -> {after} ({(after - before) / before:+.1%})")
+        print(f"  {name}: " + ', '.join(changes))
+
+# Every benchmark that boots the app points it at local stand-ins. Values are forced
+# (override with BENCH_<NAME>) so a developer .env can never aim a run at production.
+BENCH_ENV = {
+    'ENV': 'benchmark',
+    'MONGO_URI': 'mongodb://localhost:27017/plansly_bench',
+    'REDIS_HOST': 'localhost',
+    'SOCKETIO_MESSAGE_QUEUE': '', # Single process, no Redis fan-out
+    'PGHOST': 'localhost',
+    'PGPORT': '5432',
+    'PGDATABASE': 'plansly_bench',
+    'PGUSER': 'postgres',
+    'PGPASSWORD': 'postgres',
+    'PGSSLMODE': 'disable',
+    'AWS_S3_BUCKET_NAME': 'plansly-bench',
+    'AWS_REGION_NAME': 'us-west-1',
+    'AWS_ACCESS_KEY_ID': 'bench',
+    'AWS_SECRET_ACCESS_KEY': 'bench',
+    'AUTH0_DOMAIN': 'localhost',
+    'AUTH0_CLIENT_ID': 'bench',
+    'AUTH0_SECRET_KEY': 'bench-secret',
+    'FRONTEND_URL': 'http://localhost:3000',
+}
+
+def bench_app(reset=True):
+    """create_app() against the local stand-ins, optionally starting from an empty database."""
+    for name, default in BENCH_ENV.items():
+        os.environ[name] = os.getenv(f"BENCH_{name}", default)
+
+    from app import create_app
+    from mongoengine.connection import get_db
+
+    app = create_app()
+    app.testing = True
+    if reset:
+        db = get_db()
+        if 'bench' not in db.name:
+            raise RuntimeError(f"refusing to reset database {db.name!r}, its name must contain 'bench'")
+        db.client.drop_database(db.name)
+        from app.index_check import MODELS
+        for model in MODELS:
+            model.ensure_indexes()
+    return app
+
+def bench_pg_dsn():
+    """DSN of the local Postgres stand-in, built from BENCH_ENV like bench_app() does."""
+    value = lambda name: os.getenv(f"BENCH_{name}", BENCH_ENV[name])
+    if 'bench' not in value('PGDATABASE'):
+        raise RuntimeError(f"refusing to write to database {value('PGDATABASE')!r}, its name must contain 'bench'")
+    return (f"postgresql://{value('PGUSER')}:{value('PGPASSWORD')}@{value('PGHOST')}:{value('PGPORT')}"
+            f"/{value('PGDATABASE')}?sslmode={value('PGSSLMODE')}")
+
+def access_token(app, user_id):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return create_access_token(identity=str(user_id))
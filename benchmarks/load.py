@@ -0,0 +1,216 @@
+"""
+End-to-end load suite for the hot HTTP and socket paths.
+
+Boots the app against local Mongo, Postgres and Redis (see common.BENCH_ENV, e.g.
+`docker run -p 27017:27017 mongo`, `-p 6379:6379 redis`, `-p 5432:5432 postgres`),
+seeds a synthetic plan and drives it through the Flask and Socket.IO test clients.
+The sync rows compare the GET traffic members need to keep up with a plan by
+polling against following the plan:* deltas pushed to the plan room.
+
+    python -m benchmarks.load --members 50 --activities 40 --messages 500 \\
+        --iterations 300 --out benchmarks/results/load.json --compare old.json
+"""
+import eventlet
+eventlet.monkey_patch(thread=False)
+
+import argparse
+import json
+import random
+import sys
+import time
+from benchmarks.common import bench_app, access_token, summarize, write_report, print_results, compare
+from benchmarks.seed import seed_plan
+
+COLUMNS = ('count', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s')
+SYNC_COLUMNS = ('writes', 'gets', 'get_kb', 'events', 'event_kb', 'elapsed_s')
+
+def run_scenario(iterations, warmup, call):
+    """Time `call(i)` `iterations` times after `warmup` untimed calls, call returns success."""
+    for i in range(warmup):
+        call(i)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        t0 = time.perf_counter()
+        ok = call(i)
+        latencies.append(time.perf_counter() - t0)
+        errors += 0 if ok else 1
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+def http_scenarios(app, data, tokens):
+    client = app.test_client()
+    plan_id = data['plan_id']
+    members = data['member_ids']
+    auth = lambda uid: {'Authorization': f"Bearer {tokens[uid]}"}
+    organizer = data['organizer_id']
+
+    def list_plans(i):
+        return client.get('/plan', headers=auth(organizer)).status_code == 200
+
+    def get_plan(i):
+        return client.get(f'/plan/{plan_id}', headers=auth(members[i % len(members)])).status_code == 200
+
+    def vote(i):
+        activity_id = random.choice(data['activity_ids'])
+        uid = members[i % len(members)]
+        return client.put(f'/plan/{plan_id}/activity/{activity_id}/vote', headers=auth(uid)).status_code == 200
+
+    def create_activity(i):
+        body = {
+            'name': f"Load activity {i}",
+            'cost': 25.0,
+            'start_time': f"2031-01-{1 + i % 28:02d}T{i % 24:02d}:00:00+00:00",
+            'end_time': f"2031-01-{1 + i % 28:02d}T{i % 24:02d}:30:00+00:00",
+        }
+        return client.post(f'/plan/{plan_id}/activity', json=body, headers=auth(organizer)).status_code == 200
+
+    outsiders = iter(data['outsider_ids'])
+    def accept_invite(i):
+        uid = next(outsiders)
+        response = client.post(f"/plan/{plan_id}/invite/{data['invite_id']}/accept", headers=auth(uid))
+        return response.status_code == 200
+
+    return {
+        'GET /plan': list_plans,
+        'GET /plan/<id>': get_plan,
+        'PUT vote': vote,
+        'POST activity': create_activity,
+        'POST accept invite': accept_invite,
+    }
+
+def socket_scenario(app, data, tokens):
+    from app.extensions import socketio
+
+    uid = data['member_ids'][-1]
+    client = app.test_client()
+    client.set_cookie('access_token_cookie', tokens[uid])
+    sio = socketio.test_client(app, flask_test_client=client)
+    sio.emit('plan:join', {'plan_id': data['plan_id']})
+    sio.get_received()
+
+    def send_message(i):
+        # The ack arrives once the server has broadcast the message
+        ack = sio.emit('plan:message:send', {'plan_id': data['plan_id'], 'message': f"load {i}", 'client_id': str(i)}, callback=True)
+        sio.get_received()
+        return bool(ack and ack.get('id'))
+
+    return {'socket plan:message:send': send_message}, sio
+
+def sync_traffic(app, data, tokens, writes, viewers):
+    """
+    What it costs `viewers` members to keep up with `writes` votes by someone else.
+    poll: every viewer refetches GET /plan/<id> after each write, the least a
+    polling client can do. push: viewers hold plan room sockets and apply the
+    plan:* deltas, falling back to a GET only on a bare plan:changed.
+    """
+    from app.extensions import socketio
+
+    plan_id = data['plan_id']
+    watchers = data['member_ids'][:viewers]
+    voter = data['member_ids'][-1]
+    auth = lambda uid: {'Authorization': f"Bearer {tokens[uid]}"}
+    client = app.test_client()
+    size = lambda payload: len(json.dumps(payload, default=str))
+
+    def vote(i):
+        activity_id = data['activity_ids'][i % len(data['activity_ids'])]
+        client.put(f'/plan/{plan_id}/activity/{activity_id}/vote', headers=auth(voter))
+
+    results = {}
+    gets = get_bytes = 0
+    started = time.perf_counter()
+    for i in range(writes):
+        vote(i)
+        for uid in watchers:
+            response = client.get(f'/plan/{plan_id}', headers=auth(uid))
+            gets += 1
+            get_bytes += len(response.data)
+    results['sync poll'] = {'writes': writes, 'gets': gets, 'get_kb': round(get_bytes / 1024, 1),
+                            'events': 0, 'event_kb': 0.0, 'elapsed_s': round(time.perf_counter() - started, 3)}
+
+    sockets = []
+    for uid in watchers:
+        http = app.test_client()
+        http.set_cookie('access_token_cookie', tokens[uid])
+        sio = socketio.test_client(app, flask_test_client=http)
+        sio.emit('plan:join', {'plan_id': plan_id})
+        sio.get_received()
+        sockets.append((uid, sio))
+
+    gets = get_bytes = events = event_bytes = 0
+    started = time.perf_counter()
+    for i in range(writes):
+        vote(i)
+        for uid, sio in sockets:
+            for packet in sio.get_received():
+                if packet['name'] == 'plan:changed':
+                    response = client.get(f'/plan/{plan_id}', headers=auth(uid))
+                    gets += 1
+                    get_bytes += len(response.data)
+                elif packet['name'].startswith('plan:') and packet['name'] not in ('plan:users', 'plan:announcement'):
+                    events += 1
+                    event_bytes += size(packet['args'])
+    results['sync push'] = {'writes': writes, 'gets': gets, 'get_kb': round(get_bytes / 1024, 1),
+                            'events': events, 'event_kb': round(event_bytes / 1024, 1), 'elapsed_s': round(time.perf_counter() - started, 3)}
+    for _, sio in sockets:
+        sio.disconnect()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=20)
+    parser.add_argument('--activities', type=int, default=30)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--plans', type=int, default=20, help="extra plans on the organizer's dashboard")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--sync-writes', type=int, default=50, help='writes in the poll vs push comparison')
+    parser.add_argument('--sync-viewers', type=int, default=10, help='members keeping up with those writes')
+    parser.add_argument('--only', action='append', help='run only scenarios containing this text')
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to diff against')
+    args = parser.parse_args(argv)
+
+    app = bench_app()
+    with app.app_context():
+        data = seed_plan(
+            members=args.members,
+            activities=args.activities,
+            messages=args.messages,
+            outsiders=args.iterations + args.warmup,
+            extra_plans=args.plans,
+        )
+    tokens = {uid: access_token(app, uid) for uid in data['member_ids'] + data['outsider_ids']}
+
+    scenarios = http_scenarios(app, data, tokens)
+    socket_calls, sio = socket_scenario(app, data, tokens)
+    scenarios.update(socket_calls)
+
+    results = {}
+    for name, call in scenarios.items():
+        if args.only and not any(o in name for o in args.only):
+            continue
+        results[name] = run_scenario(args.iterations, args.warmup, call)
+        print(f"done {name}", file=sys.stderr)
+    sio.disconnect()
+
+    sync = {}
+    if not args.only or any('sync' in o for o in args.only):
+        sync = sync_traffic(app, data, tokens, args.sync_writes, min(args.sync_viewers, args.members - 1))
+        print("done sync", file=sys.stderr)
+    app.message_writer.stop()
+
+    config = {k: getattr(args, k) for k in ('members', 'activities', 'messages', 'plans', 'iterations', 'warmup', 'sync_writes', 'sync_viewers')}
+    write_report(args.out, 'load', config, {**results, **sync})
+    print_results(results, COLUMNS)
+    if sync:
+        print()
+        print_results(sync, SYNC_COLUMNS)
+    if args.compare:
+        compare(args.compare, results, ('p50_ms', 'p99_ms', 'throughput_per_s'))
+        compare(args.compare, sync, ('gets', 'get_kb'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
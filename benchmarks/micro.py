@@ -0,0 +1,232 @@
+"""
+Microbenchmarks for serializers and the pure service functions that run on every
+request, parameterized by data size. Each benchmark reports the best and median
+time per call (timeit autorange) plus, from one tracemalloc-traced call, the peak
+traced memory and the blocks/bytes still allocated afterwards.
+
+Serializers dereference users, so the suite boots the app against the local
+stand-ins (see common.BENCH_ENV); the audit writer benchmark opens its own pool
+on the local Postgres (common.bench_pg_dsn) and needs the audit.events table there.
+
+    python -m benchmarks.micro --sizes 10,100,1000 --out benchmarks/results/micro.json
+    python -m benchmarks.micro --only settlement --only interval
+"""
+import argparse
+import gc
+import json
+import random
+import statistics
+import sys
+import timeit
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from benchmarks.common import bench_app, bench_pg_dsn, write_report, print_results, compare
+from benchmarks.seed import seed_plan, make_activity
+
+COLUMNS = ('best_us', 'median_us', 'peak_kib', 'net_blocks', 'net_kib')
+
+BENCHMARKS = [] # (name, sized, factory); factory(size) does the setup and returns the callable to time
+
+def benchmark(name, sized=True):
+    def register(factory):
+        BENCHMARKS.append((name, sized, factory))
+        return factory
+    return register
+
+def measure(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    per_call = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'lineno')
+
+    return {
+        'number': number,
+        'best_us': round(min(per_call) * 1e6, 3),
+        'median_us': round(statistics.median(per_call) * 1e6, 3),
+        'peak_kib': round((peak - baseline) / 1024, 2),
+        'net_blocks': sum(s.count_diff for s in stats),
+        'net_kib': round(sum(s.size_diff for s in stats) / 1024, 2),
+    }
+
+# ===== Fixtures =====
+
+def _in_memory_plan(size, status='proposed'):
+    """Plan built from a raw document: `size` members and activities, no database reads."""
+    from app.models.plan import Plan
+
+    members = [ObjectId() for _ in range(size)]
+    start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    activities = []
+    for _ in range(size):
+        activity = make_activity(random.choice(members), start + timedelta(hours=random.randint(0, 24 * 30)),
+                                 random.sample(members, random.randint(1, len(members))))
+        activity['status'] = status
+        activity['payments'] = random.sample(activity['votes'], len(activity['votes']) // 2)
+        activities.append(activity)
+    return Plan._from_son({
+        '_id': ObjectId(), 'type': 'trip', 'status': 'locked', 'organizer': members[0],
+        'participants': members[1:], 'admins': [], 'activities': activities,
+        'costs': {'total': 0.0, 'per_person': 0.0, 'collected': 0.0}, 'version': 1,
+    })
+
+_seeded = {}
+def _seeded_plan(size):
+    """A stored plan (size members and activities) loaded the way routes load it."""
+    from app.services import plan_service
+    if size not in _seeded:
+        _seeded[size] = seed_plan(members=size, activities=size, messages=50)['plan_id']
+    return plan_service.get_plan(_seeded[size])
+
+# ===== Serializers =====
+
+@benchmark('Plan.to_dict')
+def plan_to_dict(size):
+    plan = _seeded_plan(size)
+    return plan.to_dict
+
+@benchmark('Activity.to_dict')
+def activity_to_dict(size):
+    activity = max(_seeded_plan(size).activities, key=lambda a: len(a._data.get('votes') or []))
+    return activity.to_dict
+
+@benchmark('User.to_dict', sized=False)
+def user_to_dict(size):
+    from app.models.user import User
+    user = User.objects.first()
+    return user.to_dict
+
+# ===== Service functions =====
+
+@benchmark('is_overlapped scan')
+def overlap_scan(size):
+    from app.services.plan_service import is_overlapped
+    plan = _in_memory_plan(size)
+    target = plan.activities[0]
+    return lambda: [a for a in plan.activities if is_overlapped(a, target)]
+
+@benchmark('interval_index.build')
+def interval_build(size):
+    from app.services.activity_index import ActivityIntervalIndex
+    plan = _in_memory_plan(size)
+    return lambda: ActivityIntervalIndex(plan.activities)
+
+@benchmark('interval_index.conflicts')
+def interval_conflicts(size):
+    from app.services.activity_index import ActivityIntervalIndex
+    plan = _in_memory_plan(size)
+    index = ActivityIntervalIndex(plan.activities)
+    target = plan.activities[0]
+    return lambda: index.conflicts(target)
+
+@benchmark('update_activity_costs')
+def activity_costs(size):
+    from app.services.plan_service import update_activity_costs
+    activity = max(_seeded_plan(size).activities, key=lambda a: len(a._data.get('votes') or []))
+    len(activity.votes) # Dereference once, as the vote path has by the time costs update
+    return lambda: update_activity_costs(activity)
+
+@benchmark('normalize_args', sized=False)
+def normalize(size):
+    from app.utils import normalize_args
+    from app.constants import ACTIVITY_ALLOWED_FIELDS
+    payload = {
+        'name': 'Dinner', 'description': 'Tapas', 'link': 'https://example.com', 'cost': '42.5',
+        'is_cost_per_person': 'true', 'start_time': '2031-01-01T19:00:00+00:00',
+        'end_time': '2031-01-01T21:00:00+00:00', 'country': 'ES', 'city': 'Madrid', 'state': 'MD',
+    }
+    return lambda: normalize_args(ACTIVITY_ALLOWED_FIELDS, dict(payload))
+
+@benchmark('audit payload json.dumps')
+def audit_payload(size):
+    from app.services import audit_service
+    plan = _in_memory_plan(size)
+    before = audit_service.snapshot(plan)
+    plan.activities[0]._data['votes'].append(ObjectId())
+    plan.costs.collected += 10
+    change = {'plan_id': str(plan.id), 'version': 2, 'diff': audit_service.diff(before, audit_service.snapshot(plan))}
+    return lambda: json.dumps(change)
+
+@benchmark('audit snapshot+diff')
+def audit_diff(size):
+    from app.services import audit_service
+    plan = _in_memory_plan(size)
+    before = audit_service.snapshot(plan)
+    return lambda: audit_service.diff(before, audit_service.snapshot(plan))
+
+@benchmark('settlement.compute_balances')
+def settlement_balances(size):
+    from app.services import settlement_service
+    plan = _in_memory_plan(size, status='confirmed')
+    return lambda: settlement_service.compute_balances(plan)
+
+@benchmark('settlement.settle')
+def settlement_settle(size):
+    from app.services import settlement_service
+    plan = _in_memory_plan(size, status='confirmed')
+    balances = {uid: m['balance'] for uid, m in settlement_service.compute_balances(plan).items()}
+    return lambda: settlement_service.settle(balances)
+
+_pg_pool = None
+def _bench_pg_pool():
+    global _pg_pool
+    if _pg_pool is None:
+        from psycopg_pool import ConnectionPool
+        _pg_pool = ConnectionPool(conninfo=bench_pg_dsn(), min_size=1, max_size=4, timeout=10)
+    return _pg_pool
+
+@benchmark('AuditWriter submit+drain')
+def audit_writer(size):
+    from app.services.audit_service import AuditWriter
+    pool = _bench_pg_pool()
+
+    def run():
+        writer = AuditWriter(pool, flush_interval=0.01)
+        writer.start()
+        for _ in range(size):
+            key = str(uuid.uuid4())
+            writer.submit(('bench', 'trip', key, 'update', 'success', None, None, '{"diff": {}}', None, key))
+        writer.stop()
+    return run
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000', help='comma separated data sizes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', help='run only benchmarks containing this text')
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to diff against')
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    random.seed(1)
+    app = bench_app()
+    results = {}
+    with app.test_request_context():
+        for name, sized, factory in BENCHMARKS:
+            if args.only and not any(o.lower() in name.lower() for o in args.only):
+                continue
+            for size in sizes if sized else [None]:
+                label = f"{name}[{size}]" if sized else name
+                results[label] = measure(factory(size), args.repeat)
+                print(f"done {label}", file=sys.stderr)
+
+    write_report(args.out, 'micro', {'sizes': sizes, 'repeat': args.repeat}, results)
+    print_results(results, COLUMNS)
+    if args.compare:
+        compare(args.compare, results, ('best_us', 'peak_kib'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
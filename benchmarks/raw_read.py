@@ -0,0 +1,68 @@
+"""
+Raw-document read path (plan_service.get_plan_doc + plan_doc_schema) against the
+mongoengine path (plan_service.get_plan + Plan.to_dict()).
+
+First checks parity: both paths must render identical bodies for seeded plans of
+every size and for the edge cases in tests/test_plan_doc_schema.py (missing
+defaults, int-stored costs, open-ended activities, admins, images). Exits 1 on any mismatch. Then reports
+load+serialize latency and throughput of each path per plan size.
+
+    python -m benchmarks.raw_read --sizes 10,100,500 --iterations 50
+"""
+import argparse
+import sys
+import time
+from benchmarks.common import bench_app, summarize, write_report, print_results, compare
+from benchmarks.seed import seed_plan
+from tests.test_plan_doc_schema import edge_case_plans, parity_mismatches
+
+COLUMNS = ('count', 'p50_ms', 'p99_ms', 'throughput_per_s')
+
+def time_path(call, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,500', help='members and activities per plan')
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to diff against')
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    app = bench_app()
+    from app.services import plan_service
+    from app.schemas import plan_doc_schema
+    results = {}
+    with app.app_context():
+        seeded = {size: seed_plan(members=size, activities=size, messages=args.messages) for size in sizes}
+        plan_ids = [data['plan_id'] for data in seeded.values()]
+        plan_ids += edge_case_plans(seeded[sizes[0]]['member_ids'])
+
+        mismatches = len(parity_mismatches(plan_ids))
+        print(f"parity: {len(plan_ids) - mismatches}/{len(plan_ids)} plans identical", file=sys.stderr)
+        if mismatches:
+            return 1
+
+        for size, data in seeded.items():
+            plan_id = data['plan_id']
+            results[f"documents[{size}]"] = time_path(lambda: plan_service.get_plan(plan_id).to_dict(), args.iterations)
+            results[f"raw[{size}]"] = time_path(
+                lambda: plan_doc_schema.serialize_plan_doc(plan_service.get_plan_doc(plan_id)), args.iterations)
+            print(f"done size={size}", file=sys.stderr)
+
+    write_report(args.out, 'raw_read', {'sizes': sizes, 'messages': args.messages, 'iterations': args.iterations}, results)
+    print_results(results, COLUMNS)
+    if args.compare:
+        compare(args.compare, results, ('p50_ms', 'throughput_per_s'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+
+# Synthetic data written straight to the collections (no mongoengine objects), so
+# seeding thousands of members or messages takes seconds.
+
+def _user(i, prefix):
+    return {
+        '_id': ObjectId(),
+        'auth0_id': f"bench|{prefix}{i}|{uuid.uuid4().hex[:8]}",
+        'email': f"{prefix}{i}.{uuid.uuid4().hex[:8]}@bench.invalid",
+        'name': f"Bench {prefix}{i}",
+        'picture': f"https://bench.invalid/{prefix}{i}.png",
+        'hosting_count': 0,
+        'participating_count': 0,
+    }
+
+def make_activity(proposer_id, start, voters, hours=2):
+    cost = round(random.uniform(10, 200), 2)
+    return {
+        'activity_id': str(uuid.uuid4()),
+        'name': f"Activity {uuid.uuid4().hex[:6]}",
+        'description': "Seeded by benchmarks",
+        'costs': {'is_per_person': False, 'per_person': round(cost / max(len(voters), 1), 2), 'total_cost': cost},
+        'start_time': start,
+        'end_time': start + timedelta(hours=hours),
+        'proposer': proposer_id,
+        'status': 'proposed',
+        'votes': voters,
+        'payments': [],
+    }
+
+def seed_plan(members=20, activities=30, messages=200, outsiders=0, extra_plans=0, seed=1):
+    """
+    One plan with `members` users (the first is the organizer), `activities`
+    proposals with random overlapping times and votes, `messages` chat messages and
+    an open invite, plus `outsiders` users who aren't members yet and `extra_plans`
+    more plans for the organizer's dashboard listing. Returns the ids needed to drive it.
+    """
+    from app.models.user import User
+    from app.models.plan import Plan
+    from app.models.message import Message
+    from app.models.invitation import Invitation
+
+    random.seed(seed)
+    users = [_user(i, 'member') for i in range(members)]
+    strangers = [_user(i, 'outsider') for i in range(outsiders)]
+    User._get_collection().insert_many(users + strangers)
+    member_ids = [u['_id'] for u in users]
+    organizer_id = member_ids[0]
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    start_day = now + timedelta(days=30)
+    plan_id = ObjectId()
+    invite_id = ObjectId()
+    acts = [
+        make_activity(
+            random.choice(member_ids),
+            start_day + timedelta(hours=random.randint(0, 24 * 7)),
+            random.sample(member_ids, random.randint(0, max(len(member_ids) // 2, 1))),
+            hours=random.choice([1, 2, 3, 4]),
+        )
+        for _ in range(activities)
+    ]
+    plan = {
+        '_id': plan_id,
+        'type': 'trip',
+        'status': 'active',
+        'is_public': False,
+        'admins': [],
+        'organizer': organizer_id,
+        'participants': member_ids[1:],
+        'name': "Benchmark trip",
+        'description': "Seeded by benchmarks",
+        'costs': {'total': 0.0, 'per_person': 0.0, 'collected': 0.0},
+        'activities': acts,
+        'invitation': invite_id,
+        'created_at': now,
+        'start_day': start_day,
+        'end_day': start_day + timedelta(days=7),
+        'stock_image': 'abstract/abstract1.jpg',
+        'version': 1,
+    }
+    others = [
+        {**plan, '_id': ObjectId(), 'name': f"Benchmark plan {i}", 'activities': acts[:5],
+         'invitation': None, 'created_at': now - timedelta(minutes=i + 1)}
+        for i in range(extra_plans)
+    ]
+    Plan._get_collection().insert_many([plan] + others)
+
+    Invitation._get_collection().insert_one({
+        '_id': invite_id,
+        'link': uuid.uuid4().hex,
+        'plan_id': plan_id,
+        'created_at': now,
+        'expires_at': now + timedelta(days=3),
+        'status': 'active',
+        'uses': 0,
+        'max_uses': outsiders + 1000,
+    })
+
+    if messages:
+        Message._get_collection().insert_many([
+            {
+                '_id': ObjectId(),
+                'plan_id': plan_id,
+                'sender': random.choice(member_ids),
+                'text': f"message {i}",
+                'timestamp': now - timedelta(seconds=messages - i),
+            }
+            for i in range(messages)
+        ])
+
+    return {
+        'plan_id': str(plan_id),
+        'organizer_id': str(organizer_id),
+        'member_ids': [str(uid) for uid in member_ids],
+        'activity_ids': [a['activity_id'] for a in acts],
+        'invite_id': str(invite_id),
+        'outsider_ids': [str(u['_id']) for u in strangers],
+    }
@@ -0,0 +1,81 @@
+"""
+Worker cold-start profile: per-module import time of the app package and the wall
+time of create_app().
+
+    python -m benchmarks.startup --top 25 --budget-ms 1500 --json startup.json
+
+Exits non-zero when create_app() (imports included) exceeds --budget-ms.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+def import_times(module="app"):
+    """(module, self_us, cumulative_us) for every import, parsed from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return rows
+
+CREATE_APP_SNIPPET = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+finished = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (finished - imported) * 1000}))
+"""
+
+def create_app_time():
+    # Fresh interpreter so nothing is already imported or connected
+    result = subprocess.run([sys.executable, "-c", CREATE_APP_SNIPPET], capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"create_app failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="slowest imports to report")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail above this total startup time")
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    rows = import_times()
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]
+    startup = create_app_time()
+    total_ms = startup["import_ms"] + startup["create_app_ms"]
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in slowest:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    print(f"\nimport app: {startup['import_ms']:.1f} ms  create_app(): {startup['create_app_ms']:.1f} ms  total: {total_ms:.1f} ms")
+
+    report = {
+        "imports": [{"module": n, "self_us": s, "cumulative_us": c} for n, s, c in slowest],
+        **startup,
+        "total_ms": total_ms,
+        "budget_ms": args.budget_ms,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"startup over budget: {total_ms:.1f} ms > {args.budget_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Buffered vs streamed plan listings: time to first byte, total time and peak RSS.
+
+Seeds one organizer with --plans plans in the local bench database, then runs each
+mode in a fresh interpreter (peak RSS is process-wide, so the modes can't share one)
+and reads GET /plan through the test client without buffering.
+
+    python -m benchmarks.streaming --plans 2000 --limit 100 --stream-limit 1000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from benchmarks.common import bench_app, access_token, summarize, write_report, print_results, compare
+from benchmarks.seed import seed_plan
+
+COLUMNS = ('limit', 'ttfb_p50_ms', 'total_p50_ms', 'total_p99_ms', 'bytes', 'peak_rss_kib')
+
+def _peak_rss_kib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak # bytes on macOS, KiB elsewhere
+
+def run_mode(stream, limit, iterations, organizer_id):
+    app = bench_app(reset=False)
+    client = app.test_client()
+    headers = {'Authorization': f"Bearer {access_token(app, organizer_id)}"}
+    url = f"/plan?limit={limit}" + ('&stream=true' if stream else '')
+
+    ttfb, totals = [], []
+    size = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        response = client.get(url, headers=headers, buffered=False)
+        chunks = iter(response.response)
+        first = next(chunks, b'')
+        ttfb.append(time.perf_counter() - t0)
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        response.close()
+        totals.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    first_byte, total = summarize(ttfb, elapsed), summarize(totals, elapsed)
+    return {
+        'limit': limit,
+        'ttfb_p50_ms': first_byte['p50_ms'],
+        'ttfb_p99_ms': first_byte['p99_ms'],
+        'total_p50_ms': total['p50_ms'],
+        'total_p99_ms': total['p99_ms'],
+        'bytes': size,
+        'peak_rss_kib': _peak_rss_kib(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plans', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=100, help='page size for both modes')
+    parser.add_argument('--stream-limit', type=int, default=1000, help='larger page only the streamed mode allows')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to diff against')
+    parser.add_argument('--worker', help=argparse.SUPPRESS) # "<stream>:<limit>:<organizer_id>", run one mode
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        stream, limit, organizer_id = args.worker.split(':')
+        print(json.dumps(run_mode(stream == '1', int(limit), args.iterations, organizer_id)))
+        return 0
+
+    app = bench_app()
+    with app.app_context():
+        organizer_id = seed_plan(members=5, activities=3, messages=0, extra_plans=args.plans)['organizer_id']
+
+    modes = {
+        f'buffered limit={args.limit}': ('0', args.limit),
+        f'streamed limit={args.limit}': ('1', args.limit),
+        f'streamed limit={args.stream_limit}': ('1', args.stream_limit),
+    }
+    results = {}
+    for name, (stream, limit) in modes.items():
+        worker = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.streaming', '--iterations', str(args.iterations),
+             '--worker', f"{stream}:{limit}:{organizer_id}"],
+            capture_output=True, text=True,
+        )
+        if worker.returncode:
+            raise RuntimeError(f"{name} failed:\n{worker.stderr[-2000:]}")
+        results[name] = json.loads(worker.stdout.strip().splitlines()[-1])
+        print(f"done {name}", file=sys.stderr)
+
+    write_report(args.out, 'streaming', {'plans': args.plans, 'iterations': args.iterations}, results)
+    print_results(results, COLUMNS)
+    if args.compare:
+        compare(args.compare, results, ('ttfb_p50_ms', 'total_p50_ms', 'peak_rss_kib'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
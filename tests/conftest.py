@@ -0,0 +1,180 @@
+import os
+import socket
+import threading
+import time
+import uuid
+import pytest
+from bson import ObjectId
+
+# Tests that touch Mongo or Redis run against local servers (e.g.
+# `docker run -p 27017:27017 mongo`, `-p 6379:6379 redis`) and are skipped when
+# those aren't reachable. Database names must contain 'test', they are dropped.
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017/plansly_test")
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+@pytest.fixture(scope="session")
+def mongo():
+    from mongoengine import connect, disconnect
+    from mongoengine.connection import get_db
+
+    disconnect()
+    connect(host=TEST_MONGO_URI, uuidRepresentation="standard", serverSelectionTimeoutMS=1000, connectTimeoutMS=1000)
+    db = get_db()
+    try:
+        db.client.admin.command("ping")
+    except Exception:
+        disconnect()
+        pytest.skip(f"local mongod unavailable at {TEST_MONGO_URI}")
+    if "test" not in db.name:
+        disconnect()
+        raise RuntimeError(f"refusing to use database {db.name!r}, its name must contain 'test'")
+
+    db.client.drop_database(db.name)
+    from app.index_check import MODELS
+    for model in MODELS:
+        model.ensure_indexes()
+    yield db
+    db.client.drop_database(db.name)
+    disconnect()
+
+@pytest.fixture(scope="session")
+def redis_url():
+    import redis
+    client = redis.Redis.from_url(TEST_REDIS_URL, socket_connect_timeout=1)
+    try:
+        client.ping()
+    except redis.RedisError:
+        pytest.skip(f"local redis unavailable at {TEST_REDIS_URL}")
+    client.flushdb()
+    yield TEST_REDIS_URL
+    client.flushdb()
+
+@pytest.fixture(scope="session")
+def redis_cache(redis_url):
+    """Points the app's shared Redis client (caches, presence, identities) at the test database."""
+    import redis
+    from app.extensions import cache
+
+    original = cache._client
+    cache._client = redis.Redis.from_url(redis_url, decode_responses=True)
+    yield cache
+    cache._client = original
+
+def make_app(name):
+    """Flask app with the REST and socket auth of create_app(), without its Postgres, S3 and Auth0 clients."""
+    from flask import Flask
+    from app.extensions import jwt
+    from app.errors import AppError
+    from app.services.audit_service import AuditWriter
+
+    app = Flask(name)
+    app.testing = True
+    app.secret_key = "test-secret"
+    app.config.update(JWT_TOKEN_LOCATION=["headers", "cookies"], JWT_COOKIE_CSRF_PROTECT=False)
+    jwt.init_app(app)
+    app.register_error_handler(AppError, lambda err: ({"error": err.error_code, "message": err.message}, err.status_code))
+    app.audit_writer = AuditWriter(pool=None) # Never started, events stay queued
+    return app
+
+@pytest.fixture(scope="session")
+def app(mongo, redis_cache, redis_url):
+    """
+    The app's own socketio and handlers served over HTTP long-polling on a local port
+    (the Flask-SocketIO test client refuses a message queue), REST through test_client().
+    """
+    from app.extensions import socketio
+    from app.routes.plan import plan_bp
+    from app.services.message_service import MessageWriter
+    from app.sockets import socket as _handlers
+
+    app = make_app("plansly-test")
+    app.register_blueprint(plan_bp)
+    socketio.init_app(app, async_mode="threading", message_queue=redis_url)
+    app.socket_url = serve(socketio, app)
+    app.message_writer = MessageWriter(app)
+    app.message_writer.start()
+    yield app
+    app.message_writer.stop()
+
+def access_token(app, user):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return create_access_token(identity=str(user.id))
+
+def auth_header(app, user):
+    return {"Authorization": f"Bearer {access_token(app, user)}"}
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(sio, app):
+    """Run a SocketIO server for `app` in a daemon thread, return its URL."""
+    port = _free_port()
+    threading.Thread(
+        target=sio.run, args=(app,),
+        kwargs={"host": "127.0.0.1", "port": port, "allow_unsafe_werkzeug": True, "use_reloader": False},
+        daemon=True,
+    ).start()
+    return f"http://127.0.0.1:{port}"
+
+SOCKET_WAIT = 5 # Seconds
+
+class SocketClient:
+    """python-socketio client recording every event it receives."""
+    def __init__(self, url, token=None):
+        import socketio
+        self.events = []
+        self.sio = socketio.Client()
+        self.sio.on("*", lambda name, data: self.events.append((name, data)))
+        headers = {"Cookie": f"access_token_cookie={token}"} if token else {}
+        deadline = time.monotonic() + SOCKET_WAIT
+        while True:
+            try:
+                self.sio.connect(url, headers=headers, transports=["polling"])
+                return
+            except socketio.exceptions.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def received(self, name):
+        return [data for event, data in self.events if event == name]
+
+    def wait_for(self, name, until=lambda data: True):
+        deadline = time.monotonic() + SOCKET_WAIT
+        while time.monotonic() < deadline:
+            matches = [data for data in self.received(name) if until(data)]
+            if matches:
+                return matches
+            time.sleep(0.05)
+        return []
+
+    def call(self, event, data):
+        return self.sio.call(event, data, timeout=SOCKET_WAIT)
+
+def make_users(count, prefix="member"):
+    from app.models.user import User
+    users = []
+    for i in range(count):
+        tag = uuid.uuid4().hex[:8]
+        users.append(User(
+            auth0_id=f"test|{prefix}{i}|{tag}",
+            email=f"{prefix}{i}.{tag}@test.invalid",
+            name=f"Test {prefix}{i}",
+            picture=f"https://test.invalid/{prefix}{i}.png",
+        ).save())
+    return users
+
+def make_plan(organizer, participants, activities=(), **fields):
+    from app.models.plan import Plan
+    return Plan(
+        type="trip",
+        name=fields.pop("name", f"Plan {ObjectId()}"),
+        organizer=organizer,
+        participants=participants,
+        activities=list(activities),
+        **fields,
+    ).save()
@@ -0,0 +1,78 @@
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+from bson import ObjectId
+from app.models.activity import Activity
+from app.services import activity_index
+from app.services.activity_index import ActivityIntervalIndex
+
+START = datetime(2031, 1, 1, 10, tzinfo=timezone.utc)
+
+def _activity(start_hours, end_hours=None, name=None):
+    return Activity(
+        name=name or f"at {start_hours}",
+        proposer=ObjectId(),
+        start_time=START + timedelta(hours=start_hours),
+        end_time=START + timedelta(hours=end_hours) if end_hours is not None else None,
+    )
+
+def _names(activities):
+    return sorted(a.name for a in activities)
+
+def test_open_ended_activity_occupies_only_its_start():
+    open_ended = _activity(0, name='open')
+    index = ActivityIntervalIndex([
+        open_ended,
+        _activity(-1, 0, name='ends at its start'),
+        _activity(-1, 0.5, name='spans its start'),
+        _activity(0.5, name='later open'),
+        _activity(0.5, 2, name='later'),
+    ])
+
+    assert _names(index.conflicts(open_ended)) == ['spans its start']
+
+def test_same_start_always_conflicts():
+    first, second, third = _activity(0, name='open'), _activity(0, 0, name='empty'), _activity(0, 3, name='long')
+    index = ActivityIntervalIndex([first, second, third, _activity(3, 4, name='next')])
+
+    assert _names(index.conflicts(first)) == ['empty', 'long']
+    assert _names(index.conflicts(third)) == ['empty', 'open']
+
+def test_end_before_start_is_treated_as_open_ended():
+    backwards = _activity(2, 1, name='backwards')
+    index = ActivityIntervalIndex([backwards, _activity(1, 2, name='ends at its start'), _activity(1.5, 3, name='covers')])
+
+    assert _names(index.conflicts(backwards)) == ['covers']
+
+def test_overlapping_returns_start_order():
+    activities = [_activity(h, h + 2) for h in (5, 1, 3)]
+    index = ActivityIntervalIndex(activities)
+
+    assert [a.name for a in index.overlapping(START, START + timedelta(hours=10))] == ['at 1', 'at 3', 'at 5']
+
+@pytest.mark.parametrize("seed", range(5))
+def test_index_matches_a_linear_scan(seed):
+    from app.services.plan_service import is_overlapped
+
+    rng = random.Random(seed)
+    activities = []
+    for _ in range(200):
+        start = rng.randint(0, 48) / 2
+        end = rng.choice([None, start, start + rng.randint(1, 12) / 2, start - 1])
+        activities.append(_activity(start, end))
+    index = ActivityIntervalIndex(activities)
+
+    for target in activities:
+        expected = [a for a in activities if a is not target and is_overlapped(a, target)]
+        assert sorted(map(id, index.conflicts(target))) == sorted(map(id, expected))
+
+def test_for_plan_rebuilds_after_a_write(mongo):
+    from app.models.plan import Plan
+
+    plan = Plan._from_son({'_id': ObjectId(), 'type': 'trip', 'organizer': ObjectId(),
+                           'activities': [_activity(0, 1).to_mongo()], 'version': 1})
+    index = activity_index.for_plan(plan)
+    assert activity_index.for_plan(plan) is index
+
+    plan._data['version'] = 2
+    assert activity_index.for_plan(plan) is not index
@@ -0,0 +1,93 @@
+import copy
+import pytest
+from app.services import audit_service
+
+def _plan(**fields):
+    return {
+        '_id': 'p1',
+        'version': 1,
+        'status': 'active',
+        'participants': ['a'],
+        'costs': {'total': 0.0, 'collected': 0.0},
+        'activities': [
+            {'activity_id': 'x', 'name': 'Dinner', 'votes': ['a'], 'costs': {'per_person': 30.0}},
+            {'activity_id': 'y', 'name': 'Hike', 'votes': [], 'costs': {'per_person': 0.0}},
+        ],
+        **fields,
+    }
+
+def _edit(document, change):
+    edited = copy.deepcopy(document)
+    change(edited)
+    return edited
+
+def _activity(document, activity_id):
+    return next(a for a in document['activities'] if a['activity_id'] == activity_id)
+
+def test_diff_applies_forwards_and_backwards():
+    before = _plan()
+    after = _edit(before, lambda d: (
+        d.update(status='locked', version=2),
+        d['participants'].append('b'),
+        d['costs'].pop('collected'),
+        _activity(d, 'x')['votes'].append('b'),
+        d['activities'].remove(_activity(d, 'y')),
+        d['activities'].append({'activity_id': 'z', 'name': 'Museum', 'votes': ['b']}),
+    ))
+    changes = audit_service.diff(before, after)
+
+    assert changes['participants'] == {'added': ['b'], 'removed': []}
+    assert changes['activities.activity_id=x.votes'] == {'added': ['b'], 'removed': []}
+    assert 'new' not in changes['activities.activity_id=y']
+    assert audit_service.apply_diff(before, changes) == after
+    assert audit_service.apply_diff(after, changes, reverse=True) == before
+
+def test_unchanged_documents_have_no_diff():
+    assert audit_service.diff(_plan(), _plan()) == {}
+
+def test_reconstruct_returns_every_state():
+    base = _plan()
+    first = _edit(base, lambda d: d.update(version=2, status='locked'))
+    second = _edit(first, lambda d: (d.update(version=3), d['participants'].append('b')))
+
+    states = audit_service.reconstruct(base, [audit_service.diff(base, first), audit_service.diff(first, second)])
+
+    assert states == [base, first, second]
+
+def test_interleaved_list_edits_chain():
+    # Both writers diffed the same stale copy, as concurrent atomic updates do
+    stale = _plan(participants=['a', 'b', 'c'])
+    drop_a = audit_service.diff(stale, _edit(stale, lambda d: d['participants'].remove('a')))
+    drop_c = audit_service.diff(stale, _edit(stale, lambda d: d['participants'].remove('c')))
+    add_d = audit_service.diff(stale, _edit(stale, lambda d: d['participants'].append('d')))
+
+    *_, final = audit_service.reconstruct(stale, [drop_a, drop_c, add_d])
+
+    assert final['participants'] == ['b', 'd']
+
+def test_interleaved_activity_edits_chain():
+    stale = _plan()
+    vote_x = audit_service.diff(stale, _edit(stale, lambda d: _activity(d, 'x')['votes'].append('b')))
+    vote_y = audit_service.diff(stale, _edit(stale, lambda d: _activity(d, 'y')['votes'].append('c')))
+    proposed = audit_service.diff(stale, _edit(stale, lambda d: d['activities'].append(
+        {'activity_id': 'z', 'name': 'Museum', 'votes': []})))
+    dropped = audit_service.diff(stale, _edit(stale, lambda d: d['activities'].pop(0)))
+
+    # The vote on x lands after x is gone and is skipped
+    states = audit_service.reconstruct(stale, [proposed, dropped, vote_y, vote_x])
+    final = states[-1]
+
+    assert [a['activity_id'] for a in final['activities']] == ['y', 'z']
+    assert _activity(final, 'y')['votes'] == ['c']
+    assert [a['activity_id'] for a in states[2]['activities']] == ['y', 'z']
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_apply_diff_leaves_the_input_alone(reverse):
+    before = _plan()
+    after = _edit(before, lambda d: d['participants'].append('b'))
+    document = after if reverse else before
+    original = copy.deepcopy(document)
+
+    audit_service.apply_diff(document, audit_service.diff(before, after), reverse=reverse)
+
+    assert document == original
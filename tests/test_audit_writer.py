@@ -0,0 +1,12 @@
+from app.services.audit_service import AuditWriter
+
+def _row(key):
+    return ('actor', 'trip', key, 'update', 'success', None, None, None, None, key)
+
+def test_full_queue_drops_without_waiting():
+    writer = AuditWriter(pool=None, max_queue=2) # Not started, nothing drains
+
+    assert writer.submit(_row('a')) and writer.submit(_row('b'))
+    assert not writer.submit(_row('c'))
+    assert writer.dropped == 1
+    assert writer.queue.qsize() == 2
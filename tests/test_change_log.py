@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from tests.conftest import make_users, make_plan, auth_header
+
+def _record(plan, count, op='updated', sections=('plan',)):
+    from app.services import change_log
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return list(pool.map(lambda _: change_log.record(plan, op, plan.organizer.id, sections), range(count)))
+
+def _seq(plan):
+    from app.models.plan import Plan
+    return Plan._get_collection().find_one({'_id': plan.id}, {'change_seq': 1}).get('change_seq', 0)
+
+@pytest.fixture
+def plan(mongo):
+    organizer, member = make_users(2)
+    return make_plan(organizer, [member])
+
+def test_concurrent_records_take_consecutive_seqs(plan):
+    from app.services import change_log
+
+    records = _record(plan, 20)
+
+    assert sorted(r['seq'] for r in records) == list(range(1, 21))
+    changes = change_log.get_changes(plan.id, 5, _seq(plan))
+    assert [c.seq for c in changes] == list(range(6, 21))
+    assert change_log.get_changes(plan.id, 20, 20) == []
+
+def test_records_carry_the_touched_sections(plan):
+    record, = _record(plan, 1, op='member:joined', sections=('members',))
+
+    assert record['op'] == 'member:joined'
+    assert record['actor_id'] == str(plan.organizer.id)
+    assert set(record['data']) == {'members'}
+
+@pytest.mark.parametrize("since", [25, -1], ids=['ahead of the plan', 'too far behind'])
+def test_out_of_range_since_needs_a_snapshot(plan, monkeypatch, since):
+    from app.services import change_log
+
+    _record(plan, 3)
+    monkeypatch.setattr(change_log, 'MAX_PLAN_CHANGES', 3)
+
+    assert change_log.get_changes(plan.id, since, _seq(plan)) is None
+
+def test_a_gap_needs_a_snapshot(plan):
+    from app.models.plan_change import PlanChange
+    from app.services import change_log
+
+    _record(plan, 5)
+    PlanChange.objects(plan_id=plan.id, seq=3).delete() # Failed to insert, or expired
+
+    assert change_log.get_changes(plan.id, 1, 5) is None
+    assert [c.seq for c in change_log.get_changes(plan.id, 3, 5)] == [4, 5]
+
+def test_changes_route(app):
+    from app.models.plan_change import PlanChange
+
+    organizer, member = make_users(2)
+    plan = make_plan(organizer, [member])
+    http = app.test_client()
+    headers = auth_header(app, member)
+    url = f"/plan/{plan.id}/changes"
+    _record(plan, 4)
+
+    body = http.get(f"{url}?since=1", headers=headers).get_json()['data']
+    assert body['seq'] == 4
+    assert [c['seq'] for c in body['changes']] == [2, 3, 4]
+
+    # No since, ahead of the plan, or a gap: the client starts over from a snapshot at seq
+    PlanChange.objects(plan_id=plan.id, seq=3).delete()
+    for query in ('', '?since=9', '?since=1'):
+        body = http.get(f"{url}{query}", headers=headers).get_json()['data']
+        assert body['seq'] == 4
+        assert 'changes' not in body
+        assert body['snapshot']['plan']['id'] == str(plan.id)
+
+    outsider, = make_users(1)
+    assert http.get(f"{url}?since=1", headers=auth_header(app, outsider)).status_code == 403
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import pytest
+from tests.conftest import make_users, make_plan
+
+THREADS = 12
+
+def _activity(proposer, start, cost=120.0, is_per_person=False):
+    from app.models.activity import Activity, ActivityCost
+    return Activity(
+        name=f"Activity {start.isoformat()}",
+        proposer=proposer,
+        costs=ActivityCost(per_person=cost, total_cost=cost, is_per_person=is_per_person),
+        start_time=start,
+        end_time=start + timedelta(hours=1),
+    )
+
+def _stored(plan_id):
+    from app.models.plan import Plan
+    return Plan._get_collection().find_one({'_id': plan_id})
+
+def _stored_activity(plan_id, activity_id):
+    return next(a for a in _stored(plan_id)['activities'] if a['activity_id'] == activity_id)
+
+def _assert_costs_match_votes(activity):
+    votes = len(activity['votes'])
+    costs = activity['costs']
+    if costs['is_per_person']:
+        assert costs['total_cost'] == pytest.approx(costs['per_person'] * votes)
+    else:
+        assert costs['per_person'] == pytest.approx(costs['total_cost'] / votes)
+
+def _run(calls):
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        for future in [pool.submit(call) for call in calls]:
+            future.result()
+
+@pytest.mark.parametrize("is_per_person", [False, True])
+def test_parallel_votes_are_all_stored(mongo, is_per_person):
+    from app.services import plan_service
+
+    # One member abstains so the activity is never finalized mid-test
+    organizer, *members = make_users(THREADS + 1)
+    start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    plan = make_plan(organizer, members, [_activity(organizer, start, is_per_person=is_per_person)])
+    activity_id = plan.activities[0].activity_id
+    voters = members[:THREADS]
+
+    _run([lambda user=user: plan_service.vote_activity(plan_service.get_plan(plan.id), user, activity_id)
+          for user in voters])
+
+    activity = _stored_activity(plan.id, activity_id)
+    assert sorted(activity['votes']) == sorted(u.id for u in voters)
+    assert activity['status'] == 'proposed'
+    _assert_costs_match_votes(activity)
+
+def test_parallel_bulk_votes_are_all_stored(mongo):
+    from app.services import plan_service
+
+    organizer, *members = make_users(THREADS + 1)
+    start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    activities = [_activity(organizer, start + timedelta(days=i)) for i in range(4)]
+    plan = make_plan(organizer, members, activities)
+    activity_ids = [a.activity_id for a in plan.activities]
+    voters = members[:THREADS]
+
+    _run([lambda user=user: plan_service.bulk_vote(plan_service.get_plan(plan.id), user,
+                                                   [(activity_id, True) for activity_id in activity_ids])
+          for user in voters])
+
+    for activity_id in activity_ids:
+        activity = _stored_activity(plan.id, activity_id)
+        assert sorted(activity['votes']) == sorted(u.id for u in voters)
+        _assert_costs_match_votes(activity)
+
+def test_lock_racing_last_vote_counts_costs_once(mongo):
+    from app.services import plan_service
+
+    organizer, *members = make_users(4)
+    start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    activity = _activity(organizer, start, cost=90.0)
+    activity.votes = [organizer] + members[:-1]
+    plan = make_plan(organizer, members, [activity])
+    activity_id = plan.activities[0].activity_id
+
+    # The last vote finalizes the activity while the organizer locks it by hand
+    _run([
+        lambda: plan_service.vote_activity(plan_service.get_plan(plan.id), members[-1], activity_id),
+        lambda: plan_service.lock_activity(plan_service.get_plan(plan.id), activity_id, organizer),
+    ])
+
+    stored = _stored(plan.id)
+    activity = next(a for a in stored['activities'] if a['activity_id'] == activity_id)
+    assert activity['status'] == 'confirmed'
+    assert activity['payments'].count(organizer.id) == 1
+    assert stored['costs']['total'] == pytest.approx(90.0)
+
+def test_parallel_payments_are_charged_once(mongo):
+    from app.services import plan_service
+
+    organizer, *members = make_users(4)
+    start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    activities = [_activity(organizer, start + timedelta(days=i), cost=30.0, is_per_person=True) for i in range(2)]
+    for activity in activities:
+        activity.votes = [organizer] + members
+    plan = make_plan(organizer, members, activities, status='locked')
+    payer = members[0]
+
+    # Retried requests from one member, and everyone else paying at the same time
+    _run([lambda: plan_service.pay(plan_service.get_plan(plan.id), payer) for _ in range(THREADS // 2)]
+         + [lambda user=user: plan_service.pay(plan_service.get_plan(plan.id), user) for user in members[1:]])
+
+    stored = _stored(plan.id)
+    for activity in stored['activities']:
+        assert sorted(activity['payments']) == sorted(u.id for u in members)
+    assert stored['costs']['collected'] == pytest.approx(30.0 * 2 * len(members))
@@ -0,0 +1,4 @@
+def test_service_queries_use_indexes(mongo):
+    from app.index_check import check_indexes
+
+    assert check_indexes() == {}
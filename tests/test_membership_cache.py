@@ -0,0 +1,48 @@
+import pytest
+from bson import ObjectId
+from tests.conftest import make_users, make_plan
+
+@pytest.fixture
+def cache(redis_url):
+    import redis
+    from app.services import membership_cache
+
+    original = membership_cache.cache
+    membership_cache.cache = redis.Redis.from_url(redis_url, decode_responses=True)
+    yield membership_cache.cache
+    membership_cache.cache = original
+
+def test_rebuild_racing_a_removal_is_not_stored(cache):
+    from app.services import membership_cache
+
+    plan_id = ObjectId()
+
+    def stale_load():
+        # The member is removed after this load read the plan
+        membership_cache.invalidate(plan_id)
+        return {'organizer', 'removed'}
+
+    assert membership_cache.is_member(plan_id, 'removed', stale_load)
+    assert not cache.exists(membership_cache._key(plan_id))
+    assert not membership_cache.is_member(plan_id, 'removed', lambda: {'organizer'})
+    assert not membership_cache.is_member(plan_id, 'removed', lambda: pytest.fail("served from the set"))
+
+def test_invalidate_drops_the_cached_set(cache):
+    from app.services import membership_cache
+
+    plan_id = ObjectId()
+    assert membership_cache.is_member(plan_id, 'member', lambda: {'member'})
+    membership_cache.invalidate(plan_id)
+
+    assert not membership_cache.is_member(plan_id, 'member', lambda: set())
+
+def test_admins_pass_every_member_check(mongo, cache):
+    from app.services import plan_service
+
+    organizer, admin, participant = make_users(3)
+    plan = make_plan(organizer, [participant], admins=[admin])
+
+    assert plan_service.is_member(plan.id, admin)
+    assert plan_service.get_plan(plan.id, admin).id == plan.id
+    assert plan_service.get_plan_meta(plan.id, admin)['_id'] == plan.id
+    assert plan_service.get_plan_version(plan.id, participant) == plan_service.get_plan_version(plan.id, admin)
@@ -0,0 +1,69 @@
+from tests.conftest import make_users, make_plan, access_token, SocketClient
+
+def _stored(*docs):
+    from app.models.message import Message
+    return {doc['_id'] for doc in Message._get_collection().find({'_id': {'$in': [d['_id'] for d in docs]}}, {'_id': 1})}
+
+def test_failed_write_is_reported_to_the_sender_only(app):
+    from app.services import message_service
+    from app.services.message_service import MessageWriter
+
+    organizer, member = make_users(2)
+    plan = make_plan(organizer, [member])
+    plan_id = str(plan.id)
+    sockets = {user: SocketClient(app.socket_url, access_token(app, user)) for user in (organizer, member)}
+    for count, user in enumerate((organizer, member), 1):
+        sockets[user].sio.emit('plan:join', {'plan_id': plan_id})
+        assert sockets[user].wait_for('plan:users', until=lambda data, count=count: data == {'msg': count})
+
+    writer = MessageWriter(app) # Flushed by hand, not started
+    too_large = message_service.new_message(plan_id, member, 'x' * (17 * 1024 * 1024))
+    writer.submit(too_large, 'client-1', sockets[member].sio.sid)
+    writer.flush()
+
+    assert writer.failed == 1
+    failed = sockets[member].wait_for('plan:message:failed')
+    assert failed == [{'id': str(too_large['_id']), 'client_id': 'client-1', 'sender_id': str(member.id),
+                       'error': 'server_error', 'message': 'Message could not be saved'}]
+    assert sockets[organizer].received('plan:message:failed') == []
+    assert _stored(too_large) == set()
+    for client in sockets.values():
+        client.sio.disconnect()
+
+def test_already_stored_messages_count_as_written(app):
+    from app.models.message import Message
+    from app.services import message_service
+    from app.services.message_service import MessageWriter
+
+    organizer, = make_users(1)
+    plan = make_plan(organizer, [])
+    earlier = message_service.new_message(plan.id, organizer, 'first')
+    Message._get_collection().insert_one(dict(earlier)) # Stored by an attempt that timed out
+    later = message_service.new_message(plan.id, organizer, 'second')
+
+    writer = MessageWriter(app)
+    writer.submit(earlier)
+    writer.submit(later)
+    writer.submit(later) # A resubmitted retry
+    writer.flush()
+
+    assert writer.failed == 0
+    assert _stored(earlier, later) == {earlier['_id'], later['_id']}
+
+def test_stop_waits_for_the_loop_then_drains(app):
+    from app.services import message_service
+    from app.services.message_service import MessageWriter
+
+    organizer, = make_users(1)
+    plan = make_plan(organizer, [])
+    writer = MessageWriter(app, batch_size=10)
+    writer.start()
+    docs = [message_service.new_message(plan.id, organizer, f"message {i}") for i in range(100)]
+    for doc in docs:
+        writer.submit(doc)
+    writer.stop()
+
+    assert writer._task is None
+    assert not writer.pending
+    assert writer.written == len(docs)
+    assert _stored(*docs) == {doc['_id'] for doc in docs}
@@ -0,0 +1,36 @@
+import pytest
+from bson import ObjectId
+
+@pytest.fixture
+def cache(redis_url):
+    import redis
+    from app.services import plan_cache
+
+    original = plan_cache.cache
+    plan_cache.cache = redis.Redis.from_url(redis_url, decode_responses=True)
+    yield plan_cache.cache
+    plan_cache.cache = original
+
+def test_build_racing_an_invalidate_is_not_stored(cache):
+    from app.services import plan_cache
+
+    plan_id = ObjectId()
+
+    def stale_build():
+        # A chat message commits and invalidates while this body is being built
+        plan_cache.invalidate_versions([(plan_id, 3)])
+        return {'messages': ['old']}
+
+    assert plan_cache.get_plan_body(plan_id, 3, stale_build) == {'messages': ['old']}
+    assert not cache.exists(plan_cache._key(plan_id, 3))
+    assert plan_cache.get_plan_body(plan_id, 3, lambda: {'messages': ['old', 'new']}) == {'messages': ['old', 'new']}
+    assert plan_cache.get_plan_body(plan_id, 3, lambda: pytest.fail("not cached")) == {'messages': ['old', 'new']}
+
+def test_waiter_builds_when_the_builder_skips_its_store(cache):
+    from app.services import plan_cache
+
+    plan_id = ObjectId()
+    key = plan_cache._key(plan_id, 1)
+    cache.set(f"{key}:lock", "1", px=200) # Another worker is building
+
+    assert plan_cache.get_plan_body(plan_id, 1, lambda: {'name': 'fresh'}) == {'name': 'fresh'}
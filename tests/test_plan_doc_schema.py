@@ -0,0 +1,76 @@
+import sys
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from tests.conftest import make_users, make_plan
+
+# plan_doc_schema renders raw documents for the read path and has to match
+# Plan.to_dict() exactly. benchmarks/raw_read.py reuses these fixtures to check
+# parity on its seeded plans before timing both paths.
+
+def edge_case_plans(member_ids):
+    """Insert hand-written edge case plans for `member_ids` and return their ids."""
+    from app.models.plan import Plan
+    from app.models.image import Image
+
+    organizer, *others = [ObjectId(uid) for uid in member_ids]
+    image_id = Image._get_collection().insert_one({'key': f"uploads/test/{ObjectId()}", 'upload_status': 'uploaded'}).inserted_id
+    start = datetime(2031, 5, 1, 18, 30)
+    docs = [
+        # Only required fields, every default comes from the model
+        {'_id': ObjectId(), 'type': 'event', 'organizer': organizer},
+        {
+            '_id': ObjectId(), 'type': 'group_purchase', 'organizer': organizer, 'status': 'locked',
+            'is_public': True, 'admins': others[:1], 'participants': others[1:],
+            'costs': {'total': 120, 'per_person': 40, 'collected': 0}, # ints, model coerces to float
+            'image': image_id, 'deadline': start, 'created_at': start - timedelta(days=3),
+            'activities': [
+                {'activity_id': 'open-ended', 'name': 'No end', 'start_time': start, 'proposer': organizer,
+                 'votes': [organizer], 'costs': {'total_cost': 30}},
+                {'activity_id': 'no-costs', 'name': 'Defaults', 'start_time': start, 'proposer': organizer},
+                {'activity_id': 'confirmed', 'name': 'Paid', 'start_time': start, 'end_time': start + timedelta(hours=2),
+                 'proposer': others[0] if others else organizer, 'status': 'confirmed', 'votes': [organizer] + others,
+                 'payments': [organizer], 'costs': {'is_per_person': True, 'per_person': 12.5, 'total_cost': 25.0}},
+            ],
+        },
+    ]
+    Plan._get_collection().insert_many(docs)
+    return [str(doc['_id']) for doc in docs]
+
+def parity_mismatches(plan_ids):
+    """Ids of plans whose raw rendering differs from Plan.to_dict(), each diff goes to stderr."""
+    from app.services import plan_service, audit_service
+    from app.schemas import plan_doc_schema
+
+    mismatches = []
+    for plan_id in plan_ids:
+        expected = plan_service.get_plan(plan_id).to_dict()
+        actual = plan_doc_schema.serialize_plan_doc(plan_service.get_plan_doc(plan_id))
+        if expected != actual:
+            mismatches.append(plan_id)
+            print(f"parity mismatch plan_id={plan_id}: {audit_service.diff(expected, actual)}", file=sys.stderr)
+    return mismatches
+
+@pytest.fixture
+def members(mongo):
+    return make_users(4)
+
+def test_edge_case_plans_match_documents(members):
+    plan_ids = edge_case_plans([str(u.id) for u in members])
+
+    assert parity_mismatches(plan_ids) == []
+
+def test_saved_plan_matches_documents(members):
+    from app.models.activity import Activity, ActivityCost
+
+    organizer, *others = members
+    start = datetime(2031, 5, 1, 18, 30)
+    activities = [
+        Activity(name=f"Activity {i}", proposer=organizer, votes=[organizer] + others[:i],
+                 costs=ActivityCost(per_person=10.0 * i, total_cost=30.0, is_per_person=bool(i % 2)),
+                 start_time=start + timedelta(days=i), end_time=start + timedelta(days=i, hours=2))
+        for i in range(3)
+    ]
+    plan = make_plan(organizer, others[1:], activities, admins=others[:1], stock_image='beach')
+
+    assert parity_mismatches([str(plan.id)]) == []
@@ -0,0 +1,45 @@
+from tests.conftest import make_users, make_plan, access_token, auth_header, SocketClient
+
+def test_removed_participant_loses_access_and_leaves_the_room(app):
+    from app.extensions import socketio
+    from app.models.user import User
+
+    organizer, removed, staying = make_users(3)
+    removed.update(participating_count=1)
+    plan = make_plan(organizer, [removed, staying])
+    plan_id = str(plan.id)
+    http = app.test_client()
+    sockets = {user: SocketClient(app.socket_url, access_token(app, user)) for user in (removed, staying)}
+    for count, user in enumerate((removed, staying), 1):
+        sockets[user].sio.emit('plan:join', {'plan_id': plan_id})
+        assert sockets[user].wait_for('plan:users', until=lambda data, count=count: data == {'msg': count})
+    assert http.get(f"/plan/{plan_id}", headers=auth_header(app, removed)).status_code == 200
+
+    response = http.delete(f"/plan/{plan_id}/participant/{removed.id}", headers=auth_header(app, organizer))
+
+    assert response.status_code == 204
+    assert sockets[removed].wait_for('plan:removed') == [{'plan_id': plan_id}]
+    assert sockets[staying].wait_for('plan:member:removed')
+    assert sockets[staying].wait_for('plan:users', until=lambda data: data == {'msg': 1})
+    assert http.get(f"/plan/{plan_id}", headers=auth_header(app, removed)).status_code == 403
+    assert User.objects(id=removed.id).first().participating_count == 0
+
+    socketio.emit('plan:activity:voted', {'plan_id': plan_id}, room=f"plan:{plan_id}")
+    assert sockets[staying].wait_for('plan:activity:voted')
+    assert sockets[removed].received('plan:activity:voted') == []
+    sockets[removed].sio.emit('plan:message:send', {'plan_id': plan_id, 'message': 'still here?'})
+    assert sockets[removed].wait_for('error', until=lambda data: data == {'code': 'forbidden'})
+    for client in sockets.values():
+        client.sio.disconnect()
+
+def test_removing_a_non_participant_is_not_found(app):
+    from app.models.user import User
+
+    organizer, outsider = make_users(2)
+    outsider.update(participating_count=2)
+    plan = make_plan(organizer, [])
+
+    response = app.test_client().delete(f"/plan/{plan.id}/participant/{outsider.id}", headers=auth_header(app, organizer))
+
+    assert response.status_code == 404
+    assert User.objects(id=outsider.id).first().participating_count == 2
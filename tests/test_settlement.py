@@ -0,0 +1,78 @@
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+from bson import ObjectId
+from app.models.activity import Activity, ActivityCost
+from app.services import settlement_service
+from tests.conftest import make_users, make_plan
+
+def _activity(total, voters, payments=(), is_per_person=False, per_person=0.0):
+    start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    return Activity(
+        name=f"Activity {total}", proposer=voters[0], status='confirmed',
+        votes=list(voters), payments=list(payments),
+        costs=ActivityCost(total_cost=total, per_person=per_person, is_per_person=is_per_person),
+        start_time=start, end_time=start + timedelta(hours=1),
+    )
+
+def _apply(balances, transfers):
+    balances = dict(balances)
+    for debtor, creditor, amount in transfers:
+        assert amount > 0
+        balances[debtor] += amount
+        balances[creditor] -= amount
+    return balances
+
+def test_leftover_cents_go_to_the_first_voters_by_id():
+    voters = sorted([ObjectId() for _ in range(3)], key=str)
+    shares = settlement_service._shares(_activity(100.0, voters), list(reversed(voters)))
+
+    assert [shares[uid] for uid in voters] == [3334, 3333, 3333]
+    assert sum(shares.values()) == 10000
+
+def test_per_person_shares_are_not_split():
+    voters = [ObjectId() for _ in range(4)]
+    shares = settlement_service._shares(_activity(0.0, voters, is_per_person=True, per_person=12.5), voters)
+
+    assert set(shares.values()) == {1250}
+
+def test_settle_zeroes_every_balance():
+    a, b, c, d = 'a', 'b', 'c', 'd'
+    balances = {a: 5000, b: -3000, c: -1999, d: -1}
+
+    transfers = settlement_service.settle(balances)
+
+    assert set(_apply(balances, transfers).values()) == {0}
+    assert all(creditor == a for _, creditor, _ in transfers)
+    assert len(transfers) == 3
+
+@pytest.mark.parametrize("seed", range(5))
+def test_settle_needs_at_most_n_minus_one_transfers(seed):
+    rng = random.Random(seed)
+    balances = {f"m{i}": rng.randint(-10000, 10000) for i in range(49)}
+    balances['m49'] = -sum(balances.values())
+
+    transfers = settlement_service.settle(balances)
+
+    assert set(_apply(balances, transfers).values()) == {0}
+    assert len(transfers) <= len(balances) - 1
+
+def test_balances_sum_to_zero(mongo):
+    organizer, *members = make_users(4)
+    voters = [organizer] + members[:3]
+    plan = make_plan(organizer, members, [
+        _activity(100.0, voters, payments=[members[0]]), # 2500 each
+        _activity(10.0, [organizer] + members[:2]),      # 334, 333, 333 by id
+        _activity(0.0, members[:2], is_per_person=True, per_person=7.5, payments=members[:2]),
+    ])
+
+    balances = settlement_service.compute_balances(plan)
+    outstanding = -sum(m['balance'] for uid, m in balances.items() if uid != organizer.id)
+
+    assert sum(m['balance'] for m in balances.values()) == 0
+    assert balances[organizer.id]['balance'] == outstanding
+    assert balances[members[0].id]['paid'] == 2500 + 750
+    assert balances[members[2].id] == {'owed': 2500, 'paid': 0, 'balance': -2500}
+    assert sum(m['owed'] for m in balances.values()) == 10000 + 1000 + 1500
+    transfers = settlement_service.settle({uid: m['balance'] for uid, m in balances.items()})
+    assert all(creditor == organizer.id for _, creditor, _ in transfers)
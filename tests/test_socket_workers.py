@@ -0,0 +1,129 @@
+import time
+import pytest
+from tests.conftest import make_app, make_users, make_plan, serve, access_token, SocketClient
+
+# Two Socket.IO servers sharing one Redis message_queue stand in for two workers:
+# the app's own socketio (the app fixture) and a second one with the same handlers
+# from app.sockets.socket registered on it.
+
+@pytest.fixture(scope="module")
+def workers(app, redis_url):
+    from flask_socketio import SocketIO
+    from app.extensions import socketio
+    from app.sockets import socket as handlers
+
+    other = make_app("worker-b")
+    sio = SocketIO(other, async_mode='threading', message_queue=redis_url)
+    for event, handler in (('connect', handlers.on_connect), ('disconnect', handlers.on_disconnect),
+                           ('plan:join', handlers.join_plan), ('plan:leave', handlers.leave_plan),
+                           ('plan:heartbeat', handlers.heartbeat)):
+        sio.on(event)(handler)
+    return (socketio, app.socket_url), (sio, serve(sio, other))
+
+def _join(app, url, user, plan, count):
+    client = SocketClient(url, access_token(app, user))
+    client.sio.emit('plan:join', {'plan_id': str(plan.id)})
+    assert client.wait_for('plan:users', until=lambda data: data == {'msg': count})
+    return client
+
+def test_room_emits_reach_sockets_on_another_worker(app, workers):
+    (_, url_a), (sio_b, _) = workers
+    organizer, = make_users(1)
+    plan = make_plan(organizer, [])
+    client = _join(app, url_a, organizer, plan, 1)
+
+    # Worker A subscribes to the queue asynchronously, publish until it is listening
+    received = []
+    for _ in range(10):
+        sio_b.emit('plan:activity:voted', {'plan_id': str(plan.id)}, room=f"plan:{plan.id}")
+        time.sleep(0.2)
+        received = client.received('plan:activity:voted')
+        if received:
+            break
+    client.sio.disconnect()
+
+    assert received and received[0] == {'plan_id': str(plan.id)}
+
+def test_presence_counts_users_across_workers(app, workers):
+    from app.sockets import presence
+
+    (_, url_a), (_, url_b) = workers
+    organizer, member = make_users(2)
+    plan = make_plan(organizer, [member])
+    client_a = _join(app, url_a, organizer, plan, 1)
+    client_b = _join(app, url_b, member, plan, 2)
+
+    # Worker B's broadcast reaches the socket held by worker A
+    assert client_a.wait_for('plan:users', until=lambda data: data == {'msg': 2})
+    assert presence.count(plan.id) == 2
+    client_b.sio.disconnect()
+    assert client_a.wait_for('plan:users', until=lambda data: data == {'msg': 1})
+    client_a.sio.disconnect()
+
+def test_evicted_user_leaves_the_room_on_every_worker(app, workers):
+    from app.extensions import socketio
+    from app.sockets import presence, socket as handlers
+
+    (_, url_a), (_, url_b) = workers
+    organizer, member = make_users(2)
+    plan = make_plan(organizer, [member])
+    plan_id = str(plan.id)
+    staying = _join(app, url_a, organizer, plan, 1)
+    removed = _join(app, url_b, member, plan, 2)
+
+    # Worker A evicts a socket held by worker B
+    handlers.evict_user(plan_id, member.id)
+
+    assert removed.wait_for('plan:removed') == [{'plan_id': plan_id}]
+    assert staying.wait_for('plan:users', until=lambda data: data == {'msg': 1})
+    assert presence.sids(plan_id, member.id) == []
+    presence.refresh_local()
+    assert presence.count(plan_id) == 1
+
+    socketio.emit('plan:activity:voted', {'plan_id': plan_id}, room=f"plan:{plan_id}")
+    assert staying.wait_for('plan:activity:voted')
+    assert removed.received('plan:activity:voted') == []
+    removed.sio.disconnect()
+    staying.sio.disconnect()
+
+def test_heartbeat_rejoins_members_and_drops_removed_users(app, workers):
+    from app.models.plan import Plan
+    from app.services import membership_cache
+    from app.sockets import presence
+
+    _, (_, url_b) = workers
+    organizer, member = make_users(2)
+    plan = make_plan(organizer, [member])
+    plan_id = str(plan.id)
+    host = _join(app, url_b, organizer, plan, 1)
+    guest = _join(app, url_b, member, plan, 2)
+
+    # Both entries aged out, e.g. while Redis was unreachable
+    presence.cache.delete(presence._key(plan_id))
+    host.sio.emit('plan:heartbeat', {})
+    deadline = time.monotonic() + 5
+    while presence.count(plan_id) != 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert presence.sids(plan_id, organizer.id) == [host.sio.sid]
+
+    # Removed while its socket missed the eviction
+    Plan.objects(id=plan.id).update(pull__participants=member.id)
+    membership_cache.invalidate(plan.id)
+    guest.sio.emit('plan:heartbeat', {})
+    assert guest.wait_for('plan:removed') == [{'plan_id': plan_id}]
+    assert presence.sids(plan_id, member.id) == []
+    host.sio.disconnect()
+    guest.sio.disconnect()
+
+def test_refresh_keeps_idle_connections_present(redis_cache):
+    from bson import ObjectId
+    from app.sockets import presence
+
+    plan_id = str(ObjectId())
+    presence.join(plan_id, 'u1', 'sid-1')
+    # As if nothing refreshed the connection for longer than the TTL
+    presence.cache.zadd(presence._key(plan_id), {presence._member('u1', 'sid-1'): time.time() - 1})
+
+    assert presence.refresh_local() >= 1
+    assert presence.count(plan_id) == 1
+    presence.leave(plan_id, 'u1', 'sid-1')
@@ -0,0 +1,30 @@
+from tests.conftest import make_users, make_plan
+
+def test_user_writes_change_the_user_etag(mongo):
+    from app.services import plan_service, user_service
+
+    organizer, member = make_users(2)
+    etag = user_service.get_user_etag(organizer.id)
+
+    plan = plan_service.create_plan({'name': 'Trip', 'type': 'trip'}, user_service.get_user(organizer.id))
+    assert user_service.get_user_etag(organizer.id) != etag
+    assert user_service.get_user(organizer.id).hosting_count == 1
+
+    etag = user_service.get_user_etag(member.id)
+    user_service.add_mutuals(plan, member)
+    assert user_service.get_user_etag(member.id) != etag
+
+    etag = user_service.get_user_etag(member.id)
+    user_service.update_user(user_service.get_user(member.id), {'bio': 'Hello'})
+    assert user_service.get_user_etag(member.id) != etag
+
+def test_profile_change_moves_mutuals_etags(mongo):
+    from app.services import user_service
+
+    organizer, member = make_users(2)
+    plan = make_plan(organizer, [])
+    user_service.add_mutuals(plan, member)
+
+    etag = user_service.get_user_etag(organizer.id)
+    user_service.update_user(user_service.get_user(member.id), {'name': 'Renamed'})
+    assert user_service.get_user_etag(organizer.id) != etag